@@ -4,22 +4,50 @@
 import os
 import sys
 import time
+import io
+import csv
 import json
-import queue
+import uuid
+import mmap
+import struct
+import bisect
+import sqlite3
+import random
+import shutil
+import tempfile
+import gc
+import argparse
 import threading
 import asyncio
 import subprocess
-from collections import deque
-
-import dbus
-import dbus.exceptions
-import dbus.mainloop.glib
-import dbus.service
-from gi.repository import GLib
-
-from bleak import BleakClient, BleakScanner
-
-from flask import Flask, Response, request, jsonify, render_template_string, make_response
+import itertools
+import datetime
+import http.client
+import html as htmllib
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+
+# BlueZ / GLib / bleak nur für den echten Proxy; ohne sie laufen Loopback, Benchmarks und Offline-Tools
+try:
+    import dbus
+    import dbus.exceptions
+    import dbus.mainloop.glib
+    import dbus.service
+except ImportError:
+    dbus = None
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
+try:
+    from bleak import BleakClient, BleakScanner
+except ImportError:
+    BleakClient = BleakScanner = None
+# NumPy nur für "analyze"
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # =========================
@@ -41,15 +69,80 @@ CHAR_NOTIFY_UUID    = "442f1571-8a00-9a28-cbe1-e1d4212d53eb"  # notify from boar
 CHAR_WRITE_UUID     = "442f1572-8a00-9a28-cbe1-e1d4212d53eb"  # write to board
 
 REAL_NOTIFY_BUFFER_MAX = 300
+REASSEMBLY_MAX_PARTIAL = 256    # Bytes ohne '@' im Reassembler -> danach als Garbage verworfen
+
+# Handshake-Replay (gepufferte Board-Frames nach StartNotify an die App), timer-getrieben
+HANDSHAKE_PLATFORM = "ios"                           # "ios" | "android" (per /api/handshake umstellbar)
+HANDSHAKE_PACING_MS = {"ios": 20, "android": 5}      # iOS verwirft Bursts wenn zu schnell
+HANDSHAKE_MAX_AGE_SEC = 0                            # > 0: ältere gepufferte Frames werden verworfen
+EVENT_RING_SIZE = 4096          # SSE Ring-Buffer (Events für Reconnect / langsame Tabs)
+SSE_BATCH_MS = 30               # Events innerhalb dieses Fensters -> eine SSE-Message (Array); 0 = einzeln
+
+# Runtime: "auto" = GLib und asyncio in EINEM Loop, wenn PyGObject >= 3.50 (gi.events) vorhanden,
+# sonst "threaded" (asyncio-Thread + GLib.idle_add Bridge wie früher)
+RUNTIME_MODE = "auto"            # "auto" | "integrated" | "threaded"
+
+# Forward-first: Frame zuerst an die Gegenseite, Beobachtung (Terminal/LogStore/UI) danach im Writer-Thread
+FORWARD_FIRST = True
 UPSTREAM_CONNECT_TIMEOUT = 20
 UPSTREAM_RETRY_SEC = 3
+UPSTREAM_COALESCE = True        # statische Frames (Ring-Palette, Settings): nur der neueste wartende wird gesendet
+UPSTREAM_BATCH_MAX = 512        # max. Frames pro /api/send_to_board_batch
+
+# Write Flow Control (AIMD): ungebremst, bis der Link Stau zeigt (Write-Fehler, gatt_write langsam,
+# Probe-RTT steigt). Dann Rate = FLOW_MD x gemessene Rate, je FLOW_HOLD_MS ohne Stau +FLOW_AI_FPS,
+# ab FLOW_UNCAP_FPS wieder ungebremst. Fehler bei bestehender Verbindung: Retry statt Reconnect.
+UPSTREAM_FLOW_CONTROL = True
+FLOW_MIN_FPS = 5.0
+FLOW_UNCAP_FPS = 1000.0
+FLOW_AI_FPS = 5.0               # pro FLOW_HOLD_MS ohne Stau (= 25 fps/s)
+FLOW_MD = 0.5
+FLOW_LATENCY_MS = 30.0          # gatt_write (ohne Response) länger -> Puffer in BlueZ/Controller voll
+FLOW_HOLD_MS = 200              # ein Stau = eine Drosselung
+FLOW_ERROR_RATE = 0.1           # Anteil fehlgeschlagener Writes (EWMA) ab dem gedrosselt wird; einzelne Fehler nur Retry
+FLOW_RETRIES = 3                # pro Frame, Backoff FLOW_RETRY_MS x 2^n, danach verworfen
+FLOW_RETRY_MS = 20
+FLOW_PROBE_EVERY = 0            # jeder n-te Write mit Response (misst Link-RTT), 0 = aus
+FLOW_PROBE_SLOW = 3.0           # Probe-RTT > x * bestes RTT -> Stau
+
+# Loopback (virtuelles GranBoard im Prozess, ohne Bluetooth): "loopback" / "bench-e2e" Kommando
+LOOPBACK_HIT_HZ = 2.0           # Treffer pro Sekunde (0 = keine)
+LOOPBACK_WRITE_MS = 0.0         # simulierte Dauer eines GATT Writes (z.B. 7.5 = ein Connection Interval)
+LOOPBACK_ACK = b"write OK@"     # Antwort des virtuellen Boards auf jeden Write (b"" = keine)
+LOOPBACK_LINK_FPS = 0.0         # simulierter Link-Durchsatz (0 = unbegrenzt), darüber läuft der Puffer voll
+LOOPBACK_LINK_BUFFER = 8        # Frames im simulierten Controller-Puffer, voll -> Write-Fehler
 
 # Web/UI
 WEB_HOST = "0.0.0.0"
 WEB_PORT = 8787
 
 DATA_DIR = os.path.expanduser("~/gb_mitm")
-LOG_DB_PATH = os.path.join(DATA_DIR, "mitm_log.json")
+LOG_DB_PATH = os.path.join(DATA_DIR, "mitm_log.json")   # altes Format (nur noch Import / LOG_JOURNAL=False)
+
+# Append-only Journal (ein Record pro Frame, rotierende Segmente)
+LOG_JOURNAL = True
+LOG_JOURNAL_DIR = os.path.join(DATA_DIR, "journal")
+LOG_SEGMENT_MAX_BYTES = 2 * 1024 * 1024      # danach neues Segment
+LOG_COMPACT_AFTER_SEGMENTS = 8               # ab so vielen geschlossenen Segmenten kompaktieren
+LOG_JOURNAL_KEEP_RECORDS = 200000            # so viele Frames bleiben nach dem Kompaktieren auf Disk
+
+# SQLite statt Journal (WAL, Indizes auf Zeit/Richtung/Art/Target, Volltextsuche) – für /api/log Abfragen
+LOG_SQLITE = False
+LOG_SQLITE_PATH = os.path.join(DATA_DIR, "mitm_log.sqlite")
+LOG_PAGE_MAX = 50000            # /api/log: max. Einträge pro Anfrage
+LOG_PAGE_CHUNK = 500            # größere Seiten werden in Stücken (Keyset) gestreamt
+
+# Binärer Capture (ungekürzt, eine Datei pro Lauf): .gbc Records + .gbi Offset-Index (mmap) + .gbn Kommentare
+LOG_CAPTURE = True
+CAPTURE_DIR = os.path.join(DATA_DIR, "capture")
+CAPTURE_READERS_MAX = 4         # offene CaptureReader der Web-Routen (je 2 fds + mmaps), LRU
+
+# Persistenz-Stage: Hot Path (BLE/D-Bus) legt nur in die Queue, Writer-Thread schreibt gebündelt
+LOG_QUEUE_MAX = 20000                        # volle Queue -> Record wird verworfen (gezählt)
+LOG_FLUSH_MS = 50                            # spätestens alle N ms schreiben
+LOG_FLUSH_RECORDS = 256                      # oder sobald N Records warten
+LOG_FSYNC = "interval"                       # "off" | "batch" (nach jedem Batch) | "interval"
+LOG_FSYNC_INTERVAL_SEC = 2.0
 
 # Auto Bluetooth Reset (du wolltest restart bluetooth + hci0 up automatisiert)
 AUTO_BT_RESET_ON_START = True
@@ -81,6 +174,95 @@ def ascii_vis(b: bytes) -> str:
 def now_ms():
     return int(time.time() * 1000)
 
+class LatencyHistogram:
+    """
+    Log-lineare Latenz-Buckets in ns (8 Sub-Buckets pro Zweierpotenz, ~12% Auflösung).
+    add() ist O(1) und ohne Lock (ein Writer pro Stage), Perzentile werden erst beim Snapshot berechnet.
+    """
+    SUB = 8
+    NBUCKETS = 16 + 40 * 8
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.NBUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @classmethod
+    def _index(cls, ns: int) -> int:
+        if ns < 16:
+            return max(ns, 0)
+        e = ns.bit_length() - 4
+        return min(16 + (e - 1) * cls.SUB + ((ns >> e) & 7), cls.NBUCKETS - 1)
+
+    @classmethod
+    def _upper(cls, idx: int) -> int:
+        if idx < 16:
+            return idx
+        e = (idx - 16) // cls.SUB + 1
+        sub = (idx - 16) % cls.SUB
+        return ((cls.SUB + sub + 1) << e) - 1
+
+    def add(self, ns: int):
+        self.counts[self._index(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p: float) -> int:
+        if not self.count:
+            return 0
+        rank = p / 100.0 * self.count
+        acc = 0
+        for idx, c in enumerate(self.counts):
+            acc += c
+            if c and acc >= rank:
+                return min(self._upper(idx), self.max_ns)
+        return self.max_ns
+
+    def snapshot(self) -> dict:
+        us = lambda ns: round(ns / 1000.0, 1)
+        return {
+            "count": self.count,
+            "avg_us": us(self.total_ns / self.count) if self.count else 0,
+            "p50_us": us(self.percentile(50)),
+            "p95_us": us(self.percentile(95)),
+            "p99_us": us(self.percentile(99)),
+            "max_us": us(self.max_ns),
+        }
+
+
+class StageMetrics:
+    """Latenz-Histogramme pro Richtung und Stage (monotonic ns, Stages in fester Reihenfolge)."""
+    STAGES = {
+        "board->app": ["rx->forwarded", "rx->logged", "rx->idle", "idle->notified", "rx->notified"],
+        "app->board": ["rx->forwarded", "rx->logged", "rx->dequeued", "gatt_write", "rx->written"],
+    }
+
+    def __init__(self):
+        self.hists = {d: {st: LatencyHistogram() for st in stages} for d, stages in self.STAGES.items()}
+        self.started = time.time()
+
+    def record(self, direction: str, stage: str, ns: int):
+        self.hists[direction][stage].add(ns)
+
+    def since(self, direction: str, stage: str, t0_ns: int):
+        if t0_ns:
+            self.hists[direction][stage].add(time.monotonic_ns() - t0_ns)
+
+    def reset(self):
+        for stages in self.hists.values():
+            for h in stages.values():
+                h.reset()
+        self.started = time.time()
+
+    def snapshot(self) -> dict:
+        return {d: {st: h.snapshot() for st, h in stages.items()} for d, stages in self.hists.items()}
+
 def ensure_data_dir():
     os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -104,6 +286,246 @@ def bluetooth_reset_exit():
     # run_cmd(["systemctl", "restart", "bluetooth"])
 
 
+# =========================
+# Protocol decoder (Board <-> App Frames)
+# =========================
+# Alles als vorberechnete Tabellen: Klassifizierung pro Frame ist ein Dict-/Array-Lookup.
+# Quelle: RAW_TO_TARGET (Userscript), LED Control HTML, README Board Settings.
+
+# Hit-Codes (Board -> App), Reihenfolge SO, SI, D, T je Segment 1..20
+HIT_CODES = {
+    1:  ("2.5@", "2.3@", "2.6@", "2.4@"),    2:  ("9.2@", "9.1@", "8.2@", "9.0@"),
+    3:  ("7.2@", "7.1@", "8.4@", "7.0@"),    4:  ("0.5@", "0.1@", "0.6@", "0.3@"),
+    5:  ("5.4@", "5.1@", "4.6@", "5.2@"),    6:  ("1.3@", "1.0@", "4.4@", "1.1@"),
+    7:  ("11.4@", "11.1@", "8.6@", "11.2@"), 8:  ("6.5@", "6.2@", "6.6@", "6.4@"),
+    9:  ("9.5@", "9.3@", "9.6@", "9.4@"),    10: ("2.2@", "2.0@", "4.3@", "2.1@"),
+    11: ("7.5@", "7.3@", "7.6@", "7.4@"),    12: ("5.5@", "5.0@", "5.6@", "5.3@"),
+    13: ("0.4@", "0.0@", "4.5@", "0.2@"),    14: ("10.5@", "10.3@", "10.6@", "10.4@"),
+    15: ("3.2@", "3.0@", "4.2@", "3.1@"),    16: ("11.5@", "11.0@", "11.6@", "11.3@"),
+    17: ("10.2@", "10.1@", "8.3@", "10.0@"), 18: ("1.5@", "1.2@", "1.6@", "1.4@"),
+    19: ("6.3@", "6.1@", "8.5@", "6.0@"),    20: ("3.5@", "3.3@", "3.6@", "3.4@"),
+}
+HIT_SCORE_MULT = {"SO": 1, "SI": 1, "D": 2, "T": 3}
+
+def _build_hit_table():
+    table = {}
+    for n, codes in HIT_CODES.items():
+        for ring, raw in zip(("SO", "SI", "D", "T"), codes):
+            table[raw.encode("ascii")] = {"type": "hit", "ring": ring, "n": n, "target": f"{ring}{n}",
+                                          "score": n * HIT_SCORE_MULT[ring], "label": f"HIT {ring}{n}"}
+    table[b"8.0@"] = {"type": "hit", "ring": "SBULL", "n": 25, "target": "SBULL", "score": 25, "label": "HIT SBULL"}
+    table[b"4.0@"] = {"type": "hit", "ring": "DBULL", "n": 50, "target": "DBULL", "score": 50, "label": "HIT DBULL"}
+    table[b"OUT@"] = {"type": "out", "label": "OUT (miss)"}
+    table[b"BTN@"] = {"type": "button", "label": "BTN (next)"}
+    return table
+
+HIT_TABLE = _build_hit_table()
+TARGET_TO_RAW = {d["target"]: raw for raw, d in HIT_TABLE.items() if d["type"] == "hit"}
+BOARD_CONNECT_PREFIX = b"GB8;102"
+
+# LED 16-Byte OP Frames (App -> Board): [0] OP, [1..3] Color A, [4..6] Color B/Param,
+# [10..11] Target-ID (LE), [12] Speed, [15] meist 01
+LED_OPS = {
+    0x01: "Hit Single", 0x02: "Hit Double", 0x03: "Hit Triple",
+    0x0C: "Touch Rainbow", 0x0D: "Event 0D", 0x0F: "Rainbow Rotate", 0x10: "Split Rainbow",
+    0x11: "Next", 0x14: "Pulse", 0x15: "Dark Solid", 0x16: "Color Cycle", 0x17: "Flash/Blink",
+    0x18: "Flicker", 0x19: "Hunt Flicker", 0x1B: "Shake", 0x1D: "Fade/Sweep (Connect)",
+    0x1F: "Bull Multicolor Fade",
+}
+LED_OP_NAMES = [LED_OPS.get(i) for i in range(256)]
+LED_HIT_TYPES = {0x01: "single", 0x02: "double", 0x03: "triple"}
+
+# Target-ID (Bytes 10..11) <-> Segment
+SEG_TO_TARGET_ID = {
+    1: 0x001C, 2: 0x0031, 3: 0x0037, 4: 0x0022, 5: 0x0016, 6: 0x0028, 7: 0x0001, 8: 0x0007,
+    9: 0x0010, 10: 0x002B, 11: 0x000A, 12: 0x0013, 13: 0x0025, 14: 0x000D, 15: 0x002E,
+    16: 0x0004, 17: 0x0034, 18: 0x001F, 19: 0x003A, 20: 0x0019,
+}
+TARGET_ID_TO_SEG = {tid: seg for seg, tid in SEG_TO_TARGET_ID.items()}
+
+# Ring-Palette (20 Bytes, ein Code pro Segment S1..S20)
+PALETTE = ("OFF", "Rot", "Orange", "Gelb", "Hellgrün", "Türkis", "Lila", "Weiß")
+PALETTE_NAMES = [PALETTE[i] if i < len(PALETTE) else f"?{i:02X}" for i in range(256)]
+
+# 12-Byte Settings (Ende = ASCII "45" / "67" / ":;")
+SETTINGS_TAILS = {b"\x34\x35": "reply_interval", b"\x36\x37": "out_sensitivity", b"\x3A\x3B": "target_set"}
+TARGET_SETS = {
+    bytes.fromhex("0000004B0405000000003A3B"): "SET1",
+    bytes.fromhex("000000730205000000003A3B"): "SET2",
+    bytes.fromhex("000000960205000000003A3B"): "SET3",
+    bytes.fromhex("00000096000A000000003A3B"): "SET4",
+}
+
+_UNKNOWN = {"type": "unknown", "label": ""}
+
+def _rgb(b: bytes) -> str:
+    return "#%02X%02X%02X" % (b[0], b[1], b[2])
+
+def decode_frame(direction: str, payload: bytes) -> dict:
+    """
+    Klassifiziert einen Frame und liefert die dekodierten Felder.
+    Board->App Treffer sind vorberechnete (geteilte) Dicts – nicht verändern.
+    """
+    if not isinstance(payload, bytes):
+        payload = bytes(payload)
+    n = len(payload)
+    if direction == "board->app":
+        d = HIT_TABLE.get(payload)
+        if d is not None:
+            return d
+        if payload.startswith(BOARD_CONNECT_PREFIX):
+            rest = payload[len(BOARD_CONNECT_PREFIX):]
+            d = HIT_TABLE.get(rest)
+            return {"type": "connect", "label": "CONNECT" + (f" + {d['label']}" if d else "")}
+        if b"write ok" in payload.lower():
+            return {"type": "ack", "label": "write OK"}
+        return _UNKNOWN
+
+    if n == 16:
+        op = payload[0]
+        tid = payload[10] | (payload[11] << 8)
+        d = {
+            "type": "led",
+            "op": op,
+            "op_name": LED_OP_NAMES[op],
+            "color_a": _rgb(payload[1:4]),
+            "color_b": _rgb(payload[4:7]),
+            "target_id": tid,
+            "speed": payload[12],
+        }
+        hit = LED_HIT_TYPES.get(op)
+        if hit:
+            d["hit_type"] = hit
+            d["segment"] = TARGET_ID_TO_SEG.get(tid)
+            d["label"] = f"LED OP{op:02X} hit {hit} S{d['segment'] or '?'} speed={d['speed']}"
+        else:
+            d["label"] = f"LED OP{op:02X} {d['op_name'] or '?'} speed={d['speed']}"
+        return d
+
+    if n == 20:
+        lit = [f"S{i + 1}:{PALETTE_NAMES[c]}" for i, c in enumerate(payload) if c]
+        return {"type": "ring", "palette": list(payload),
+                "label": "RING " + (" ".join(lit) if lit else "off")}
+
+    if n == 12:
+        setting = SETTINGS_TAILS.get(payload[10:12])
+        if setting == "target_set":
+            name = TARGET_SETS.get(payload)
+            return {"type": "settings", "setting": setting, "set": name, "label": f"TARGET {name or 'SET?'}"}
+        if setting:
+            return {"type": "settings", "setting": setting, "value": payload[0],
+                    "label": f"{setting} = {payload[0]}"}
+
+    return _UNKNOWN
+
+
+class FrameReassembler:
+    """
+    Setzt '@'-terminierte Board-Frames aus beliebig fragmentierten Notifies zusammen.
+    Offset-Cursor statt Neu-Slicen des Rests nach jedem Frame; ein Notify, das genau ein
+    Frame ist (Normalfall), geht unverändert an emit(). Nur ein unvollständiger Rest
+    (<= max_partial) wird gehalten und einmal mit dem nächsten Chunk zusammengeführt.
+    Nicht thread-safe (läuft im Writer-Thread).
+    """
+
+    DELIM = b"@"
+
+    def __init__(self, max_partial: int = REASSEMBLY_MAX_PARTIAL):
+        self.max_partial = max_partial
+        self.tail = b""
+        self.chunks = 0
+        self.frames = 0
+        self.bytes = 0
+        self.split_frames = 0       # Frames, die über mehr als einen Chunk verteilt waren
+        self.partial_chunks = 0     # Chunks, nach denen ein unvollständiger Rest übrig blieb
+        self.garbage_bytes = 0      # verworfen (Rest > max_partial ohne '@')
+        self.max_pending = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self.tail)
+
+    def _keep(self, rest: bytes):
+        n = len(rest)
+        if n > self.max_partial:
+            self.garbage_bytes += n
+            self.tail = b""
+            return
+        self.tail = rest
+        self.partial_chunks += 1
+        if n > self.max_pending:
+            self.max_pending = n
+
+    def feed(self, chunk, emit) -> int:
+        if not isinstance(chunk, bytes):
+            chunk = bytes(chunk)
+        self.chunks += 1
+        self.bytes += len(chunk)
+
+        tail = self.tail
+        if tail:
+            data = tail + chunk  # einzige Kopie: offener Rest + neuer Chunk
+            idx = data.find(self.DELIM, len(tail))
+        else:
+            data = chunk
+            idx = data.find(self.DELIM)
+        if idx < 0:
+            self._keep(data)
+            return 0
+        if tail:
+            self.split_frames += 1
+
+        end = len(data)
+        if idx == end - 1:
+            # genau ein Frame (Rest enthält nie '@')
+            self.tail = b""
+            self.frames += 1
+            emit(data)
+            return 1
+
+        find = data.find
+        delim = self.DELIM
+        start = 0
+        n = 0
+        while idx >= 0:
+            emit(data[start:idx + 1])
+            n += 1
+            start = idx + 1
+            idx = find(delim, start)
+        self.frames += n
+        if start < end:
+            self._keep(data[start:])
+        else:
+            self.tail = b""
+        return n
+
+    def reset(self):
+        self.tail = b""
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "pending": len(self.tail),
+            "split_frames": self.split_frames,
+            "partial_chunks": self.partial_chunks,
+            "garbage_bytes": self.garbage_bytes,
+            "max_pending": self.max_pending,
+        }
+
+
+def decode_board_chunk(reassembler: FrameReassembler, payload, done: list) -> dict:
+    # Notify != Frame: Chunk in den Reassembler, dekodiert wird was dadurch komplett wurde
+    done.clear()
+    reassembler.feed(payload, lambda f: done.append(decode_frame("board->app", f)))
+    if not done:
+        return {"type": "partial", "pending": reassembler.pending, "label": f"(partial, {reassembler.pending} B)"}
+    if len(done) == 1:
+        return done[0]
+    return {"type": "multi", "frames": list(done), "label": " | ".join(d["label"] for d in done)}
+
+
 # =========================
 # BlueZ DBus constants
 # =========================
@@ -126,13 +548,41 @@ BASE = f"/com/gb/mitm/{PID}"  # unique per run
 # =========================
 # LOG STORE (persist comments)
 # =========================
+def log_entry(entry_id: str, t: float, direction: str, kind: str, payload: bytes, dec: dict, comment: str = "") -> dict:
+    return {
+        "id": entry_id,
+        "t": time.strftime("%H:%M:%S", time.localtime(t)),
+        "ms": int(t * 1000),
+        "dir": direction,     # "app->board" / "board->app"
+        "kind": kind,         # "ble" / "manual" / "import" / ...
+        "hex": hx(payload),
+        "ascii": ascii_vis(payload),
+        "dec": dec,
+        "comment": comment or "",
+    }
+
+
 class LogStore:
+    # Jeder Eintrag bekommt beim Speichern eine fortlaufende "seq" (bleibt über Neustarts erhalten)
+    # -> Keyset-Paging (before/after) und Delta-Abruf nach Reconnect.
     def __init__(self, path: str, max_items: int = 4000):
         self.path = path
         self.max_items = max_items
         self.lock = threading.Lock()
         self.items = []
+        self.seq = 0
         self._load()
+        for it in self.items:
+            self._stamp(it)
+
+    def _stamp(self, entry: dict):
+        # seq vergeben (neu) bzw. übernehmen (geladen)
+        seq = entry.get("seq")
+        if seq is None:
+            self.seq += 1
+            entry["seq"] = self.seq
+        elif seq > self.seq:
+            self.seq = seq
 
     def _load(self):
         try:
@@ -154,16 +604,70 @@ class LogStore:
             log(f"⚠️ LogStore save failed: {e}")
 
     def add(self, entry: dict):
+        self.add_many([entry])
+
+    def add_many(self, entries):
         with self.lock:
-            self.items.append(entry)
+            for e in entries:
+                self._stamp(e)
+            self.items.extend(entries)
             if len(self.items) > self.max_items:
                 self.items = self.items[-self.max_items:]
             self._save()
 
+    def sync(self):
+        # _save() ersetzt die Datei atomar, nichts offen zu halten
+        pass
+
     def list(self, limit: int = 800):
         with self.lock:
             return self.items[-limit:]
 
+    def get(self, entry_id: str):
+        with self.lock:
+            for it in self.items:
+                if it.get("id") == entry_id:
+                    return it
+        return None
+
+    def query(self, since_ms: int = None, until_ms: int = None, direction: str = None, kind: str = None,
+              text: str = None, target: str = None, limit: int = 200, before: int = None, after: int = None):
+        """
+        Gefilterte Seite, aufsteigend nach seq (Keyset statt Offset):
+        after=X  -> die ersten `limit` Treffer mit seq > X (Delta / vorwärts blättern)
+        sonst    -> die letzten `limit` Treffer mit seq < before (bzw. die neuesten)
+        Hier linear über die In-Memory-Einträge.
+        """
+        text = (text or "").lower()
+        out = []
+        with self.lock:
+            items = list(self.items)
+        if after is not None:
+            scan = (it for it in items if it.get("seq", 0) > after)
+        else:
+            scan = (it for it in reversed(items) if before is None or it.get("seq", 0) < before)
+        for it in scan:
+            ms = it.get("ms") or 0
+            if since_ms is not None and ms < since_ms:
+                continue
+            if until_ms is not None and ms > until_ms:
+                continue
+            if direction and it.get("dir") != direction:
+                continue
+            if kind and it.get("kind") != kind:
+                continue
+            if target and (it.get("dec") or {}).get("target") != target:
+                continue
+            if text and text not in " ".join((it.get("hex", ""), it.get("ascii", ""), it.get("comment", ""),
+                                              (it.get("dec") or {}).get("label", ""))).lower():
+                continue
+            out.append(it)
+            if len(out) >= limit:
+                break
+        if after is None:
+            out.reverse()
+        return out
+
     def set_comment(self, entry_id: str, comment: str):
         with self.lock:
             for it in self.items:
@@ -174,169 +678,1924 @@ class LogStore:
         return False
 
 
-# =========================
-# Event fanout (SSE)
-# =========================
-class EventHub:
-    def __init__(self):
-        self.clients = []
+class JournalLogStore(LogStore):
+    """
+    Append-only Journal statt Komplett-Rewrite:
+    - add() hängt genau eine JSON-Zeile an das aktive Segment (O(1), egal wie groß das Log ist)
+    - Kommentare werden als eigener Record {"op":"comment",...} angehängt
+    - beim Start wird die In-Memory-Ansicht (letzte max_items) aus allen Segmenten aufgebaut
+    - geschlossene Segmente werden im Hintergrund zusammengefasst (Kommentare eingefaltet, alte Frames verworfen);
+      das Ergebnis beginnt mit {"op":"compacted","first":N}: bleiben nach einem Crash die Eingaben N..
+      liegen, werden sie beim nächsten Start verworfen statt doppelt geladen
+    """
+    SEG_PREFIX = "seg-"
+    SEG_SUFFIX = ".jsonl"
+
+    def __init__(self, journal_dir: str, max_items: int = 4000,
+                 segment_max_bytes: int = LOG_SEGMENT_MAX_BYTES,
+                 compact_after: int = LOG_COMPACT_AFTER_SEGMENTS,
+                 keep_records: int = LOG_JOURNAL_KEEP_RECORDS,
+                 legacy_path: str = None):
+        self.path = journal_dir
+        self.max_items = max_items
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_after = compact_after
+        self.keep_records = keep_records
         self.lock = threading.Lock()
-
-    def subscribe(self):
-        q = queue.Queue(maxsize=300)
+        self.items = deque()
+        self.by_id = {}
+        self.seq = 0
+
+        self._fh = None
+        self._seg_no = 0
+        self._seg_bytes = 0
+        self._compacting = False
+
+        os.makedirs(self.path, exist_ok=True)
+        if legacy_path and not self._segments():
+            self._import_legacy(legacy_path)
+        self._load()
+        self._open_segment(self._seg_no + 1)
         with self.lock:
-            self.clients.append(q)
-        return q
+            self._maybe_compact()
 
-    def unsubscribe(self, q):
-        with self.lock:
+    # ---- segments ----
+    def _seg_path(self, no: int) -> str:
+        return os.path.join(self.path, f"{self.SEG_PREFIX}{no:06d}{self.SEG_SUFFIX}")
+
+    def _segments(self):
+        return self.list_segments(self.path)
+
+    @classmethod
+    def list_segments(cls, journal_dir: str):
+        out = []
+        for name in os.listdir(journal_dir):
+            if name.startswith(cls.SEG_PREFIX) and name.endswith(cls.SEG_SUFFIX):
+                try:
+                    out.append((int(name[len(cls.SEG_PREFIX):-len(cls.SEG_SUFFIX)]), os.path.join(journal_dir, name)))
+                except ValueError:
+                    pass
+        out.sort()
+        return out
+
+    @classmethod
+    def stale_segments(cls, segments) -> set:
+        """Segmente, die ein späteres Kompaktat schon enthält (Crash zwischen os.replace und Löschen)."""
+        stale = set()
+        for no, path in segments:
             try:
-                self.clients.remove(q)
-            except ValueError:
+                with open(path, "r", encoding="utf-8") as f:
+                    first = json.loads(f.readline() or "{}")
+            except (OSError, ValueError):
+                continue
+            if first.get("op") == "compacted":
+                stale.update(n for n, _p in segments if first.get("first", no) <= n < no)
+        return stale
+
+    def _open_segment(self, no: int):
+        if self._fh:
+            try:
+                self._fh.close()
+            except Exception:
                 pass
+        self._seg_no = no
+        path = self._seg_path(no)
+        self._fh = open(path, "a", encoding="utf-8")
+        self._seg_bytes = self._fh.tell()
+
+    @staticmethod
+    def _read_records(path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue   # abgebrochene letzte Zeile (Crash/Stromausfall)
+
+    @classmethod
+    def _fold_records(cls, paths, keep: int = None) -> deque:
+        """
+        Records aller Segmente in Reihenfolge, Kommentare eingefaltet (die letzten keep).
+        Nicht nach id deduplizieren: ältere Journale haben ids mit Kollisionen innerhalb einer ms,
+        ein Kommentar landet wie in _apply() beim letzten Frame mit dieser id.
+        """
+        out = deque(maxlen=keep)
+        last = {}
+        for path in paths:
+            for rec in cls._read_records(path):
+                op = rec.get("op")
+                if op == "comment":
+                    it = last.get(rec.get("id"))
+                    if it is not None:
+                        it["comment"] = rec.get("comment", "")
+                elif op is None:
+                    if len(out) == out.maxlen and last.get(out[0].get("id")) is out[0]:
+                        del last[out[0].get("id")]
+                    out.append(rec)
+                    last[rec.get("id")] = rec
+        return out
+
+    def _import_legacy(self, legacy_path: str):
+        try:
+            if not os.path.exists(legacy_path):
+                return
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            if not isinstance(items, list) or not items:
+                return
+            with open(self._seg_path(1), "w", encoding="utf-8") as f:
+                for it in items:
+                    f.write(json.dumps(it, ensure_ascii=False, separators=(",", ":")) + "\n")
+            log(f"📦 Imported {len(items)} entries from {legacy_path} into journal")
+        except Exception as e:
+            log(f"⚠️ Legacy log import failed: {e}")
+
+    # ---- in-memory view ----
+    def _remember(self, entry: dict):
+        self._stamp(entry)
+        if len(self.items) >= self.max_items:
+            old = self.items.popleft()
+            self.by_id.pop(old.get("id"), None)
+        self.items.append(entry)
+        self.by_id[entry.get("id")] = entry
+
+    def _apply(self, rec: dict, seen: set):
+        op = rec.get("op")
+        if op == "comment":
+            it = self.by_id.get(rec.get("id"))
+            if it is not None:
+                it["comment"] = rec.get("comment", "")
+        elif op is None:
+            # derselbe Record doppelt (id + seq); kollidierende ids älterer Journale haben verschiedene seq
+            key = (rec.get("id"), rec.get("seq"))
+            if key[1] is not None:
+                if key in seen:
+                    return
+                seen.add(key)
+            self._remember(rec)
 
-    def publish(self, event: dict):
+    def _load(self):
+        segments = self._segments()
+        stale = self.stale_segments(segments)
+        seen = set()
+        for no, path in segments:
+            self._seg_no = max(self._seg_no, no)
+            if no in stale:
+                log(f"🗜️ Journal segment {path} already compacted, removing")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                for rec in self._read_records(path):
+                    self._apply(rec, seen)
+            except Exception as e:
+                log(f"⚠️ Journal segment {path} unreadable: {e}")
+
+    def _append(self, rec: dict):
+        self._write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _write(self, data: str):
+        try:
+            self._fh.write(data)
+            self._fh.flush()
+            self._seg_bytes += len(data)
+        except Exception as e:
+            log(f"⚠️ Journal append failed: {e}")
+            return
+        if self._seg_bytes >= self.segment_max_bytes:
+            self._open_segment(self._seg_no + 1)
+            self._maybe_compact()
+
+    # ---- LogStore API ----
+    def add(self, entry: dict):
+        with self.lock:
+            self._remember(entry)
+            self._append(entry)
+
+    def add_many(self, entries):
+        # ein write()+flush() für den ganzen Batch (Group Commit); _remember vergibt seq vor dem Schreiben
+        with self.lock:
+            for e in entries:
+                self._remember(e)
+            self._write("".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in entries))
+
+    def sync(self):
         with self.lock:
-            dead = []
-            for q in self.clients:
+            if self._fh:
                 try:
-                    q.put_nowait(event)
-                except Exception:
-                    dead.append(q)
-            for q in dead:
+                    os.fsync(self._fh.fileno())
+                except Exception as e:
+                    log(f"⚠️ Journal fsync failed: {e}")
+
+    def list(self, limit: int = 800):
+        with self.lock:
+            n = len(self.items)
+            if limit >= n:
+                return list(self.items)
+            return [self.items[i] for i in range(n - limit, n)]
+
+    def get(self, entry_id: str):
+        with self.lock:
+            return self.by_id.get(entry_id)
+
+    def set_comment(self, entry_id: str, comment: str):
+        with self.lock:
+            it = self.by_id.get(entry_id)
+            if it is None:
+                return False
+            it["comment"] = comment
+            self._append({"op": "comment", "id": entry_id, "comment": comment})
+            return True
+
+    def close(self):
+        with self.lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+    # ---- background compaction ----
+    def _maybe_compact(self):
+        # called with self.lock held
+        if self._compacting:
+            return
+        closed = [(no, p) for no, p in self._segments() if no < self._seg_no]
+        if len(closed) < self.compact_after:
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact, args=(closed,), daemon=True).start()
+
+    def _compact(self, closed):
+        try:
+            merged = self._fold_records([path for _no, path in closed], self.keep_records)
+
+            target = closed[-1][1]
+            tmp = target + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "compacted", "first": closed[0][0]}, separators=(",", ":")) + "\n")
+                for rec in merged:
+                    f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+            for _no, path in closed[:-1]:
                 try:
-                    self.clients.remove(q)
-                except Exception:
+                    os.remove(path)
+                except OSError:
                     pass
+            log(f"🗜️ Journal compacted {len(closed)} segments -> {len(merged)} records")
+        except Exception as e:
+            log(f"⚠️ Journal compaction failed: {e}")
+        finally:
+            self._compacting = False
 
 
-# =========================
-# GATT Base classes
-# =========================
-class Application(dbus.service.Object):
+class SqliteLogStore(LogStore):
     """
-    org.freedesktop.DBus.ObjectManager
+    LogStore in SQLite (WAL): Indizes auf ms, dir, kind, target und (dir, ms), (kind, ms), (target, ms),
+    FTS5 (trigram = Substring-Suche wie der Filter in der UI) über hex/ascii/label/comment (wie query() im Speicher).
+    Schreiben: eine Transaktion pro Batch (Writer-Thread). Lesen über eine eigene Verbindung,
+    WAL blockiert Leser nicht während ein Batch geschrieben wird.
     """
-    def __init__(self, bus):
-        self.path = f"{BASE}/app"
-        self.services = []
-        super().__init__(bus, self.path)
-
-    def get_path(self):
-        return dbus.ObjectPath(self.path)
+    COLS = ("seq", "id", "ms", "t", "dir", "kind", "hex", "ascii", "target", "label", "dec", "comment", "rec")
 
-    def add_service(self, service):
-        self.services.append(service)
+    def __init__(self, path: str, legacy_journal: str = None):
+        self.path = path
+        self.max_items = None
+        self.lock = threading.Lock()       # Schreibverbindung
+        self.rlock = threading.Lock()      # Leseverbindung
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = self._connect()
+        self.fts = self._create_schema()
+        self.rdb = self._connect()
+        self.seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM log").fetchone()[0]
+        if legacy_journal and os.path.isdir(legacy_journal) and self._count() == 0:
+            self._import_journal(legacy_journal)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")   # WAL: konsistent nach Crash, fsync beim Checkpoint / sync()
+        db.execute("PRAGMA temp_store=MEMORY")
+        db.execute("PRAGMA cache_size=-8000")
+        return db
+
+    def _create_schema(self) -> str:
+        db = self.db
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS log(
+                seq INTEGER PRIMARY KEY,
+                id TEXT UNIQUE, ms INTEGER, t TEXT, dir TEXT, kind TEXT,
+                hex TEXT, ascii TEXT, target TEXT, label TEXT, dec TEXT, comment TEXT, rec INTEGER);
+            -- seq ist die rowid und steckt implizit am Ende jedes Index -> ORDER BY seq ohne Sortieren:
+            -- (dir) / (kind) / (target) für "die neuesten N mit Filter", (dir|kind|target, ms) für Filter +
+            -- Zeitbereich (/api/log since/until) über einen Index. Nur die zusammengesetzten wären ohne
+            -- ANALYZE-Statistik bei "neueste N" bis zu 100x langsamer (Sortieren aller Treffer)
+            CREATE INDEX IF NOT EXISTS log_ms ON log(ms);
+            CREATE INDEX IF NOT EXISTS log_dir ON log(dir);
+            CREATE INDEX IF NOT EXISTS log_kind ON log(kind);
+            CREATE INDEX IF NOT EXISTS log_target ON log(target);
+            CREATE INDEX IF NOT EXISTS log_dir_ms ON log(dir, ms);
+            CREATE INDEX IF NOT EXISTS log_kind_ms ON log(kind, ms);
+            CREATE INDEX IF NOT EXISTS log_target_ms ON log(target, ms);
+        """)
+        # ältere DBs: label (dec.label) fehlt -> Spalte nachziehen, FTS-Index unten neu aufbauen
+        if "label" not in [r[1] for r in db.execute("PRAGMA table_info(log)")]:
+            db.execute("ALTER TABLE log ADD COLUMN label TEXT")
+            rows = db.execute("SELECT seq, dec FROM log WHERE dec IS NOT NULL").fetchall()
+            db.executemany("UPDATE log SET label = ? WHERE seq = ?",
+                           [((json.loads(d) or {}).get("label"), seq) for seq, d in rows])
+        old = db.execute("SELECT sql FROM sqlite_master WHERE name = 'log_fts'").fetchone()
+        if old and "label" not in old[0]:
+            db.executescript("""
+                DROP TRIGGER IF EXISTS log_ai; DROP TRIGGER IF EXISTS log_ad; DROP TRIGGER IF EXISTS log_au;
+                DROP TABLE log_fts;
+            """)
+        for tokenize in ("trigram", "unicode61"):
+            try:
+                db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5("
+                           f"hex, ascii, label, comment, content='log', content_rowid='seq', tokenize='{tokenize}')")
+            except sqlite3.OperationalError:
+                continue
+            db.executescript("""
+                CREATE TRIGGER IF NOT EXISTS log_ai AFTER INSERT ON log BEGIN
+                    INSERT INTO log_fts(rowid, hex, ascii, label, comment)
+                        VALUES (new.seq, new.hex, new.ascii, new.label, new.comment);
+                END;
+                CREATE TRIGGER IF NOT EXISTS log_ad AFTER DELETE ON log BEGIN
+                    INSERT INTO log_fts(log_fts, rowid, hex, ascii, label, comment)
+                        VALUES ('delete', old.seq, old.hex, old.ascii, old.label, old.comment);
+                END;
+                CREATE TRIGGER IF NOT EXISTS log_au AFTER UPDATE OF comment ON log BEGIN
+                    INSERT INTO log_fts(log_fts, rowid, hex, ascii, label, comment)
+                        VALUES ('delete', old.seq, old.hex, old.ascii, old.label, old.comment);
+                    INSERT INTO log_fts(rowid, hex, ascii, label, comment)
+                        VALUES (new.seq, new.hex, new.ascii, new.label, new.comment);
+                END;
+            """)
+            if old and "label" not in old[0]:
+                db.execute("INSERT INTO log_fts(log_fts) VALUES ('rebuild')")
+                log("🔎 SQLite FTS index rebuilt (label searchable)")
+            sql = db.execute("SELECT sql FROM sqlite_master WHERE name = 'log_fts'").fetchone()[0]
+            return "trigram" if "trigram" in sql else "unicode61"
+        log("⚠️ SQLite ohne FTS5 – Textsuche per LIKE")
+        return ""
+
+    def _count(self) -> int:
+        with self.rlock:
+            return self.rdb.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+
+    def _import_journal(self, journal_dir: str):
+        try:
+            segments = JournalLogStore.list_segments(journal_dir)
+            stale = JournalLogStore.stale_segments(segments)
+            paths = [path for no, path in segments if no not in stale]
+            entries, seen = [], set()
+            for rec in JournalLogStore._fold_records(paths):
+                if not rec.get("id"):
+                    continue
+                if rec["id"] in seen:
+                    # id ist hier UNIQUE: kollidierende ids aus älteren Journalen eindeutig machen
+                    n = 2
+                    while f"{rec['id']}~{n}" in seen:
+                        n += 1
+                    rec["id"] = f"{rec['id']}~{n}"
+                seen.add(rec["id"])
+                rec.pop("seq", None)
+                entries.append(rec)
+            if entries:
+                self.add_many(entries)
+                log(f"📦 Imported {len(entries)} entries from {journal_dir} into SQLite")
+        except Exception as e:
+            log(f"⚠️ Journal import into SQLite failed: {e}")
+
+    @staticmethod
+    def _row(e: dict):
+        dec = e.get("dec")
+        return (e["seq"], e.get("id"), e.get("ms"), e.get("t"), e.get("dir"), e.get("kind"), e.get("hex", ""),
+                e.get("ascii", ""), (dec or {}).get("target"), (dec or {}).get("label"),
+                json.dumps(dec, ensure_ascii=False, separators=(",", ":")) if dec is not None else None,
+                e.get("comment", ""), e.get("rec"))
+
+    def _entry(self, row) -> dict:
+        e = dict(zip(self.COLS, row))
+        e["dec"] = json.loads(e["dec"]) if e["dec"] else None
+        del e["target"], e["label"]
+        if e["rec"] is None:
+            del e["rec"]
+        return e
+
+    def add_many(self, entries):
+        with self.lock:
+            for e in entries:
+                self.seq += 1
+                e["seq"] = self.seq
+            rows = [self._row(e) for e in entries]
+            self.db.execute("BEGIN")
+            try:
+                # id kollidiert: vorhandene Zeile (samt Kommentar/FTS) bleibt, der neue Eintrag fällt weg
+                cur = self.db.executemany(f"INSERT INTO log({','.join(self.COLS)}) "
+                                          f"VALUES ({','.join('?' * len(self.COLS))}) ON CONFLICT(id) DO NOTHING", rows)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            if cur.rowcount >= 0 and cur.rowcount < len(rows):
+                log(f"⚠️ SQLite: {len(rows) - cur.rowcount} entries with duplicate id skipped")
+
+    def sync(self):
+        with self.lock:
+            try:
+                self.db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except Exception as e:
+                log(f"⚠️ SQLite checkpoint failed: {e}")
 
-    @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}")
-    def GetManagedObjects(self):
-        response = {}
-        for service in self.services:
-            response[service.get_path()] = service.get_properties()
-            for chrc in service.characteristics:
-                response[chrc.get_path()] = chrc.get_properties()
-        return response
+    def list(self, limit: int = 800):
+        return self.query(limit=limit)
 
+    def get(self, entry_id: str):
+        with self.rlock:
+            row = self.rdb.execute(f"SELECT {','.join(self.COLS)} FROM log WHERE id = ?", (entry_id,)).fetchone()
+        return self._entry(row) if row else None
 
-class Service(dbus.service.Object):
-    def __init__(self, bus, index, uuid, primary=True):
-        self.path = f"{BASE}/service{index}"
-        self.bus = bus
-        self.uuid = uuid
-        self.primary = primary
-        self.characteristics = []
-        super().__init__(bus, self.path)
+    def set_comment(self, entry_id: str, comment: str):
+        with self.lock:
+            cur = self.db.execute("UPDATE log SET comment = ? WHERE id = ?", (comment, entry_id))
+            return cur.rowcount > 0
+
+    def query(self, since_ms: int = None, until_ms: int = None, direction: str = None, kind: str = None,
+              text: str = None, target: str = None, limit: int = 200, before: int = None, after: int = None):
+        where, args = [], []
+        if after is not None:
+            where.append("seq > ?")
+            args.append(after)
+        elif before is not None:
+            where.append("seq < ?")
+            args.append(before)
+        if since_ms is not None:
+            where.append("ms >= ?")
+            args.append(since_ms)
+        if until_ms is not None:
+            where.append("ms <= ?")
+            args.append(until_ms)
+        if direction:
+            where.append("dir = ?")
+            args.append(direction)
+        if kind:
+            where.append("kind = ?")
+            args.append(kind)
+        if target:
+            where.append("target = ?")
+            args.append(target)
+        if text:
+            if self.fts and (self.fts != "trigram" or len(text) >= 3):
+                where.append("seq IN (SELECT rowid FROM log_fts WHERE log_fts MATCH ?)")
+                args.append('"' + text.replace('"', '""') + '"')
+            else:
+                like = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                where.append("(hex LIKE ? ESCAPE '\\' OR ascii LIKE ? ESCAPE '\\'"
+                             " OR label LIKE ? ESCAPE '\\' OR comment LIKE ? ESCAPE '\\')")
+                args += [like] * 4
+        sql = (f"SELECT {','.join(self.COLS)} FROM log"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + (" ORDER BY seq ASC" if after is not None else " ORDER BY seq DESC") + " LIMIT ?")
+        with self.rlock:
+            rows = self.rdb.execute(sql, args + [limit]).fetchall()
+        if after is None:
+            rows.reverse()
+        return [self._entry(r) for r in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+        with self.rlock:
+            self.rdb.close()
 
-    def get_path(self):
-        return dbus.ObjectPath(self.path)
 
-    def add_characteristic(self, chrc):
-        self.characteristics.append(chrc)
+# =========================
+# Binary capture (.gbc + mmap index)
+# =========================
+# .gbc  Dateikopf: magic, wall_ns + mono_ns beim Anlegen (Umrechnung monotonic -> Uhrzeit)
+#       pro Record: mono_ns (int64), dir (u8), kind (u8), len (u16), payload
+# .gbi  pro Record: offset (u64), mono_ns (int64) -> Record n in O(1), Zeit per Binärsuche
+# .gbn  Kommentare als JSON-Zeilen {"rec": n, "comment": ".."} (letzter gewinnt)
+CAPTURE_MAGIC = b"GBCAP\x00\x01\x00"
+CAPTURE_FILE_HDR = struct.Struct("<8sqq")
+CAPTURE_REC_HDR = struct.Struct("<qBBH")
+CAPTURE_IDX = struct.Struct("<Qq")
+CAPTURE_DIRS = ("app->board", "board->app")
+CAPTURE_DIR_CODES = {d: i for i, d in enumerate(CAPTURE_DIRS)}
+# Index = Code im Record-Header; weitere kinds meldet das jeweilige Feature per capture_kind() an
+CAPTURE_KINDS = ["ble", "manual"]
+CAPTURE_KIND_CODES = {k: i for i, k in enumerate(CAPTURE_KINDS)}
+
+
+def capture_kind(kind: str, code: int) -> str:
+    """kind mit festem Code anmelden. Codes stehen in .gbc Dateien: nie umnummerieren, nur anhängen."""
+    if code != len(CAPTURE_KINDS) or kind in CAPTURE_KIND_CODES:
+        raise ValueError(f"capture kind {kind!r}: code {code} taken or out of order")
+    CAPTURE_KINDS.append(kind)
+    CAPTURE_KIND_CODES[kind] = code
+    return kind
+
+
+def capture_paths(path: str):
+    base = path[:-4] if path.endswith(".gbc") else path
+    return base + ".gbc", base + ".gbi", base + ".gbn"
+
+
+class CaptureWriter:
+    """
+    Append-only Writer für .gbc/.gbi/.gbn. append_many() schreibt einen Batch mit je einem
+    write() pro Datei. Records nur aus dem Writer-Thread; Kommentare (.gbn) unter Lock.
+    base = (wall_ns, mono_ns) für den Dateikopf (Import: Originalzeit statt jetzt).
+    """
+    def __init__(self, path: str, base: tuple = None):
+        self.path, self.idx_path, self.notes_path = capture_paths(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.f = open(self.path, "ab")
+        self.fi = open(self.idx_path, "ab")
+        self.fn = open(self.notes_path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.size = self.f.tell()
+        if self.size == 0:
+            wall_ns, mono_ns = base or (time.time_ns(), time.monotonic_ns())
+            self.f.write(CAPTURE_FILE_HDR.pack(CAPTURE_MAGIC, wall_ns, mono_ns))
+            self.f.flush()
+            self.size = CAPTURE_FILE_HDR.size
+        self.count = self.fi.tell() // CAPTURE_IDX.size
+
+    @classmethod
+    def new_session(cls, directory: str = CAPTURE_DIR):
+        name = time.strftime("cap-%Y%m%d-%H%M%S")
+        return cls(os.path.join(directory, name + ".gbc"))
+
+    def append_many(self, records) -> int:
+        """records = [(mono_ns, direction, kind, payload, comment)], liefert die erste Record-Nummer."""
+        first = self.count
+        data = bytearray()
+        idx = bytearray()
+        notes = []
+        off = self.size
+        n = first
+        for mono_ns, direction, kind, payload, comment in records:
+            hdr = CAPTURE_REC_HDR.pack(mono_ns, CAPTURE_DIR_CODES.get(direction, 255),
+                                       CAPTURE_KIND_CODES.get(kind, 255), len(payload))
+            idx += CAPTURE_IDX.pack(off, mono_ns)
+            data += hdr
+            data += payload
+            off += len(hdr) + len(payload)
+            if comment:
+                notes.append(json.dumps({"rec": n, "comment": comment}, ensure_ascii=False) + "\n")
+            n += 1
+        # erst Daten, dann Index: ein Index-Eintrag zeigt nie auf fehlende Bytes
+        self.f.write(data)
+        self.f.flush()
+        self.fi.write(idx)
+        self.fi.flush()
+        if notes:
+            with self.lock:
+                self.fn.write("".join(notes))
+                self.fn.flush()
+        self.size = off
+        self.count = n
+        return first
+
+    def append_recs(self, recs) -> int:
+        # Roh-Records aus MitmState._emit_ui: (t, direction, payload, kind, comment, console, monotonic_ns)
+        return self.append_many([(r[6], r[1], r[3], r[2], r[4]) for r in recs])
+
+    def set_comment(self, rec: int, comment: str):
+        with self.lock:
+            self.fn.write(json.dumps({"rec": rec, "comment": comment}, ensure_ascii=False) + "\n")
+            self.fn.flush()
 
-    def get_properties(self):
-        return {
-            GATT_SERVICE_IFACE: {
-                "UUID": dbus.String(self.uuid),
-                "Primary": dbus.Boolean(self.primary),
-                "Characteristics": dbus.Array([c.get_path() for c in self.characteristics], signature="o"),
-            }
-        }
+    def sync(self):
+        for f in (self.f, self.fi, self.fn):
+            try:
+                os.fsync(f.fileno())
+            except Exception:
+                pass
 
+    def close(self):
+        for f in (self.f, self.fi, self.fn):
+            try:
+                f.close()
+            except Exception:
+                pass
 
-class Characteristic(dbus.service.Object):
-    def __init__(self, bus, index, uuid, flags, service: Service):
-        self.path = f"{service.path}/char{index}"
-        self.bus = bus
-        self.uuid = uuid
-        self.flags = flags
-        self.service = service
-        self.value = bytearray()
-        self.notifying = False
-        super().__init__(bus, self.path)
 
-    def get_path(self):
-        return dbus.ObjectPath(self.path)
+class CaptureReader:
+    """
+    Liest .gbc über mmap: record(n) O(1) über den Index, index_at(mono_ns) per Binärsuche
+    auf dem gemappten Index. Nichts wird komplett in den Speicher geladen.
+    refresh() mappt neu, wenn die Datei inzwischen gewachsen ist (live Capture).
+    """
+    def __init__(self, path: str):
+        self.path, self.idx_path, self.notes_path = capture_paths(path)
+        self.f = open(self.path, "rb")
+        self.fi = open(self.idx_path, "rb")
+        magic, self.wall_base_ns, self.mono_base_ns = CAPTURE_FILE_HDR.unpack(self.f.read(CAPTURE_FILE_HDR.size))
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"not a capture file: {self.path}")
+        self.data = None
+        self.idx = None
+        self.count = 0
+        self._notes = None
+        self._notes_size = -1
+        self.refresh()
+
+    def refresh(self):
+        size = os.fstat(self.f.fileno()).st_size
+        isize = os.fstat(self.fi.fileno()).st_size
+        n = isize // CAPTURE_IDX.size
+        if n == self.count and self.data is not None:
+            return self.count
+        self._unmap()
+        if n:
+            self.data = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ)
+            self.idx = mmap.mmap(self.fi.fileno(), n * CAPTURE_IDX.size, access=mmap.ACCESS_READ)
+            # halb geschriebenen letzten Record (Crash) ignorieren
+            while n:
+                off, _ = CAPTURE_IDX.unpack_from(self.idx, (n - 1) * CAPTURE_IDX.size)
+                if off + CAPTURE_REC_HDR.size <= size:
+                    plen = CAPTURE_REC_HDR.unpack_from(self.data, off)[3]
+                    if off + CAPTURE_REC_HDR.size + plen <= size:
+                        break
+                n -= 1
+        self.count = n
+        return n
+
+    def _unmap(self):
+        for m in (self.data, self.idx):
+            if m is not None:
+                m.close()
+        self.data = self.idx = None
+
+    def close(self):
+        self._unmap()
+        self.f.close()
+        self.fi.close()
+
+    def __len__(self):
+        return self.count
+
+    def mono_at(self, n: int) -> int:
+        return CAPTURE_IDX.unpack_from(self.idx, n * CAPTURE_IDX.size)[1]
+
+    def record(self, n: int):
+        """(mono_ns, direction, kind, payload) für Record n."""
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        off = CAPTURE_IDX.unpack_from(self.idx, n * CAPTURE_IDX.size)[0]
+        mono_ns, d, k, plen = CAPTURE_REC_HDR.unpack_from(self.data, off)
+        start = off + CAPTURE_REC_HDR.size
+        return (mono_ns,
+                CAPTURE_DIRS[d] if d < len(CAPTURE_DIRS) else "?",
+                CAPTURE_KINDS[k] if k < len(CAPTURE_KINDS) else "?",
+                self.data[start:start + plen])
+
+    def index_at(self, mono_ns: int) -> int:
+        """Erster Record mit Zeitstempel >= mono_ns (Zeitstempel sind monoton steigend)."""
+        return bisect.bisect_left(range(self.count), mono_ns, key=self.mono_at)
+
+    def index_at_wall(self, wall_ns: int) -> int:
+        return self.index_at(wall_ns - self.wall_base_ns + self.mono_base_ns)
+
+    def wall_ns(self, mono_ns: int) -> int:
+        return self.wall_base_ns + (mono_ns - self.mono_base_ns)
+
+    def iter(self, start: int = 0, stop: int = None):
+        stop = self.count if stop is None else min(stop, self.count)
+        for n in range(max(0, start), stop):
+            yield (n,) + self.record(n)
+
+    def comments(self) -> dict:
+        # Side-Table ist klein (nur kommentierte Records) -> beim ersten Zugriff / nach Änderung laden
+        try:
+            size = os.path.getsize(self.notes_path)
+        except OSError:
+            return {}
+        if size != self._notes_size:
+            notes = {}
+            with open(self.notes_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        notes[rec["rec"]] = rec.get("comment", "")
+                    except Exception:
+                        continue
+            self._notes = notes
+            self._notes_size = size
+        return self._notes
+
+    def entry(self, n: int) -> dict:
+        """Record n im Format der Log-Einträge (wie /api/log)."""
+        mono_ns, direction, kind, payload = self.record(n)
+        wall = self.wall_ns(mono_ns) / 1e9
+        return {
+            "rec": n,
+            "t": time.strftime("%H:%M:%S", time.localtime(wall)),
+            "ms": int(wall * 1000),
+            "mono_ns": mono_ns,
+            "dir": direction,
+            "kind": kind,
+            "hex": hx(payload),
+            "ascii": ascii_vis(payload),
+            "dec": decode_frame(direction, payload),
+            "comment": self.comments().get(n, ""),
+        }
 
-    def get_properties(self):
+    def info(self) -> dict:
+        first = self.mono_at(0) if self.count else None
+        last = self.mono_at(self.count - 1) if self.count else None
         return {
-            GATT_CHRC_IFACE: {
-                "Service": self.service.get_path(),
-                "UUID": dbus.String(self.uuid),
-                "Flags": dbus.Array([dbus.String(f) for f in self.flags], signature="s"),
-                "Value": dbus.Array([dbus.Byte(b) for b in self.value], signature="y"),
-            }
+            "path": self.path,
+            "records": self.count,
+            "bytes": self.data.size() if self.data is not None else CAPTURE_FILE_HDR.size,
+            "first_ms": self.wall_ns(first) // 1_000_000 if first is not None else None,
+            "last_ms": self.wall_ns(last) // 1_000_000 if last is not None else None,
+            "duration_s": round((last - first) / 1e9, 3) if self.count else 0,
+            "comments": len(self.comments()),
         }
 
-    @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
-    def GetAll(self, interface):
-        if interface != GATT_CHRC_IFACE:
-            return {}
-        return self.get_properties()[GATT_CHRC_IFACE]
 
-    @dbus.service.signal(DBUS_PROP_IFACE, signature="sa{sv}as")
-    def PropertiesChanged(self, interface, changed, invalidated):
-        pass
+# =========================
+# Export (JSONL / CSV / btsnoop) – Generator-Pipeline, konstanter Speicher
+# =========================
+# Quelle -> Records {"n", "wall_ns", "dir", "kind", "payload", "comment"} -> Formatter -> bytes-Chunks
+EXPORT_CHUNK_BYTES = 64 * 1024
 
-    def _props_changed_value(self):
-        self.PropertiesChanged(
-            GATT_CHRC_IFACE,
-            {"Value": dbus.Array([dbus.Byte(b) for b in self.value], signature="y")},
-            []
-        )
 
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
-    def ReadValue(self, options):
-        return dbus.Array([dbus.Byte(b) for b in self.value], signature="y")
+def parse_time_arg(v):
+    """Unix ms (Zahl) oder ISO-Zeit ("2026-01-31T20:15:00") -> Unix ms; leer -> None."""
+    if v is None or v == "":
+        return None
+    v = str(v).strip()
+    if v.lstrip("-").isdigit():
+        return int(v)
+    return int(datetime.datetime.fromisoformat(v).timestamp() * 1000)
+
+
+def export_from_capture(reader: CaptureReader, from_ms: int = None, to_ms: int = None):
+    start = reader.index_at_wall(from_ms * 1_000_000) if from_ms is not None else 0
+    stop = reader.index_at_wall((to_ms + 1) * 1_000_000) if to_ms is not None else len(reader)
+    notes = reader.comments()
+    for n, mono_ns, direction, kind, payload in reader.iter(start, stop):
+        yield {"n": n, "wall_ns": reader.wall_ns(mono_ns), "dir": direction, "kind": kind,
+               "payload": payload, "comment": notes.get(n, "")}
+
+
+def export_from_logstore(store: LogStore, from_ms: int = None, to_ms: int = None, page: int = 500):
+    # seitenweise per Keyset, nie mehr als eine Seite im Speicher
+    cursor = 0
+    while True:
+        items = store.query(since_ms=from_ms, until_ms=to_ms, after=cursor, limit=page)
+        for e in items:
+            yield {"n": e.get("seq"), "wall_ns": (e.get("ms") or 0) * 1_000_000, "dir": e.get("dir"),
+                   "kind": e.get("kind"), "payload": bytes.fromhex(e.get("hex", "").replace(" ", "")),
+                   "comment": e.get("comment", "")}
+        if len(items) < page:
+            return
+        cursor = items[-1]["seq"]
+
+
+def export_jsonl(records):
+    for r in records:
+        p = r["payload"]
+        yield (json.dumps({
+            "n": r["n"], "ms": r["wall_ns"] // 1_000_000, "dir": r["dir"], "kind": r["kind"],
+            "hex": hx(p), "ascii": ascii_vis(p), "dec": decode_frame(r["dir"], p), "comment": r["comment"],
+        }, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def export_csv(records):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["n", "time", "unix_ms", "dir", "kind", "hex", "ascii", "decoded", "comment"])
+    for r in records:
+        p = r["payload"]
+        ms = r["wall_ns"] // 1_000_000
+        w.writerow([r["n"], datetime.datetime.fromtimestamp(ms / 1000).isoformat(timespec="milliseconds"), ms,
+                    r["dir"], r["kind"], hx(p), ascii_vis(p), decode_frame(r["dir"], p)["label"], r["comment"]])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+# btsnoop (Android btsnoop_hci.log Format, H4): aus Sicht der App (Host) – Board-Notify = empfangen,
+# App-Write = gesendet. Vorweg eine synthetische LE-Verbindung und GATT Discovery, damit Wireshark
+# die Handles den Characteristics 442f1571 (Notify) / 442f1572 (Write) zuordnet.
+BTSNOOP_MAGIC = b"btsnoop\x00"
+BTSNOOP_DATALINK_H4 = 1002
+BTSNOOP_EPOCH_DELTA_US = 0x00DCDDB30F2F8000   # µs zwischen 0001-01-01 und 1970-01-01
+BTSNOOP_REC = struct.Struct(">IIIIq")
+BTSNOOP_ACL_HANDLE = 0x0040
+ATT_CID = 0x0004
+ATT_SERVICE_HANDLE, ATT_SERVICE_END = 0x0001, 0x0008
+ATT_NOTIFY_DECL, ATT_NOTIFY_VALUE = 0x0002, 0x0003
+ATT_WRITE_DECL, ATT_WRITE_VALUE = 0x0005, 0x0006
+
+
+def _uuid_le(u: str) -> bytes:
+    return uuid.UUID(u).bytes[::-1]
+
+
+def btsnoop_packet(wall_ns: int, received: bool, h4: bytes, event: bool = False) -> bytes:
+    flags = (1 if received else 0) | (2 if event else 0)
+    return BTSNOOP_REC.pack(len(h4), len(h4), flags, 0, wall_ns // 1000 + BTSNOOP_EPOCH_DELTA_US) + h4
+
+
+def btsnoop_att(wall_ns: int, received: bool, pdu: bytes) -> bytes:
+    l2cap = struct.pack("<HH", len(pdu), ATT_CID) + pdu
+    acl = struct.pack("<HH", BTSNOOP_ACL_HANDLE | (0x2 << 12), len(l2cap)) + l2cap   # PB=10: erstes Fragment
+    return btsnoop_packet(wall_ns, received, b"\x02" + acl)
+
+
+def btsnoop_preamble(wall_ns: int) -> bytes:
+    peer = bytes.fromhex(REAL_BOARD_ADDR.replace(":", ""))[::-1]
+    # LE Connection Complete (Event 0x3E / Sub 0x01)
+    params = struct.pack("<BBHBB6sHHHB", 0x01, 0x00, BTSNOOP_ACL_HANDLE, 0x00, 0x01, peer, 24, 0, 400, 0)
+    out = [btsnoop_packet(wall_ns, True, b"\x04\x3E" + bytes([len(params)]) + params, event=True)]
+    # Primary Service Discovery (Read By Group Type 0x2800)
+    out.append(btsnoop_att(wall_ns, False, struct.pack("<BHHH", 0x10, 0x0001, 0xFFFF, 0x2800)))
+    out.append(btsnoop_att(wall_ns, True, struct.pack("<BBHH", 0x11, 20, ATT_SERVICE_HANDLE, ATT_SERVICE_END)
+                           + _uuid_le(VENDOR_SERVICE_UUID)))
+    # Characteristic Discovery (Read By Type 0x2803)
+    out.append(btsnoop_att(wall_ns, False, struct.pack("<BHHH", 0x08, ATT_SERVICE_HANDLE, ATT_SERVICE_END, 0x2803)))
+    out.append(btsnoop_att(wall_ns, True, struct.pack("<BB", 0x09, 21)
+                           + struct.pack("<HBH", ATT_NOTIFY_DECL, 0x10, ATT_NOTIFY_VALUE) + _uuid_le(CHAR_NOTIFY_UUID)
+                           + struct.pack("<HBH", ATT_WRITE_DECL, 0x0C, ATT_WRITE_VALUE) + _uuid_le(CHAR_WRITE_UUID)))
+    return b"".join(out)
+
+
+def export_btsnoop(records):
+    yield BTSNOOP_MAGIC + struct.pack(">II", 1, BTSNOOP_DATALINK_H4)
+    first = True
+    for r in records:
+        if first:
+            yield btsnoop_preamble(r["wall_ns"])
+            first = False
+        if r["dir"] == "board->app":
+            pdu = struct.pack("<BH", 0x1B, ATT_NOTIFY_VALUE) + bytes(r["payload"])    # Handle Value Notification
+            yield btsnoop_att(r["wall_ns"], True, pdu)
+        else:
+            pdu = struct.pack("<BH", 0x52, ATT_WRITE_VALUE) + bytes(r["payload"])     # Write Command
+            yield btsnoop_att(r["wall_ns"], False, pdu)
 
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
-    def WriteValue(self, value, options):
-        self.value = bytearray(value)
 
-    @dbus.service.method(GATT_CHRC_IFACE)
-    def StartNotify(self):
-        self.notifying = True
+EXPORT_FORMATS = {
+    # name: (Formatter, Content-Type, Dateiendung)
+    "jsonl": (export_jsonl, "application/x-ndjson; charset=utf-8", "jsonl"),
+    "csv": (export_csv, "text/csv; charset=utf-8", "csv"),
+    "btsnoop": (export_btsnoop, "application/octet-stream", "log"),
+}
 
-    @dbus.service.method(GATT_CHRC_IFACE)
-    def StopNotify(self):
-        self.notifying = False
+
+def export_chunks(records, fmt: str, chunk_bytes: int = EXPORT_CHUNK_BYTES):
+    """Formatiert und fasst kleine Stücke zu ~chunk_bytes zusammen (weniger write()-Aufrufe)."""
+    formatter = EXPORT_FORMATS[fmt][0]
+    buf, size = [], 0
+    for part in formatter(records):
+        buf.append(part)
+        size += len(part)
+        if size >= chunk_bytes:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
 
 
 # =========================
-# Advertisement (minimal, BlueZ-safe)
+# btsnoop import (Android btsnoop_hci.log -> Capture + LogStore)
 # =========================
-class Advertisement(dbus.service.Object):
-    def __init__(self, bus, index):
-        self.path = f"{BASE}/advertisement{index}"
-        self.bus = bus
-        super().__init__(bus, self.path)
+# Datei per mmap, Records werden beim Iterieren geparst: HCI ACL -> L2CAP (Fragmente pro Verbindung
+# zusammengesetzt) -> ATT. Übernommen werden Notifications/Indications (board->app) und Writes
+# (app->board) auf den Handles der Vendor-Characteristics, mit Originalzeit, kind "import".
+IMPORT_BATCH = 4096
+IMPORT_SCAN_PACKETS = 200000    # ohne GATT Discovery: so viele Pakete für die Handle-Heuristik ansehen
+capture_kind("import", 2)
 
-        self.ad_type = "peripheral"
-        self.local_name = PROXY_LOCAL_NAME
-        self.service_uuids = [VENDOR_SERVICE_UUID]
-        self.appearance = 0x0000
 
-    def get_path(self):
-        return dbus.ObjectPath(self.path)
+class BtsnoopReader:
+    """btsnoop Datei (H4 1002 / HCI 1001) per mmap; iter() liefert (wall_ns, received, hci_type, packet)."""
+    def __init__(self, path: str):
+        self.path = path
+        self.f = open(path, "rb")
+        size = os.fstat(self.f.fileno()).st_size
+        if size < 16:
+            raise ValueError(f"not a btsnoop file: {path}")
+        self.mm = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ)
+        magic, version, self.datalink = struct.unpack_from(">8sII", self.mm, 0)
+        if magic != BTSNOOP_MAGIC:
+            raise ValueError(f"not a btsnoop file: {path}")
+        if self.datalink not in (1001, BTSNOOP_DATALINK_H4):
+            raise ValueError(f"unsupported btsnoop datalink {self.datalink}")
+        self.size = size
+        self.offset = 16      # Fortschritt (Bytes) für /api/import
+        self.truncated = 0    # Pakete mit incl_len < orig_len (gefiltertes Snoop-Log)
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def iter(self):
+        mm, size = self.mm, self.size
+        unpack = BTSNOOP_REC.unpack_from
+        rec = BTSNOOP_REC.size
+        h4 = self.datalink == BTSNOOP_DATALINK_H4
+        off = 16
+        while off + rec <= size:
+            orig, incl, flags, _drops, ts = unpack(mm, off)
+            off += rec
+            if off + incl > size:
+                break   # abgeschnittenes Dateiende
+            pkt = mm[off:off + incl]
+            off += incl
+            self.offset = off
+            if incl < orig:
+                self.truncated += 1
+            wall_ns = (ts - BTSNOOP_EPOCH_DELTA_US) * 1000
+            received = bool(flags & 1)
+            if h4:
+                if not pkt:
+                    continue
+                yield wall_ns, received, pkt[0], pkt[1:]
+            else:
+                yield wall_ns, received, (0x04 if received else 0x01) if flags & 2 else 0x02, pkt
+
+
+def btsnoop_att_pdus(packets):
+    """
+    (wall_ns, received, hci_type, packet) -> (wall_ns, received, acl_handle, peer, att_pdu).
+    L2CAP wird pro ACL-Handle aus Start-/Continuation-Fragmenten zusammengesetzt,
+    peer (Adresse aus LE Connection Complete) ist None, wenn das Log mitten in der Verbindung beginnt.
+    """
+    peers = {}
+    partial = {}   # acl_handle -> [fehlende Bytes, cid, bytearray]
+    for wall_ns, received, typ, pkt in packets:
+        if typ == 0x02:
+            if len(pkt) < 4:
+                continue
+            hf, n = struct.unpack_from("<HH", pkt, 0)
+            handle, pb = hf & 0x0FFF, (hf >> 12) & 0x3
+            data = pkt[4:4 + n]
+            if pb == 0x1:
+                p = partial.get(handle)
+                if p is None:
+                    continue
+                p[2] += data
+                p[0] -= len(data)
+                if p[0] > 0:
+                    continue
+                del partial[handle]
+                cid, sdu = p[1], bytes(p[2])
+            else:
+                if len(data) < 4:
+                    continue
+                ln, cid = struct.unpack_from("<HH", data, 0)
+                sdu = data[4:]
+                if len(sdu) < ln:
+                    partial[handle] = [ln - len(sdu), cid, bytearray(sdu)]
+                    continue
+                partial.pop(handle, None)
+            if cid == ATT_CID and sdu:
+                yield wall_ns, received, handle, peers.get(handle), sdu
+        elif typ == 0x04 and len(pkt) >= 2:
+            code = pkt[0]
+            if code == 0x3E and len(pkt) >= 13 and pkt[2] in (0x01, 0x0A) and pkt[3] == 0:
+                # LE (Enhanced) Connection Complete: status, handle, role, addr_type, addr
+                handle = struct.unpack_from("<H", pkt, 4)[0] & 0x0FFF
+                peers[handle] = ":".join(f"{b:02X}" for b in reversed(pkt[8:14]))
+            elif code == 0x05 and len(pkt) >= 6:
+                handle = struct.unpack_from("<H", pkt, 3)[0] & 0x0FFF
+                peers.pop(handle, None)
+                partial.pop(handle, None)
+
+
+def _discovered_handles(pdu, found: dict):
+    # Read By Type Response (Characteristic Declarations) / Find Information Response mit 128-bit UUIDs
+    want = {_uuid_le(CHAR_NOTIFY_UUID): "notify", _uuid_le(CHAR_WRITE_UUID): "write"}
+    op = pdu[0]
+    if op == 0x09 and len(pdu) >= 2 and pdu[1] == 21:
+        for i in range(2, len(pdu) - 20, 21):
+            name = want.get(bytes(pdu[i + 5:i + 21]))
+            if name:
+                found[name] = struct.unpack_from("<H", pdu, i + 3)[0]
+    elif op == 0x05 and len(pdu) >= 2 and pdu[1] == 2:
+        for i in range(2, len(pdu) - 17, 18):
+            name = want.get(bytes(pdu[i + 2:i + 18]))
+            if name:
+                found[name] = struct.unpack_from("<H", pdu, i)[0]
+
+
+def btsnoop_find_handles(path: str) -> dict:
+    """
+    ATT Handles der Vendor-Characteristics und die Verbindung dazu (ACL-Handle, peer falls bekannt):
+    aus der GATT Discovery im Log, sonst (App hatte die Handles gecacht) per Heuristik aus den ersten
+    IMPORT_SCAN_PACKETS Paketen: Handle mit den meisten dekodierbaren Board-Frames (Notify) bzw.
+    App-Frames (Write). Gezählt wird pro Verbindung, andere LE-Geräte mit denselben Handles zählen nicht mit.
+    """
+    r = BtsnoopReader(path)
+    found = {}                            # acl -> {"notify": h, "write": h}
+    peers = {}                            # acl -> peer (zuletzt gesehen)
+    votes = {"notify": {}, "write": {}}   # (acl, handle) -> Anzahl
+    try:
+        for i, (_t, _rx, acl, peer, pdu) in enumerate(btsnoop_att_pdus(r.iter())):
+            peers[acl] = peer
+            op = pdu[0]
+            if op in (0x09, 0x05):
+                f = found.setdefault(acl, {})
+                _discovered_handles(pdu, f)
+                if "notify" in f and "write" in f:
+                    return {**f, "acl": acl, "peer": peer, "source": "discovery"}
+            elif len(pdu) > 3 and op in (0x1B, 0x1D, 0x12, 0x52):
+                key = (acl, struct.unpack_from("<H", pdu, 1)[0])
+                value = bytes(pdu[3:])
+                if op in (0x1B, 0x1D):
+                    if b"@" in value or decode_frame("board->app", value)["type"] != "unknown":
+                        votes["notify"][key] = votes["notify"].get(key, 0) + 1
+                elif decode_frame("app->board", value)["type"] != "unknown":
+                    votes["write"][key] = votes["write"].get(key, 0) + 1
+            if i >= IMPORT_SCAN_PACKETS:
+                break
+    finally:
+        r.close()
+    # Verbindung mit den meisten Board-Frames (sonst App-Frames), beide Handles aus dieser Verbindung
+    v = votes["notify"] or votes["write"]
+    if not v:
+        return {"acl": None, "peer": None, "source": None}
+    acl = max(v, key=v.get)[0]
+    out = dict(found.get(acl, {}))
+    for name, v in votes.items():
+        v = {h: n for (a, h), n in v.items() if a == acl}
+        if name not in out and v:
+            out[name] = max(v, key=v.get)
+    return {**out, "acl": acl, "peer": peers.get(acl), "source": "heuristic"}
+
+
+def btsnoop_frames(reader: BtsnoopReader, notify_handle: int = None, write_handle: int = None, stats: dict = None,
+                   acl: int = None, peer: str = None):
+    """
+    (wall_ns, direction, payload) für Vendor-Traffic; Richtung folgt aus dem ATT Opcode.
+    Nur die Board-Verbindung: peer (Adresse, gilt auch nach Reconnect mit neuem ACL-Handle) oder,
+    wenn die Verbindung vor dem Log begann, das ACL-Handle. Beides None = alle Verbindungen.
+    """
+    st = stats if stats is not None else {}
+    for k in ("att", "frames", "board->app", "app->board", "other_handles", "other_connections"):
+        st.setdefault(k, 0)
+    for wall_ns, _rx, acl_h, conn_peer, pdu in btsnoop_att_pdus(reader.iter()):
+        st["att"] += 1
+        op = pdu[0]
+        if op in (0x1B, 0x1D):
+            direction, want = "board->app", notify_handle
+        elif op in (0x52, 0x12):
+            direction, want = "app->board", write_handle
+        else:
+            continue
+        if len(pdu) < 3:
+            continue
+        if (conn_peer != peer) if peer is not None else (acl is not None and acl_h != acl):
+            st["other_connections"] += 1
+            continue
+        if struct.unpack_from("<H", pdu, 1)[0] != want:
+            st["other_handles"] += 1
+            continue
+        st["frames"] += 1
+        st[direction] += 1
+        yield wall_ns, direction, bytes(pdu[3:])
+
+
+def import_btsnoop(path: str, store: LogStore = None, capture_dir: str = CAPTURE_DIR,
+                   notify_handle: int = None, write_handle: int = None, progress: dict = None,
+                   acl_handle: int = None, board: str = None) -> dict:
+    """
+    Streamt ein btsnoop Log in einen neuen Capture (cap-<Originalzeit>-import.gbc, Zeitbasis = Originalzeit)
+    und – falls store – als kind "import" Einträge in den LogStore, in Batches von IMPORT_BATCH.
+    Verbindung (board = Adresse, acl_handle) kommt mit den Handles aus btsnoop_find_handles; bei
+    vorgegebenen Handles ohne acl_handle/board werden alle Verbindungen übernommen.
+    progress (dict) wird laufend aktualisiert (Web-Job).
+    """
+    st = progress if progress is not None else {}
+    t0 = time.perf_counter()
+    board = board.upper() if board else None
+    if notify_handle is None or write_handle is None:
+        h = btsnoop_find_handles(path)
+        notify_handle = h.get("notify") if notify_handle is None else notify_handle
+        write_handle = h.get("write") if write_handle is None else write_handle
+        if acl_handle is None and board is None:
+            acl_handle, board = h.get("acl"), h.get("peer")
+        st["handles_from"] = h.get("source")
+    if notify_handle is None and write_handle is None:
+        raise ValueError("no GranBoard ATT traffic found (pass notify/write handle explicitly)")
+    st.update({"path": path, "notify_handle": notify_handle, "write_handle": write_handle,
+               "acl_handle": acl_handle, "board": board, "capture": None, "logged": 0})
+
+    reader = BtsnoopReader(path)
+    st["bytes"] = reader.size
+    token = f"{int(time.time()) % 100000:05d}"
+    reassembler = FrameReassembler()
+    done = []
+    capture = None
+    last_mono = 0
+    recs, entries = [], []
+
+    def flush():
+        first = capture.append_many(recs)
+        if store is not None:
+            for i, e in enumerate(entries, first):
+                e["rec"] = i
+            store.add_many(entries)
+            st["logged"] += len(entries)
+        recs.clear()
+        entries.clear()
+        st["read"] = reader.offset
+
+    try:
+        for n, (wall_ns, direction, payload) in enumerate(btsnoop_frames(reader, notify_handle, write_handle, st,
+                                                                               acl=acl_handle, peer=board)):
+            if capture is None:
+                name = os.path.join(capture_dir, time.strftime("cap-%Y%m%d-%H%M%S", time.localtime(wall_ns / 1e9)))
+                path_gbc = name + "-import.gbc"
+                for i in itertools.count(2):
+                    if not os.path.exists(path_gbc):
+                        break
+                    path_gbc = f"{name}-import{i}.gbc"   # selbes Log nochmal importiert
+                capture = CaptureWriter(path_gbc, base=(wall_ns, 0))
+                st["capture"] = capture.path
+                base = wall_ns
+            # Capture braucht monoton steigende Zeit (Binärsuche), btsnoop ist es fast immer
+            last_mono = max(last_mono, wall_ns - base)
+            recs.append((last_mono, direction, "import", payload, ""))
+            if store is not None:
+                dec = (decode_board_chunk(reassembler, payload, done) if direction == "board->app"
+                       else decode_frame(direction, payload))
+                entries.append(log_entry(f"{wall_ns // 1_000_000}-i{token}-{n}", wall_ns / 1e9,
+                                         direction, "import", payload, dec))
+            if len(recs) >= IMPORT_BATCH:
+                flush()
+        if recs:
+            flush()
+        if store is not None:
+            store.sync()
+        if capture is not None:
+            capture.sync()
+    finally:
+        st["truncated"] = reader.truncated
+        st["read"] = reader.offset
+        reader.close()
+        if capture is not None:
+            capture.close()
+    st["seconds"] = round(time.perf_counter() - t0, 3)
+    return st
+
+
+# =========================
+# Capture analytics (NumPy, optional) – "analyze" Kommando
+# =========================
+# Der Capture wird spaltenweise in Arrays geladen (Index + Record-Header direkt aus dem mmap),
+# Payloads als Matrix fester Breite. Dekodiert wird nur jeder DISTINKTE Frame einmal
+# (np.unique über Richtung + Länge + Payload), alles andere sind Array-Operationen.
+# Board-Notifies werden als Chunk klassifiziert (ohne Reassembler): fragmentierte Treffer
+# zählen als "unknown". Frames länger als ANALYZE_WIDTH werden für die Klassifizierung gekürzt.
+ANALYZE_WIDTH = 20              # längster bekannter Frame (Ring-Palette)
+ANALYZE_CHUNK = 1 << 18         # Records pro Gather-Schritt (begrenzt temporären Speicher)
+ANALYZE_RATE_BIN_S = 1.0
+ANALYZE_IAT_EDGES_MS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+ANALYZE_TYPES = ("unknown", "hit", "out", "button", "connect", "ack", "led", "ring", "settings")
+ANALYZE_TYPE_CODES = {t: i for i, t in enumerate(ANALYZE_TYPES)}
+ANALYZE_RINGS = ("SO", "SI", "D", "T", "SBULL", "DBULL")
+ANALYZE_RING_CODES = {r: i for i, r in enumerate(ANALYZE_RINGS)}
+
+
+def capture_arrays(reader: CaptureReader, start: int = 0, stop: int = None, width: int = ANALYZE_WIDTH) -> dict:
+    """
+    Records [start, stop) als Spalten: mono (int64), dir, kind (uint8), len (uint16) und
+    rows = N x 8k uint8 (Richtung, Länge <= 255, Payload, mit 0 aufgefüllt); payload ist eine View darauf.
+    Die Arrays sind Kopien, der Reader kann danach geschlossen werden.
+    """
+    stop = len(reader) if stop is None else min(stop, len(reader))
+    start = max(0, min(start, stop))
+    n = stop - start
+    # Zeilenbreite auf 8 Bytes aufgerundet: classify_frames() liest die Zeilen als uint64
+    rows = np.zeros((n, -(-(2 + width) // 8) * 8), np.uint8)
+    out = {"mono": np.empty(n, np.int64), "dir": rows[:, 0], "kind": np.empty(n, np.uint8),
+           "len": np.empty(n, np.uint16), "rows": rows, "payload": rows[:, 2:2 + width]}
+    if not n:
+        return out
+    idx = np.frombuffer(reader.idx, dtype=[("off", "<u8"), ("mono", "<i8")], count=len(reader))
+    buf = np.frombuffer(reader.data, np.uint8)
+    cols = np.arange(width, dtype=np.int64)
+    hdr = CAPTURE_REC_HDR.size
+    try:
+        for a in range(start, stop, ANALYZE_CHUNK):
+            b = min(stop, a + ANALYZE_CHUNK)
+            sl = slice(a - start, b - start)
+            off = idx["off"][a:b].astype(np.int64)
+            out["mono"][sl] = idx["mono"][a:b]
+            rows[sl, 0] = buf[off + 8]
+            out["kind"][sl] = buf[off + 9]
+            ln = buf[off + 10].astype(np.uint16) | (buf[off + 11].astype(np.uint16) << 8)
+            out["len"][sl] = ln
+            rows[sl, 1] = np.minimum(ln, 255)
+            valid = cols < ln[:, None]
+            pos = np.where(valid, off[:, None] + hdr + cols, 0)
+            rows[sl, 2:2 + width] = np.where(valid, buf[pos], 0)
+    finally:
+        # Views auf das mmap freigeben, sonst scheitert reader.close()
+        del idx, buf
+    return out
+
+
+def classify_frames(arr: dict) -> dict:
+    """
+    Ergänzt arr um type (Index in ANALYZE_TYPES), seg (Segment 1..20 / 25 / 50 bei Treffern,
+    Segment bei LED Hit-Ops), ring (Index in ANALYZE_RINGS, -1), op (LED OP, -1), score.
+    decode_frame() läuft einmal pro distinktem Frame.
+    """
+    rows = arr["rows"]
+    w = arr["payload"].shape[1]
+    # distinkte Zeilen über einen 64-Bit Hash (np.unique auf uint64 statt auf Byte-Zeilen, ~3x schneller),
+    # danach geprüft; bei einer Kollision exakt über die Zeilen
+    v = rows.view(np.uint64)
+    h = v[:, 0].copy()
+    for j in range(1, v.shape[1]):
+        h *= np.uint64(0x9E3779B97F4A7C15)
+        h ^= v[:, j]
+    _, first, inv = np.unique(h, return_index=True, return_inverse=True)
+    if not (v[first][inv.ravel()] == v).all():
+        uniq, inv = np.unique(rows.view(np.dtype((np.void, rows.shape[1]))).ravel(), return_inverse=True)
+        first = None
+    u = rows[first] if first is not None else np.frombuffer(uniq.tobytes(), np.uint8).reshape(-1, rows.shape[1])
+    k = len(u)
+    u_type = np.zeros(k, np.int8)
+    u_seg = np.zeros(k, np.int8)
+    u_ring = np.full(k, -1, np.int8)
+    u_op = np.full(k, -1, np.int16)
+    u_score = np.zeros(k, np.int16)
+    for i, row in enumerate(u):
+        direction = CAPTURE_DIRS[row[0]] if row[0] < len(CAPTURE_DIRS) else "?"
+        d = decode_frame(direction, bytes(row[2:2 + min(row[1], w)]))
+        u_type[i] = ANALYZE_TYPE_CODES.get(d["type"], 0)
+        if d["type"] == "hit":
+            u_seg[i] = d["n"]
+            u_ring[i] = ANALYZE_RING_CODES[d["ring"]]
+            u_score[i] = d["score"]
+        elif d["type"] == "led":
+            u_op[i] = d["op"]
+            u_seg[i] = d.get("segment") or 0
+    inv = inv.ravel()
+    arr.update(type=u_type[inv], seg=u_seg[inv], ring=u_ring[inv], op=u_op[inv], score=u_score[inv], distinct=k)
+    return arr
+
+
+def _iat_stats(mono) -> dict:
+    if len(mono) < 2:
+        return {"count": 0}
+    iat = np.diff(mono) / 1e6
+    p50, p90, p99 = np.percentile(iat, (50, 90, 99))
+    hist, _ = np.histogram(iat, bins=list(ANALYZE_IAT_EDGES_MS) + [np.inf])
+    return {"count": int(len(iat)), "mean_ms": round(float(iat.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(iat.max()), 3),
+            "jitter_ms": round(float(iat.std()), 3),
+            "hist": {f">={e}": int(c) for e, c in zip(ANALYZE_IAT_EDGES_MS, hist)}}
+
+
+def analyze_capture(reader: CaptureReader, from_ms: int = None, to_ms: int = None,
+                    bin_s: float = ANALYZE_RATE_BIN_S) -> dict:
+    """Heatmaps, Frame-Typen, LED-OPs, Inter-Arrival und Raten pro Richtung für einen Capture (-Bereich)."""
+    t0 = time.perf_counter()
+    start = reader.index_at_wall(from_ms * 1_000_000) if from_ms is not None else 0
+    stop = reader.index_at_wall((to_ms + 1) * 1_000_000) if to_ms is not None else len(reader)
+    a = classify_frames(capture_arrays(reader, start, stop))
+    t_load = time.perf_counter() - t0
+    n = len(a["mono"])
+    rep = {"path": reader.path, "records": n, "distinct": a["distinct"]}
+    if not n:
+        return rep
+    mono, dirs, types = a["mono"], a["dir"], a["type"]
+    rep.update(first_ms=reader.wall_ns(int(mono[0])) // 1_000_000, duration_s=round((mono[-1] - mono[0]) / 1e9, 3),
+               bytes=int(a["len"].sum(dtype=np.int64)))
+    nk = len(CAPTURE_KINDS)
+    rep["kinds"] = {k: int(c) for k, c in zip(CAPTURE_KINDS, np.bincount(np.minimum(a["kind"], nk), minlength=nk + 1))
+                    if c}
+
+    nt = len(ANALYZE_TYPES)
+    counts = np.bincount(dirs.astype(np.int64) * nt + types, minlength=len(CAPTURE_DIRS) * nt)
+    rep["types"] = {d: {t: int(c) for t, c in zip(ANALYZE_TYPES, counts[i * nt:(i + 1) * nt]) if c}
+                    for i, d in enumerate(CAPTURE_DIRS)}
+
+    # Treffer: Segment x Ring (SO, SI, D, T), Bulls separat
+    hit = types == ANALYZE_TYPE_CODES["hit"]
+    seg, ring = a["seg"][hit].astype(np.int64), a["ring"][hit].astype(np.int64)
+    board = (seg >= 1) & (seg <= 20)
+    heat = np.bincount((seg[board] - 1) * 4 + ring[board], minlength=80).reshape(20, 4)
+    rings = np.bincount(ring, minlength=len(ANALYZE_RINGS))
+    rep["hits"] = {"total": int(hit.sum()), "score": int(a["score"][hit].sum(dtype=np.int64)),
+                   "rings": {r: int(c) for r, c in zip(ANALYZE_RINGS, rings)},
+                   "heatmap": {str(s + 1): heat[s].tolist() for s in range(20)}}
+
+    # LED: OP-Histogramm, Hit-OPs (01..03) pro Segment
+    led = types == ANALYZE_TYPE_CODES["led"]
+    ops = np.bincount(a["op"][led].astype(np.int64), minlength=256)
+    rep["led_ops"] = {f"{op:02X}": {"name": LED_OP_NAMES[op], "count": int(ops[op])} for op in np.flatnonzero(ops)}
+    lh = led & (a["op"] >= 1) & (a["op"] <= 3) & (a["seg"] >= 1)
+    lheat = np.bincount((a["seg"][lh].astype(np.int64) - 1) * 3 + a["op"][lh] - 1, minlength=60).reshape(20, 3)
+    rep["led_hits"] = {str(s + 1): lheat[s].tolist() for s in range(20) if lheat[s].any()}
+
+    # Inter-Arrival pro Richtung, Treffer separat (Abstand zwischen Würfen)
+    rep["iat"] = {d: _iat_stats(mono[dirs == i]) for i, d in enumerate(CAPTURE_DIRS)}
+    rep["iat"]["hits"] = _iat_stats(mono[hit])
+
+    # Rate pro Richtung in bin_s Schritten
+    bins = ((mono - mono[0]) // int(bin_s * 1e9)).astype(np.int64)
+    nb = int(bins[-1]) + 1
+    rep["rate"] = {"bin_s": bin_s}
+    for i, d in enumerate(CAPTURE_DIRS):
+        r = np.bincount(bins[dirs == i], minlength=nb)
+        rep["rate"][d] = {"peak_fps": round(float(r.max()) / bin_s, 1), "mean_fps": round(float(r.mean()) / bin_s, 1),
+                          "series": r.tolist()}
+    rep["seconds"] = {"load": round(t_load, 3), "total": round(time.perf_counter() - t0, 3)}
+    return rep
+
+
+# Byte-Varianz pro Frame-Gruppe (Reverse Engineering unbekannter LED/Settings Frames):
+# Gruppen = Länge (+ OP-Byte bei MINE_OP_LENGTHS), pro Byte-Position Anzahl Werte, Entropie,
+# häufigste Werte und – wo Frames kommentiert sind – wie gut der Wert den Kommentar vorhersagt
+# (Unsicherheitskoeffizient U(Kommentar|Byte): 0 = unabhängig, 1 = Byte bestimmt den Kommentar).
+MINE_WIDTH = 32
+MINE_OP_LENGTHS = (16,)         # Byte 0 ist ein OP-Code (LED 16-Byte Frames)
+MINE_MIN_COUNT = 2
+MINE_TOP = 4
+# Kommentare als Label: nur von Hand gesetzte. Sweep/Animation/Replay schreiben eindeutige Kommentare
+# pro Frame (Koordinaten, Frame-Nummer) -> triviale Korrelation (U = 1 auf dem Sweep-Byte).
+MINE_LABEL_KINDS = ("ble", "manual", "import")
+MINE_AUTO_COMMENTS = ("sweep ", "anim ", "response to sweep ")   # Präfixe, auch auf kind "ble"
+
+
+def record_arrays(records, width: int = MINE_WIDTH):
+    """Wie capture_arrays(), aber aus Export-Records (z.B. export_from_logstore); liefert (arrays, Kommentare)."""
+    mono, dirs, kinds, lens, data, notes = [], [], [], [], bytearray(), {}
+    stride = -(-(2 + width) // 8) * 8
+    for i, r in enumerate(records):
+        p = r["payload"][:width]
+        mono.append(r["wall_ns"])
+        dirs.append(CAPTURE_DIR_CODES.get(r["dir"], 255))
+        kinds.append(CAPTURE_KIND_CODES.get(r["kind"], 255))
+        lens.append(len(r["payload"]))
+        data += bytes(2) + p + bytes(stride - 2 - len(p))
+        if r.get("comment"):
+            notes[i] = r["comment"]
+    rows = np.frombuffer(bytes(data), np.uint8).reshape(-1, stride).copy()
+    lens = np.array(lens, np.uint16)
+    rows[:, 0] = dirs
+    rows[:, 1] = np.minimum(lens, 255)
+    return {"mono": np.array(mono, np.int64), "dir": rows[:, 0], "kind": np.array(kinds, np.uint8), "len": lens,
+            "rows": rows, "payload": rows[:, 2:2 + width]}, notes
+
+
+def _entropy(counts):
+    # Entropie in Bit je Zeile einer Häufigkeitsmatrix
+    counts = np.atleast_2d(counts).astype(np.float64)
+    p = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    return -(p * np.log2(np.where(p > 0, p, 1))).sum(axis=1)
+
+
+def mine_labels(arr: dict, comments: dict, label_kinds=None) -> dict:
+    """
+    Kommentare, die als Label zählen: label_kinds None = MINE_LABEL_KINDS ohne automatische
+    Kommentare (MINE_AUTO_COMMENTS), sonst alle Kommentare der angegebenen kinds.
+    """
+    if not comments:
+        return {}
+    auto = MINE_AUTO_COMMENTS if label_kinds is None else ()
+    codes = [CAPTURE_KIND_CODES[k] for k in (label_kinds or MINE_LABEL_KINDS)]
+    idx = np.array(list(comments), np.int64)
+    ok = np.isin(arr["kind"][idx], codes)
+    return {i: c for i, c, k in zip(comments, comments.values(), ok.tolist()) if k and not c.startswith(auto)}
+
+
+def mine_bytes(arr: dict, comments: dict = None, direction: str = "app->board", kinds=None,
+               min_count: int = MINE_MIN_COUNT, label_kinds=None) -> list:
+    """
+    Gruppiert die Frames einer Richtung nach Länge (+ OP-Byte) und wertet jede Byte-Position aus.
+    comments = {Zeile in arr: Kommentar}, gefiltert per mine_labels(). Liefert Gruppen absteigend nach Anzahl.
+    """
+    comments = mine_labels(arr, comments, label_kinds)
+    sel = arr["dir"] == CAPTURE_DIR_CODES[direction]
+    if kinds:
+        sel &= np.isin(arr["kind"], [CAPTURE_KIND_CODES[k] for k in kinds])
+    rows = np.flatnonzero(sel)
+    pay, lens = arr["payload"][rows], arr["len"][rows].astype(np.int64)
+    width = pay.shape[1]
+    op = np.where(np.isin(lens, MINE_OP_LENGTHS), pay[:, 0].astype(np.int64), -1)
+    keys, ginv, gcount = np.unique(lens * 512 + op + 1, return_inverse=True, return_counts=True)
+    order = np.argsort(ginv.ravel(), kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(gcount)))
+    noted = np.array(sorted(comments), np.int64)
+
+    groups = []
+    for g, key in enumerate(keys):
+        if gcount[g] < min_count:
+            continue
+        n_len, g_op = int(key) // 512, int(key) % 512 - 1
+        members = order[bounds[g]:bounds[g + 1]]
+        L = min(n_len, width)
+        sub = pay[members, :L].astype(np.int64)
+        # alle Positionen in einem bincount: Zeile = Position, Spalte = Byte-Wert
+        counts = np.bincount((sub + np.arange(L) * 256).ravel(), minlength=L * 256).reshape(L, 256)
+        distinct = (counts > 0).sum(axis=1)
+        ent = _entropy(counts)
+        top = np.argsort(-counts, axis=1, kind="stable")[:, :MINE_TOP]
+
+        # kommentierte Frames dieser Gruppe
+        hit = np.isin(rows[members], noted)
+        labels = [comments[int(r)] for r in rows[members][hit]]
+        csub = sub[hit]
+        cid = None
+        if len(set(labels)) > 1:
+            names, cid = np.unique(np.array(labels, dtype=object).astype(str), return_inverse=True)
+            cid = cid.ravel()
+            h_c = _entropy(np.bincount(cid))[0]
+
+        positions = []
+        for pos in np.flatnonzero(distinct > 1):
+            p = {"pos": int(pos), "distinct": int(distinct[pos]), "entropy": round(float(ent[pos]), 3),
+                 "top": [[int(v), round(float(counts[pos, v]) / len(members), 4)] for v in top[pos]
+                         if counts[pos, v]]}
+            if labels:
+                by = {}
+                for lab, v in zip(labels, csub[:, pos].tolist()):
+                    by.setdefault(lab, {}).setdefault(v, 0)
+                    by[lab][v] += 1
+                p["by_comment"] = {lab: max(vs, key=vs.get) for lab, vs in by.items()}
+            if cid is not None:
+                joint = np.bincount(csub[:, pos] * len(names) + cid, minlength=256 * len(names))
+                joint = joint.reshape(256, len(names))
+                # U(C|V) = (H(C) - H(C|V)) / H(C), H(C|V) = sum_v p(v) H(C|v)
+                pv = joint.sum(axis=1) / len(cid)
+                p["comment_u"] = round((h_c - float((pv * _entropy(joint)).sum())) / h_c, 3)
+            positions.append(p)
+
+        groups.append({
+            "len": n_len, "op": g_op if g_op >= 0 else None,
+            "op_name": LED_OP_NAMES[g_op] if g_op >= 0 else None,
+            "count": int(gcount[g]), "commented": len(labels), "truncated": n_len > width,
+            "pattern": [int(counts[pos].argmax()) if distinct[pos] == 1 else None for pos in range(L)],
+            "positions": positions,
+        })
+    groups.sort(key=lambda gr: -gr["count"])
+    return groups
+
+
+# =========================
+# Persistence stage (group commit)
+# =========================
+class LogWriter:
+    """
+    Entkoppelt Logging vom Hot Path: submit() ist nur ein deque.append (thread-safe, kein Lock),
+    der Writer-Thread schreibt alle LOG_FLUSH_MS bzw. LOG_FLUSH_RECORDS gebündelt in den LogStore
+    und published danach an den EventHub.
+    build (optional) macht im Writer-Thread aus dem Roh-Record den Log-Eintrag.
+    capture (optional, CaptureWriter) bekommt zusätzlich den Roh-Batch, die Record-Nummer
+    landet als "rec" im Eintrag.
+    """
+    def __init__(self, logstore: LogStore, hub, max_queue: int = LOG_QUEUE_MAX,
+                 flush_ms: int = LOG_FLUSH_MS, flush_records: int = LOG_FLUSH_RECORDS,
+                 fsync: str = LOG_FSYNC, fsync_interval: float = LOG_FSYNC_INTERVAL_SEC,
+                 build=None, capture=None):
+        self.logstore = logstore
+        self.hub = hub
+        self.build = build
+        self.capture = capture
+        self.max_queue = max_queue
+        self.flush_interval = flush_ms / 1000.0
+        self.flush_records = flush_records
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self.q = deque()
+        self._wake = threading.Event()
+        self._stop = False
+        self.thread = None
+        self._last_fsync = time.monotonic()
+
+        # counters
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.last_batch = 0
+        self.max_batch = 0
+        self.max_depth = 0
+        self.fsyncs = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop = True
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def submit(self, rec) -> bool:
+        depth = len(self.q)
+        if depth >= self.max_queue:
+            self.dropped += 1
+            return False
+        self.q.append(rec)
+        self.submitted += 1
+        if depth >= self.max_depth:
+            self.max_depth = depth + 1
+        if depth + 1 >= self.flush_records:
+            self._wake.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stop
+            try:
+                self._drain()
+            except Exception as e:
+                log(f"⚠️ LogWriter flush failed: {e}")
+            if stopping:
+                break
+        if self.fsync != "off":
+            self.logstore.sync()
+            if self.capture is not None:
+                self.capture.sync()
+
+    def _drain(self):
+        while self.q:
+            batch = []
+            while self.q and len(batch) < self.flush_records:
+                batch.append(self.q.popleft())
+            raw = batch
+            if self.build:
+                batch = [self.build(rec) for rec in batch]
+
+            t0 = time.perf_counter()
+            if self.capture is not None:
+                for i, entry in enumerate(batch, self.capture.append_recs(raw)):
+                    entry["rec"] = i
+            self.logstore.add_many(batch)
+            if self.fsync == "batch":
+                self._fsync()
+            elif self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            self.last_flush_ms = (time.perf_counter() - t0) * 1000.0
+
+            self.batches += 1
+            self.written += len(batch)
+            self.last_batch = len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+
+            self.hub.publish_many([{"type": "log", "entry": entry} for entry in batch])
+
+    def _fsync(self):
+        self.logstore.sync()
+        if self.capture is not None:
+            self.capture.sync()
+        self.fsyncs += 1
+        self._last_fsync = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self.q),
+            "queue_max": self.max_queue,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_batch": self.last_batch,
+            "max_batch": self.max_batch,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0,
+            "fsync": self.fsync,
+            "fsyncs": self.fsyncs,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+
+# =========================
+# Event fanout (SSE)
+# =========================
+class EventHub:
+    """
+    Ein gemeinsamer Ring-Buffer für alle SSE-Clients.
+    - publish(): Event bekommt eine fortlaufende Sequenz-ID, O(1) egal wie viele Clients offen sind
+      und wird dabei genau einmal nach JSON serialisiert (alle Clients senden denselben String)
+    - jeder Client hält nur einen Cursor (letzte gesehene ID) und liest mit read()
+    - Reconnect setzt per Last-Event-ID fort; ist der Cursor aus dem Ring gefallen, gibt es ein "gap" Event
+    - die SSE-ID ist "<boot>-<seq>": seq beginnt bei jedem Proxy-Start bei 0, eine fremde Boot-ID ist immer ein gap
+    """
+    RESET = -1   # Cursor für "Last-Event-ID aus einem anderen Proxy-Lauf"
+
+    def __init__(self, size: int = EVENT_RING_SIZE):
+        self.size = size
+        self.ring = [None] * size
+        self.seq = 0
+        self.boot = f"{int(time.time() * 1000):x}"
+        self.cond = threading.Condition()
+        self.clients = 0
+        # asyncio-Leser (Web-Server): ein Event pro "Generation", wird beim Publish ersetzt
+        self.loop = None
+        self._aevt = None
+
+    def attach_loop(self, loop):
+        self.loop = loop
+        self._aevt = asyncio.Event()
+
+    def _wake_async(self):
+        evt, self._aevt = self._aevt, asyncio.Event()
+        evt.set()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def subscribe(self, last_id=None) -> int:
+        with self.cond:
+            self.clients += 1
+            if not last_id:
+                return self.seq
+            boot, _, seq = str(last_id).rpartition("-")
+            if boot != self.boot or not seq.isdigit():
+                return self.RESET
+            return int(seq)
+
+    def unsubscribe(self, _cursor=None):
+        with self.cond:
+            self.clients = max(0, self.clients - 1)
+
+    def publish(self, event: dict):
+        self.publish_many([event])
+
+    def publish_many(self, events):
+        events = list(events)
+        # außerhalb des Locks serialisieren
+        encoded = [json.dumps(ev, ensure_ascii=False, separators=(",", ":")) for ev in events]
+        with self.cond:
+            for ev, enc in zip(events, encoded):
+                self.seq += 1
+                self.ring[self.seq % self.size] = (self.seq, ev, enc)
+            self.cond.notify_all()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._wake_async)
+
+    def read(self, cursor: int, timeout: float = 15.0, max_items: int = 500):
+        """
+        Liefert (events, new_cursor, gap). events = [(seq, event, json_str), ...] nach cursor.
+        gap = {"type":"gap", ...} falls Events verpasst wurden (Client zu langsam / Proxy neu gestartet).
+        """
+        with self.cond:
+            gap = None
+            if cursor < 0 or cursor > self.seq:
+                # Proxy neu gestartet (andere Boot-ID): alte IDs ungültig
+                gap = {"type": "gap", "reset": True, "from": self.seq, "to": self.seq, "missed": None}
+                cursor = self.seq
+            elif cursor == self.seq:
+                self.cond.wait_for(lambda: self.seq > cursor, timeout)
+            head = self.seq
+            oldest = max(1, head - self.size + 1)
+            if cursor + 1 < oldest:
+                gap = {"type": "gap", "reset": False, "from": cursor + 1, "to": oldest - 1,
+                       "missed": oldest - 1 - cursor}
+                cursor = oldest - 1
+            end = min(head, cursor + max_items)
+            events = [self.ring[i % self.size] for i in range(cursor + 1, end + 1)]
+            return events, end, gap
+
+    async def aread(self, cursor: int, timeout: float = 15.0, max_items: int = 500):
+        """read() für asyncio (nur im Loop von attach_loop aufrufen)."""
+        if cursor == self.seq and self._aevt is not None:
+            evt = self._aevt
+            try:
+                await asyncio.wait_for(evt.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.read(cursor, timeout=0, max_items=max_items)
+
+    def stats(self) -> dict:
+        return {"boot": self.boot, "seq": self.seq, "ring": self.size, "clients": self.clients}
+
+
+# =========================
+# Stand-ins ohne dbus-python / PyGObject (Loopback, Benchmarks)
+# =========================
+class _DbusStandIn:
+    """
+    Ersatz für dbus / dbus.service, wenn dbus-python fehlt: die GATT-Klassen unten lassen sich
+    definieren und ohne Bus instanziieren (Decorators ohne Wirkung, D-Bus Typen = Python-Werte).
+    """
+    class service:
+        class Object:
+            def __init__(self, conn=None, object_path=None):
+                pass
+
+        @staticmethod
+        def method(*_a, **_k):
+            return lambda f: f
+
+        signal = method
+
+    @staticmethod
+    def _value(v, **_k):
+        return v
+
+    ObjectPath = String = Boolean = Byte = UInt16 = _value
+
+    @staticmethod
+    def Array(values, signature=None):
+        return list(values)
+
+
+HAVE_BLUEZ = dbus is not None
+HAVE_GLIB = GLib is not None
+if dbus is None:
+    dbus = _DbusStandIn
+
+
+class AsyncioGLib:
+    """
+    GLib-Ersatz (idle_add / timeout_add / source_remove) auf einem asyncio Loop, wenn PyGObject fehlt.
+    Wie bei GLib läuft ein Callback, der True liefert, erneut; idle_add geht aus jedem Thread.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self._ids = itertools.count(1)
+        self._live = set()
+
+    def _add(self, delay: float, fn, args) -> int:
+        sid = next(self._ids)
+        live, loop = self._live, self.loop
+        live.add(sid)
+
+        def run():
+            if sid not in live:
+                return
+            if not fn(*args):
+                live.discard(sid)
+            elif delay:
+                loop.call_later(delay, run)
+            else:
+                loop.call_soon(run)
+
+        if delay:
+            loop.call_soon_threadsafe(loop.call_later, delay, run)
+        else:
+            loop.call_soon_threadsafe(run)
+        return sid
+
+    def idle_add(self, fn, *args) -> int:
+        return self._add(0, fn, args)
+
+    def timeout_add(self, ms: int, fn, *args) -> int:
+        return self._add(ms / 1000.0, fn, args)
+
+    def source_remove(self, sid: int):
+        self._live.discard(sid)
+
+
+# =========================
+# GATT Base classes
+# =========================
+class Application(dbus.service.Object):
+    """
+    org.freedesktop.DBus.ObjectManager
+    """
+    def __init__(self, bus):
+        self.path = f"{BASE}/app"
+        self.services = []
+        super().__init__(bus, self.path)
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    def add_service(self, service):
+        self.services.append(service)
+
+    @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}")
+    def GetManagedObjects(self):
+        response = {}
+        for service in self.services:
+            response[service.get_path()] = service.get_properties()
+            for chrc in service.characteristics:
+                response[chrc.get_path()] = chrc.get_properties()
+        return response
+
+
+class Service(dbus.service.Object):
+    def __init__(self, bus, index, uuid, primary=True):
+        self.path = f"{BASE}/service{index}"
+        self.bus = bus
+        self.uuid = uuid
+        self.primary = primary
+        self.characteristics = []
+        super().__init__(bus, self.path if bus is not None else None)   # bus=None: nicht exportiert (Loopback)
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    def add_characteristic(self, chrc):
+        self.characteristics.append(chrc)
+
+    def get_properties(self):
+        return {
+            GATT_SERVICE_IFACE: {
+                "UUID": dbus.String(self.uuid),
+                "Primary": dbus.Boolean(self.primary),
+                "Characteristics": dbus.Array([c.get_path() for c in self.characteristics], signature="o"),
+            }
+        }
+
+
+class Characteristic(dbus.service.Object):
+    def __init__(self, bus, index, uuid, flags, service: Service):
+        self.path = f"{service.path}/char{index}"
+        self.bus = bus
+        self.uuid = uuid
+        self.flags = flags
+        self.service = service
+        self.value = bytearray()
+        self.notifying = False
+        super().__init__(bus, self.path if bus is not None else None)
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    def get_properties(self):
+        return {
+            GATT_CHRC_IFACE: {
+                "Service": self.service.get_path(),
+                "UUID": dbus.String(self.uuid),
+                "Flags": dbus.Array([dbus.String(f) for f in self.flags], signature="s"),
+                "Value": dbus.Array([dbus.Byte(b) for b in self.value], signature="y"),
+            }
+        }
+
+    @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
+    def GetAll(self, interface):
+        if interface != GATT_CHRC_IFACE:
+            return {}
+        return self.get_properties()[GATT_CHRC_IFACE]
+
+    @dbus.service.signal(DBUS_PROP_IFACE, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+    def _props_changed_value(self):
+        self.PropertiesChanged(
+            GATT_CHRC_IFACE,
+            {"Value": dbus.Array([dbus.Byte(b) for b in self.value], signature="y")},
+            []
+        )
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
+    def ReadValue(self, options):
+        return dbus.Array([dbus.Byte(b) for b in self.value], signature="y")
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
+    def WriteValue(self, value, options):
+        self.value = bytearray(value)
+
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StartNotify(self):
+        self.notifying = True
+
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StopNotify(self):
+        self.notifying = False
+
+
+# =========================
+# Advertisement (minimal, BlueZ-safe)
+# =========================
+class Advertisement(dbus.service.Object):
+    def __init__(self, bus, index):
+        self.path = f"{BASE}/advertisement{index}"
+        self.bus = bus
+        super().__init__(bus, self.path)
+
+        self.ad_type = "peripheral"
+        self.local_name = PROXY_LOCAL_NAME
+        self.service_uuids = [VENDOR_SERVICE_UUID]
+        self.appearance = 0x0000
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
 
     def get_properties(self):
         return {
@@ -359,6 +2618,988 @@ class Advertisement(dbus.service.Object):
         log("📢 Advertisement released")
 
 
+# =========================
+# Handshake replay (non-blocking)
+# =========================
+class HandshakeReplay:
+    """
+    Spielt gepufferte Board->App Frames nach StartNotify per GLib.timeout_add ab (ein Frame pro Tick).
+    Der GLib-Loop bleibt frei: App-Writes und neue Live-Notifies laufen zwischen den Ticks weiter.
+    """
+    def __init__(self, state, platform: str = HANDSHAKE_PLATFORM, max_age: float = HANDSHAKE_MAX_AGE_SEC):
+        self.state = state
+        self.platform = platform
+        self.max_age = max_age
+        self.pending = deque()
+        self.source = None
+        # stats
+        self.total = 0
+        self.sent = 0
+        self.dropped_stale = 0
+        self.started = None
+
+    @property
+    def pace_ms(self) -> int:
+        return HANDSHAKE_PACING_MS.get(self.platform, HANDSHAKE_PACING_MS["ios"])
+
+    def start(self, frames):
+        """frames = [(monotonic_sec, payload), ...] älteste zuerst."""
+        self.cancel()
+        self.pending = deque(frames)
+        self.total, self.sent, self.dropped_stale = len(frames), 0, 0
+        self.started = time.monotonic()
+        log(f"[HANDSHAKE] ▶️ Replaying {len(frames)} buffered REAL notify frames to APP "
+            f"({self.platform}, {self.pace_ms} ms/frame)...")
+        self.source = GLib.timeout_add(self.pace_ms, self._tick)
+
+    def cancel(self):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+        self.pending.clear()
+
+    def _tick(self):
+        st = self.state
+        if not st.app_subscribed or not st.app_notify_char:
+            log(f"[HANDSHAKE] ⏹️ App unsubscribed, {len(self.pending)} frames not replayed")
+            return self._done()
+
+        now = time.monotonic()
+        while self.pending:
+            t, payload = self.pending.popleft()
+            if self.max_age and now - t > self.max_age:
+                self.dropped_stale += 1
+                continue
+            try:
+                st.app_notify_char.send_notify(payload)
+                self.sent += 1
+            except Exception as e:
+                log(f"[HANDSHAKE] ⚠️ Replay failed: {e}")
+                return self._done()
+            break
+
+        if not self.pending:
+            log(f"[HANDSHAKE] ✅ Replay done: {self.sent} sent, {self.dropped_stale} stale dropped, "
+                f"{(time.monotonic() - self.started) * 1000:.0f} ms")
+            return self._done()
+        return True   # GLib: Timer weiterlaufen lassen
+
+    def _done(self):
+        self.source = None
+        self.pending.clear()
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "active": self.source is not None,
+            "platform": self.platform,
+            "pace_ms": self.pace_ms,
+            "max_age_sec": self.max_age,
+            "total": self.total,
+            "sent": self.sent,
+            "pending": len(self.pending),
+            "dropped_stale": self.dropped_stale,
+        }
+
+
+# =========================
+# Replay engine (Capture / Log -> Proxy)
+# =========================
+REPLAY_MAX_INFLIGHT = 256   # max. Frames, die noch im GLib-Loop / in der Upstream-Queue stecken (Backpressure)
+REPLAY_LOG_MAX = 200000     # Quelle LogStore: so viele Einträge werden höchstens geladen
+capture_kind("replay", 3)
+
+
+class CaptureReplaySource:
+    """Records [start, stop) eines Captures, Zugriff per Index (mmap), nichts wird vorab geladen."""
+    def __init__(self, path: str, from_ms: int = None, to_ms: int = None):
+        self.reader = CaptureReader(path)
+        r = self.reader
+        self.name = os.path.basename(r.path)
+        self.start = r.index_at_wall(from_ms * 1_000_000) if from_ms is not None else 0
+        self.stop = r.index_at_wall((to_ms + 1) * 1_000_000) if to_ms is not None else len(r)
+
+    def __len__(self):
+        return max(0, self.stop - self.start)
+
+    def mono(self, i: int) -> int:
+        return self.reader.mono_at(self.start + i)
+
+    def record(self, i: int):
+        return self.reader.record(self.start + i)
+
+    def close(self):
+        self.reader.close()
+
+
+class LogReplaySource:
+    """Zeitbereich aus dem LogStore (ohne Capture), per Keyset geladen, höchstens REPLAY_LOG_MAX Einträge."""
+    def __init__(self, store: LogStore, from_ms: int = None, to_ms: int = None):
+        self.name = "log"
+        self.records = []
+        for r in export_from_logstore(store, from_ms, to_ms):
+            self.records.append((r["wall_ns"], r["dir"], r["kind"], r["payload"]))
+            if len(self.records) >= REPLAY_LOG_MAX:
+                break
+
+    def __len__(self):
+        return len(self.records)
+
+    def mono(self, i: int) -> int:
+        return self.records[i][0]
+
+    def record(self, i: int):
+        return self.records[i]
+
+    def close(self):
+        self.records = []
+
+
+class ReplayEngine:
+    """
+    Spielt eine Quelle (CaptureReplaySource / LogReplaySource) durch den Proxy: board->app an die App
+    (GLib.idle_add), app->board über Upstream, jeweils mit kind "replay" im Log.
+    speed 1.0 = Originaltiming, 2.0 = doppelt so schnell, 0 = so schnell wie möglich (Stresstest).
+    Eigener Thread; Zeitplan relativ zu einem Anker (kein Drift), Pause/Seek/Speed setzen den Anker neu.
+    Backpressure statt Verwerfen: wartet, wenn GLib, Upstream-Queue oder LogWriter hinterherhängen.
+    """
+    def __init__(self, state):
+        self.state = state
+        self.src = None
+        self.thread = None
+        self._wake = threading.Event()
+        self.status = "idle"
+        self.speed = 1.0
+        self.dirs = CAPTURE_DIRS
+        self.pos = 0
+        self.records = 0
+        self.duration_ns = 0
+        self.position_ns = 0
+        self._first = 0
+        self._stopping = False
+        self._paused = False
+        self._seek = None
+        self._reanchor = False
+        self._t0 = self._m0 = 0
+        # stats
+        self.emitted = 0
+        self.skipped = 0
+        self.throttled = 0
+        self.late_max_ns = 0
+        self.started = None
+        self.active_ns = 0
+        self._t_active = 0
+        self._scheduled = 0   # nur Replay-Thread
+        self._delivered = 0   # nur GLib-Thread
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, src, speed: float = 1.0, dirs=CAPTURE_DIRS):
+        self.stop()
+        self.src = src
+        self.speed = max(0.0, float(speed))
+        self.dirs = tuple(dirs)
+        self.pos = 0
+        self.records = len(src)
+        self._first = src.mono(0) if self.records else 0
+        self.duration_ns = src.mono(self.records - 1) - self._first if self.records else 0
+        self.position_ns = 0
+        self._stopping = self._paused = False
+        self._seek = None
+        self.emitted = self.skipped = self.throttled = self.late_max_ns = self.active_ns = 0
+        self.started = time.time()
+        self.status = "running"
+        log(f"⏯️ Replay {src.name}: {len(src)} records, speed {'max' if not self.speed else self.speed}, "
+            f"{'+'.join(self.dirs)}")
+        self.thread = threading.Thread(target=self._run, name="replay", daemon=True)
+        self.thread.start()
+
+    def pause(self):
+        if self.running:
+            self._paused = True
+            self.status = "paused"
+            self._wake.set()
+
+    def resume(self):
+        if self.running and self._paused:
+            self._paused = False
+            self._reanchor = True
+            self.status = "running"
+            self._wake.set()
+
+    def seek(self, offset_s: float):
+        """Sprung auf Sekunde offset_s ab Beginn der Quelle."""
+        if not self.running or not self.records:
+            return
+        src = self.src
+        self._seek = bisect.bisect_left(range(self.records), self._first + int(offset_s * 1e9), key=src.mono)
+        self._wake.set()
+
+    def set_speed(self, speed: float):
+        self.speed = max(0.0, float(speed))
+        self._reanchor = True
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        if self.running:
+            self._stopping = True
+            self._wake.set()
+            self.thread.join(timeout)
+
+    def _anchor(self, i: int):
+        self._t0 = time.monotonic_ns()
+        self._m0 = self.src.mono(i)
+        self._reanchor = False
+
+    def _to_app(self, payload: bytes):
+        self.state._send_to_app(payload)
+        self._delivered += 1
+        return False
+
+    def _backpressure(self) -> bool:
+        st = self.state
+        if self._scheduled - self._delivered > REPLAY_MAX_INFLIGHT:
+            return True
+        if st.upstream and len(st.upstream.wq) > REPLAY_MAX_INFLIGHT:
+            return True
+        return bool(st.writer and len(st.writer.q) > st.writer.max_queue // 2)
+
+    def _emit(self, direction: str, payload: bytes):
+        st = self.state
+        if direction == "board->app":
+            if st.app_subscribed and st.app_notify_char is not None:
+                self._scheduled += 1
+                GLib.idle_add(self._to_app, payload)   # eigener Thread -> immer über den GLib-Loop
+        else:
+            st.forward_write_to_real(payload)
+        st._emit_ui(direction, payload, kind="replay")
+
+    def _run(self):
+        src = self.src
+        n = len(src)
+        i = 0
+        self._t_active = time.monotonic_ns()
+        try:
+            if n:
+                self._anchor(0)
+            while i < n and not self._stopping:
+                if self._seek is not None:
+                    i, self._seek = self._seek, None
+                    self.pos = i
+                    if i >= n:
+                        break
+                    self.position_ns = src.mono(i) - self._first
+                    self._anchor(i)
+                    continue
+                if self._paused:
+                    self.active_ns += time.monotonic_ns() - self._t_active
+                    self._wake.wait(0.25)
+                    self._wake.clear()
+                    self._t_active = time.monotonic_ns()
+                    continue
+                if self._reanchor:
+                    self._anchor(i)
+                mono_ns, direction, kind, payload = src.record(i)
+                if kind == "replay" or direction not in self.dirs:
+                    # keine Rückkopplung, wenn der laufende Capture schon Replays enthält
+                    self.skipped += 1
+                    i += 1
+                    continue
+                if self.speed:
+                    wait = self._t0 + int((mono_ns - self._m0) / self.speed) - time.monotonic_ns()
+                    if wait > 0:
+                        self._wake.wait(min(wait / 1e9, 0.25))
+                        self._wake.clear()
+                        continue
+                    if -wait > self.late_max_ns:
+                        self.late_max_ns = -wait
+                while self._backpressure() and not self._stopping:
+                    self.throttled += 1
+                    time.sleep(0.001)
+                self._emit(direction, bytes(payload))
+                self.emitted += 1
+                i += 1
+                self.pos = i
+                self.position_ns = mono_ns - self._first
+            self.status = "stopped" if self._stopping else "done"
+        except Exception as e:
+            self.status = "error"
+            log(f"⚠️ Replay failed: {e}")
+        finally:
+            self.active_ns += time.monotonic_ns() - self._t_active
+            src.close()
+        log(f"⏹️ Replay {self.status}: {self.emitted} frames in {self.active_ns / 1e9:.2f} s")
+
+    def stats(self) -> dict:
+        active = self.active_ns
+        if self.running and not self._paused:
+            active += time.monotonic_ns() - self._t_active
+        return {
+            "status": self.status,
+            "source": self.src.name if self.src is not None else None,
+            "records": self.records,
+            "pos": self.pos,
+            "position_s": round(self.position_ns / 1e9, 3),
+            "duration_s": round(self.duration_ns / 1e9, 3),
+            "speed": self.speed,
+            "dirs": list(self.dirs),
+            "emitted": self.emitted,
+            "skipped": self.skipped,
+            "throttled": self.throttled,
+            "fps": round(self.emitted / (active / 1e9), 1) if active > 0 else 0,
+            "late_max_ms": round(self.late_max_ns / 1e6, 3),
+        }
+
+
+# =========================
+# Sweep jobs (LED Frame-Exploration über Upstream)
+# =========================
+# Template + Achsen (Byte-Positionen mit Wertebereich) -> kartesisches Produkt, letzte Achse läuft am
+# schnellsten. Tempo: höchstens SWEEP_MAX_INFLIGHT Frames warten in der Upstream-Queue, d.h. der
+# Sweep läuft so schnell, wie der Link Writes abnimmt (optional mindestens gap_ms Abstand).
+# Board-Antworten innerhalb window_ms werden dem zuletzt ans Board geschriebenen Schritt zugeordnet
+# (den Zeitpunkt meldet Upstream per on_sent, nicht das Einreihen in die Queue).
+SWEEP_MAX_STEPS = 65536
+SWEEP_MAX_INFLIGHT = 4
+SWEEP_WINDOW_MS = 250
+SWEEP_DRAIN_MAX_MS = 2000       # nach dem letzten Schritt höchstens so lange auf die Upstream-Queue warten
+SWEEP_RESULTS_MAX = 4096        # Schritte mit Antwort, die im Status gehalten werden
+SWEEP_RESPONSES_PER_STEP = 8
+capture_kind("fuzz", 4)
+
+
+def sweep_axes(template: bytes, axes) -> list:
+    """
+    Achsen prüfen und normalisieren. Eingabe je Achse:
+      {"pos": 12 | [1, 2, 3], "size": 1 | 2 (Little Endian), "from": 0, "to": 255, "step": 1}  oder  "values": [..]
+    Mehrere Positionen bekommen denselben Wert (z.B. Grau über R, G, B).
+    """
+    if not axes:
+        raise ValueError("at least one axis required")
+    out = []
+    total = 1
+    for ax in axes:
+        pos = ax.get("pos")
+        pos = [int(p) for p in (pos if isinstance(pos, list) else [pos])]
+        size = int(ax.get("size", 1))
+        if not 1 <= size <= 4:
+            raise ValueError("size must be 1..4")
+        if not pos or any(p < 0 or p + size > len(template) for p in pos):
+            raise ValueError(f"pos {pos} outside template ({len(template)} bytes)")
+        if "values" in ax:
+            values = [int(v, 0) if isinstance(v, str) else int(v) for v in ax["values"]]
+        else:
+            step = int(ax.get("step", 1))
+            if step < 1:
+                raise ValueError("step must be >= 1")
+            values = list(range(int(ax.get("from", 0)), int(ax.get("to", 256 ** size - 1)) + 1, step))
+        if not values or any(not 0 <= v < 256 ** size for v in values):
+            raise ValueError(f"values for pos {pos} must be 0..{256 ** size - 1}")
+        total *= len(values)
+        if total > SWEEP_MAX_STEPS:
+            raise ValueError(f"more than {SWEEP_MAX_STEPS} steps")
+        name = "+".join(f"b{p}" if size == 1 else f"b{p}-{p + size - 1}" for p in pos)
+        out.append({"pos": pos, "size": size, "values": values, "name": name})
+    return out
+
+
+def sweep_frame(template: bytes, axes: list, i: int):
+    """Frame und Koordinaten für Schritt i (gemischte Basis, letzte Achse zuerst)."""
+    buf = bytearray(template)
+    coords = {}
+    for ax in reversed(axes):
+        i, k = divmod(i, len(ax["values"]))
+        v = ax["values"][k]
+        raw = v.to_bytes(ax["size"], "little")
+        for p in ax["pos"]:
+            buf[p:p + ax["size"]] = raw
+        coords[ax["name"]] = v
+    return bytes(buf), {a["name"]: coords[a["name"]] for a in axes}
+
+
+class SweepEngine:
+    """
+    Ein Sweep zur Zeit, als Task im Upstream-Loop: Writes gehen ohne Thread-Hop direkt in die
+    Upstream-Queue (Tiefe daher exakt), Board-Notifies kommen im selben Thread an.
+    Jeder Frame geht ohne Coalescing raus und landet mit kind "fuzz" und den Koordinaten als
+    Kommentar im Log; Board-Antworten bekommen den Schritt als Kommentar.
+    """
+    def __init__(self, state):
+        self.state = state
+        self.future = None
+        self.loop = None
+        self._wake = None
+        self._ids = itertools.count(1)
+        self.id = 0
+        self.status = "idle"
+        self.active = False         # True bis das Antwortfenster nach dem letzten Frame abgelaufen ist
+        self.template = b""
+        self.axes = []
+        self.total = 0
+        self.pos = 0
+        self.gap_ns = 0
+        self.window_ns = SWEEP_WINDOW_MS * 1_000_000
+        self._sent = deque(maxlen=64)     # (t_write, Schritt), Reihenfolge wie geschrieben
+        self._stopping = False
+        self._paused = False
+        # stats
+        self.throttled = 0
+        self.written = 0
+        self.responses = 0
+        self.acks = 0
+        self.results = OrderedDict()      # Schritt -> {"step", "coords", "frame", "responses"}
+        self.started = None
+        self.active_ns = 0
+        self._t_active = 0
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    def start(self, template: bytes, axes, gap_ms: float = 0.0, window_ms: float = SWEEP_WINDOW_MS):
+        up = self.state.upstream
+        if not (up and up.loop and up.client and up.client.is_connected):
+            raise ValueError("REAL board not connected")
+        axes = sweep_axes(template, axes)
+        # kein stop() hier: der wartet auf den Task im Upstream-Loop, der evtl. auch den Aufrufer trägt
+        if self.running:
+            raise RuntimeError("sweep already running (stop it first)")
+        self.id = next(self._ids)
+        self.template, self.axes = bytes(template), axes
+        self.total = 1
+        for ax in axes:
+            self.total *= len(ax["values"])
+        self.gap_ns = int(max(0.0, float(gap_ms)) * 1e6)
+        self.window_ns = int(max(0.0, float(window_ms)) * 1e6)
+        self.pos = self.throttled = self.written = self.responses = self.acks = self.active_ns = 0
+        self.results = OrderedDict()
+        self._sent.clear()
+        self._stopping = self._paused = False
+        self.started = time.time()
+        self.status = "running"
+        self.active = True
+        log(f"🧪 Sweep {self.id}: {self.total} steps over {', '.join(a['name'] for a in axes)}, "
+            f"template {hx(self.template)}")
+        self.loop = up.loop
+        self.future = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    def _signal(self):
+        if self.loop is not None and self._wake is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass   # Loop schon zu
+
+    def pause(self):
+        if self.running:
+            self._paused = True
+            self.status = "paused"
+            self._signal()
+
+    def resume(self):
+        if self.running and self._paused:
+            self._paused = False
+            self.status = "running"
+            self._signal()
+
+    def stop(self, timeout: float = 5.0):
+        # nicht aus dem Upstream-Loop selbst aufrufen (wartet auf den Task)
+        if self.running:
+            self._stopping = True
+            self._signal()
+            try:
+                self.future.result(timeout)
+            except Exception:
+                pass
+
+    async def _sleep(self, seconds: float):
+        # unterbrechbar durch pause/resume/stop
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def _comment(self, i: int, coords: dict) -> str:
+        return f"sweep {self.id} {i + 1}/{self.total} " + " ".join(
+            f"{a['name']}=0x{coords[a['name']]:0{2 * a['size']}X}" for a in self.axes)
+
+    def _on_sent(self, step: int, t_write: int):
+        # Upstream-Loop: Frame ist beim Board (gescheiterte/verworfene Frames melden sich nie)
+        self._sent.append((t_write, step))
+        self.written += 1
+
+    def on_board(self, payload: bytes, t_rx: int) -> str:
+        """Board-Notify (Upstream-Loop): Schritt im Fenster davor suchen, liefert den Log-Kommentar."""
+        sent = next(((t, i) for t, i in reversed(self._sent) if t <= t_rx), None)
+        if sent is None or t_rx - sent[0] > self.window_ns:
+            return ""
+        t_sent, step = sent
+        dec = decode_frame("board->app", payload)
+        if dec["type"] == "ack":
+            self.acks += 1
+            return ""
+        self.responses += 1
+        frame, coords = sweep_frame(self.template, self.axes, step)
+        res = self.results.get(step)
+        if res is None and len(self.results) < SWEEP_RESULTS_MAX:
+            res = self.results[step] = {"step": step + 1, "coords": coords, "frame": hx(frame), "responses": []}
+        if res is not None and len(res["responses"]) < SWEEP_RESPONSES_PER_STEP:
+            res["responses"].append({"ms": round((t_rx - t_sent) / 1e6, 1), "hex": hx(payload), "label": dec["label"]})
+        return "response to " + self._comment(step, coords)
+
+    def _backpressure(self) -> bool:
+        st = self.state
+        if len(st.upstream.wq) >= SWEEP_MAX_INFLIGHT:
+            return True
+        return bool(st.writer and len(st.writer.q) > st.writer.max_queue // 2)
+
+    async def _run(self):
+        st = self.state
+        self._wake = asyncio.Event()
+        t_next = 0
+        self._t_active = time.monotonic_ns()
+        try:
+            i = 0
+            while i < self.total and not self._stopping:
+                if self._paused:
+                    self.active_ns += time.monotonic_ns() - self._t_active
+                    await self._sleep(0.25)
+                    self._t_active = time.monotonic_ns()
+                    continue
+                if self._backpressure():
+                    self.throttled += 1
+                    await asyncio.sleep(0.0005)
+                    continue
+                wait = t_next - time.monotonic_ns()
+                if wait > 0:
+                    await self._sleep(min(wait / 1e9, 0.25))
+                    continue
+                frame, coords = sweep_frame(self.template, self.axes, i)
+                now = time.monotonic_ns()
+                st.upstream.write(frame, now, coalesce=False, on_sent=lambda t, step=i: self._on_sent(step, t))
+                st._emit_ui("app->board", frame, kind="fuzz", comment=self._comment(i, coords), t_mono=now)
+                i += 1
+                self.pos = i
+                t_next = now + self.gap_ns
+            self.active_ns += time.monotonic_ns() - self._t_active
+            if not self._stopping:
+                # Antworten auf die letzten Frames noch zuordnen: erst Queue leer schreiben lassen, dann Fenster
+                self.status = "settling"
+                t_end = time.monotonic_ns() + SWEEP_DRAIN_MAX_MS * 1_000_000
+                while (len(st.upstream.wq) or (self._sent and self._sent[-1][1] < i - 1)) \
+                        and not self._stopping and time.monotonic_ns() < t_end:
+                    await asyncio.sleep(0.005)
+                await self._sleep(self.window_ns / 1e9)
+            self.status = "stopped" if self._stopping else "done"
+        except Exception as e:
+            self.active_ns += time.monotonic_ns() - self._t_active
+            self.status = "error"
+            log(f"⚠️ Sweep failed: {e}")
+        finally:
+            self.active = False
+        log(f"⏹️ Sweep {self.id} {self.status}: {self.pos}/{self.total} frames in {self.active_ns / 1e9:.2f} s, "
+            f"{self.responses} responses")
+
+    def stats(self) -> dict:
+        active = self.active_ns
+        if self.running and self.status == "running":
+            active += time.monotonic_ns() - self._t_active
+        return {
+            "id": self.id,
+            "status": self.status,
+            "template": hx(self.template),
+            "axes": [{k: a[k] for k in ("name", "pos", "size")} | {"count": len(a["values"])} for a in self.axes],
+            "total": self.total,
+            "pos": self.pos,
+            "gap_ms": self.gap_ns / 1e6,
+            "window_ms": self.window_ns / 1e6,
+            "fps": round(self.pos / (active / 1e9), 1) if active > 0 else 0,
+            "throttled": self.throttled,
+            "written": self.written,
+            "responses": self.responses,
+            "acks": self.acks,
+            "responded_steps": len(self.results),
+        }
+
+
+# =========================
+# LED-Animationen (Sequencer)
+# =========================
+# Timeline (JSON) -> vorab kompilierter Byte-Fahrplan [(offset_ns, frame)], abgespielt als Task im
+# Upstream-Loop. Deadlines zählen immer ab t0 (monotonic): ein verspäteter Write verschiebt die
+# folgenden Frames nicht (kein Drift). Ist bei einer Ring-Palette die nächste schon fällig, wird sie
+# übersprungen (Latest-Wins wie coalesce_key). Ein Treffer vom Board bricht die Animation ab.
+ANIM_MAX_FRAMES = 4096          # pro Durchlauf
+ANIM_MAX_MS = 60000             # Länge eines Durchlaufs
+ANIM_PREEMPT_ON_HIT = True
+ANIM_FILE = os.path.join(DATA_DIR, "animations.json")   # eigene Timelines (/api/anim/define)
+capture_kind("anim", 5)
+
+# Segmente im Uhrzeigersinn ab 20 (für Lauflichter)
+BOARD_ORDER = (20, 1, 18, 4, 13, 6, 10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5)
+PALETTE_CODES = {name.lower(): i for i, name in enumerate(PALETTE)}
+HIT_RING_OPS = {"S": 0x01, "SO": 0x01, "SI": 0x01, "D": 0x02, "T": 0x03}
+# Bull hat keine Target-ID (SEG_TARGET_ID im Userscript kennt nur S1..S20): Bull-Treffer zeigt das
+# Userscript (bull_single / bull_double) als OP1F Bull Multicolor Fade, ohne Ring-Segment.
+BULL_OP = 0x1F
+BULL_TARGETS = ("SBULL", "DBULL", "BULL", "25", "50")
+
+
+def _anim_color(v) -> bytes:
+    # "#RRGGBB" | "RRGGBB" | [r, g, b]
+    if isinstance(v, (list, tuple)) and len(v) == 3:
+        b = bytes(int(x) for x in v)
+    else:
+        b = bytes.fromhex(str(v).lstrip("#"))
+    if len(b) != 3:
+        raise ValueError(f"color {v!r}: expected #RRGGBB")
+    return b
+
+
+def _anim_palette(v) -> int:
+    # Palette-Code 0..255 oder Name aus PALETTE ("Rot", "weiß", ...)
+    if isinstance(v, str) and v.lower() in PALETTE_CODES:
+        return PALETTE_CODES[v.lower()]
+    c = int(v, 0) if isinstance(v, str) else int(v)
+    if not 0 <= c <= 255:
+        raise ValueError(f"palette code {v!r} must be 0..255")
+    return c
+
+
+def _anim_target(v):
+    """"T20" / "D5" / "S1" / 20 -> (Hit-OP oder None, Segment); "SBULL" / "DBULL" -> (BULL_OP, None)."""
+    s = str(v).strip().upper()
+    if s in BULL_TARGETS:
+        return BULL_OP, None
+    ring = s.rstrip("0123456789")
+    seg = int(s[len(ring):] or 0)
+    if seg not in SEG_TO_TARGET_ID or (ring and ring not in HIT_RING_OPS):
+        raise ValueError(f"target {v!r}: expected S1..S20, D1..D20, T1..T20, 1..20, SBULL or DBULL")
+    return HIT_RING_OPS.get(ring), seg
+
+
+def led_frame(op: int, a=b"\x00\x00\x00", b=b"\x00\x00\x00", target_id: int = 0, speed: int = 0,
+              c=b"\x00\x00\x00") -> bytes:
+    """16-Byte OP Frame wie frame16() im Userscript (Byte 15 = 01), Color C (Bytes 7..9) nur bei OP1F."""
+    buf = bytearray(16)
+    buf[0] = op & 0xFF
+    buf[1:4] = a
+    buf[4:7] = b
+    buf[7:10] = c
+    buf[10] = target_id & 0xFF
+    buf[11] = (target_id >> 8) & 0xFF
+    buf[12] = speed & 0xFF
+    buf[15] = 0x01
+    return bytes(buf)
+
+
+def anim_step_frame(step: dict) -> bytes:
+    """
+    Ein Keyframe -> Frame. Varianten:
+      {"ring": "off" | [20 Codes S1..S20] | {"20": "Rot", "1": 2}}       20-Byte Ring-Palette (Rest OFF)
+      {"hit": "T20", "a": "#FF0000", "b": "#FF9500", "speed": 20}       Hit-Frame OP01/02/03 auf ein Segment
+      {"hit": "DBULL", "a": .., "b": .., "c": .., "speed": 16}          Bull: OP1F Fade (keine Target-ID)
+      {"op": 0x11, "a": .., "b": .., "target": 20 | "0x0010", "speed": 0}  beliebiger 16-Byte OP Frame
+      {"hex": "01 FF 00 ..."}                                          roh
+    """
+    if "ring" in step:
+        ring = step["ring"]
+        pal = bytearray(20)
+        if isinstance(ring, dict):
+            for seg, c in ring.items():
+                _op, n = _anim_target(seg)
+                if n is None:
+                    raise ValueError(f"{seg}: the bull has no ring segment")
+                pal[n - 1] = _anim_palette(c)
+        elif isinstance(ring, list):
+            if len(ring) != 20:
+                raise ValueError("ring list needs 20 codes (S1..S20)")
+            pal[:] = bytes(_anim_palette(c) for c in ring)
+        elif ring != "off":
+            raise ValueError("ring must be 'off', a list of 20 codes or {segment: code}")
+        return bytes(pal)
+    if "hit" in step:
+        op, seg = _anim_target(step["hit"])
+        a, b = _anim_color(step.get("a", "#FF0000")), _anim_color(step.get("b", "#FF9500"))
+        if seg is None:
+            return led_frame(op, a, b, 0, int(step.get("speed", 16)), _anim_color(step["c"]) if "c" in step else b)
+        return led_frame(op or 0x01, a, b, SEG_TO_TARGET_ID[seg], int(step.get("speed", 20)))
+    if "op" in step:
+        op = step["op"]
+        op = int(op, 0) if isinstance(op, str) else int(op)
+        tid = step.get("target", 0)
+        if isinstance(tid, str) and tid.lower().startswith("0x"):
+            tid = int(tid, 16)
+        elif tid:
+            seg = _anim_target(tid)[1]
+            tid = SEG_TO_TARGET_ID[seg] if seg is not None else 0
+        return led_frame(op, _anim_color(step.get("a", "#000000")), _anim_color(step.get("b", "#000000")),
+                         tid, int(step.get("speed", 0)))
+    if "hex" in step:
+        frame = parse_hex_string(step["hex"])
+        if not frame:
+            raise ValueError("empty hex frame")
+        return frame
+    raise ValueError("step needs ring, hit, op or hex")
+
+
+def compile_timeline(timeline: dict) -> dict:
+    """
+    Timeline -> Fahrplan. {"steps": [{"at": ms | "after": ms, <Keyframe>}, ...],
+    "repeat": 1 (0 = bis Abbruch), "period_ms": Länge eines Durchlaufs (Standard: letzter Keyframe),
+    "preempt": true (Treffer bricht ab)}. Ohne "at" folgt ein Keyframe "after" ms (Standard 0) auf den vorigen.
+    """
+    steps = timeline.get("steps") or []
+    if not steps:
+        raise ValueError("timeline needs steps")
+    if len(steps) > ANIM_MAX_FRAMES:
+        raise ValueError(f"more than {ANIM_MAX_FRAMES} steps")
+    sched = []
+    t = 0.0
+    for i, step in enumerate(steps):
+        try:
+            t = float(step["at"]) if "at" in step else t + float(step.get("after", 0))
+            if not 0 <= t <= ANIM_MAX_MS:
+                raise ValueError(f"time must be 0..{ANIM_MAX_MS} ms")
+            frame = anim_step_frame(step)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"step {i + 1}: {e}") from None
+        sched.append((int(t * 1e6), frame))
+    sched.sort(key=lambda s: s[0])   # stabil: gleiche Zeit -> Reihenfolge der Steps
+    end = sched[-1][0]
+    period = int(float(timeline.get("period_ms", end / 1e6)) * 1e6)
+    repeat = int(timeline.get("repeat", 1))
+    if period < end or period > ANIM_MAX_MS * 1_000_000:
+        raise ValueError(f"period_ms must be {end / 1e6:g}..{ANIM_MAX_MS}")
+    if repeat < 0 or (repeat != 1 and period <= 0):
+        raise ValueError("repeat needs period_ms > 0")
+    return {
+        "offsets": [o for o, _f in sched],
+        "frames": [f for _o, f in sched],
+        # überspringbar bei Verspätung: Frame derselben Coalesce-Klasse folgt und ist auch schon fällig
+        "keys": [coalesce_key(f) for _o, f in sched],
+        "period_ns": period,
+        "repeat": repeat,
+        "preempt": bool(timeline.get("preempt", True)),
+    }
+
+
+# Eingebaute Animationen: params -> Timeline (Doc-String = Beschreibung in /api/anim)
+def anim_finish_path(targets=("T20", "T20", "D20"), color="#FF0000", ring="Rot", step_ms=350, hold_ms=600,
+                     repeat=3):
+    """Finish-Weg: Segmente in der Ring-Palette markieren, Ziele nacheinander als Hit-Frame aufblitzen (Bull: OP1F)."""
+    if isinstance(targets, str):
+        targets = targets.replace(",", " ").split()
+    if not targets:
+        raise ValueError("targets required")
+    segs = {str(seg): ring for _op, seg in map(_anim_target, targets) if seg is not None}
+    steps = [{"at": 0, "ring": segs or "off"}]
+    steps += [{"after": 0 if i == 0 else step_ms, "hit": t, "a": color, "b": color} for i, t in enumerate(targets)]
+    return {"steps": steps, "repeat": repeat, "period_ms": step_ms * (len(targets) - 1) + hold_ms}
+
+
+def anim_next_sweep(color="Türkis", step_ms=40, laps=1, a="#66FF00", b="#05EBD0", speed=0):
+    """Spielerwechsel: Lauflicht einmal (laps) um den Ring, danach Ring aus und OP11 Next."""
+    laps = max(1, int(laps))
+    steps = [{"after": step_ms if i else 0, "ring": {str(seg): color}}
+             for i, seg in enumerate(BOARD_ORDER * laps)]
+    steps.append({"after": step_ms, "ring": "off"})
+    steps.append({"after": 0, "op": 0x11, "a": a, "b": b, "target": "0x0010", "speed": speed})
+    return {"steps": steps}
+
+
+def anim_blink(color="Weiß", on_ms=150, off_ms=150, count=3):
+    """Ganzer Ring blinkt count-mal in einer Palettenfarbe."""
+    return {"steps": [{"at": 0, "ring": [color] * 20}, {"at": on_ms, "ring": "off"}],
+            "period_ms": on_ms + off_ms, "repeat": count}
+
+
+ANIM_BUILTINS = {"finish_path": anim_finish_path, "next_sweep": anim_next_sweep, "blink": anim_blink}
+
+
+class AnimEngine:
+    """
+    Eine Animation zur Zeit, als Task im Upstream-Loop (wie SweepEngine). play() kompiliert im
+    aufrufenden Thread (Fehler -> ValueError) und wartet nicht: Start/Abbruch laufen per Upstream._call
+    im Loop, eine neue Animation ersetzt die laufende sofort. Frames landen mit kind "anim" im Log.
+    """
+    def __init__(self, state, path: str = ANIM_FILE):
+        self.state = state
+        self.path = path
+        self.custom = {}          # name -> Timeline (ANIM_FILE)
+        self._task = None
+        self._ids = itertools.count(1)
+        self.id = 0
+        self.name = ""
+        self.status = "idle"
+        self.active = False       # im Loop gesetzt, von on_real_notify gelesen
+        self.preempt = True
+        self.pos = 0
+        self.total = 0
+        self.loops = 0
+        self.started = None
+        # stats
+        self.sent = 0
+        self.skipped = 0
+        self.preempted = 0
+        self.lateness = LatencyHistogram()   # Write-Zeitpunkt - Deadline
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                    self.custom = data if isinstance(data, dict) else {}
+        except Exception as e:
+            log(f"⚠️ Animations load failed: {e}")
+
+    def _save(self):
+        try:
+            ensure_data_dir()
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.custom, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            log(f"⚠️ Animations save failed: {e}")
+
+    def catalog(self) -> list:
+        out = [{"name": n, "builtin": True, "description": (fn.__doc__ or "").strip()}
+               for n, fn in ANIM_BUILTINS.items()]
+        out += [{"name": n, "builtin": False, "description": tl.get("description", ""), "steps": len(tl.get("steps", []))}
+                for n, tl in self.custom.items() if n not in ANIM_BUILTINS]
+        return out
+
+    def define(self, name: str, timeline: dict = None):
+        """Eigene Timeline speichern (timeline None = löschen). Eingebaute Namen sind fest."""
+        if not name or name in ANIM_BUILTINS:
+            raise ValueError("name required (not a built-in animation)")
+        if timeline is None:
+            if self.custom.pop(name, None) is None:
+                raise ValueError(f"unknown animation {name!r}")
+        else:
+            compile_timeline(timeline)
+            self.custom[name] = timeline
+        self._save()
+
+    def resolve(self, name: str = None, params: dict = None, timeline: dict = None) -> dict:
+        """Name (+ params) oder Inline-Timeline -> Timeline."""
+        if timeline is not None:
+            return timeline
+        if name in ANIM_BUILTINS:
+            try:
+                return ANIM_BUILTINS[name](**(params or {}))
+            except TypeError as e:
+                raise ValueError(f"{name}: {e}") from None
+        if name in self.custom:
+            return self.custom[name]
+        raise ValueError(f"unknown animation {name!r}")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def play(self, sched: dict, name: str = "inline"):
+        up = self.state.upstream
+        if not (up and up.loop and up.client and up.client.is_connected):
+            raise ValueError("REAL board not connected")
+        up._call(self._start, sched, name)
+
+    def stop(self):
+        up = self.state.upstream
+        if up and self.running:
+            up._call(self.cancel, "stopped")
+
+    def cancel(self, reason: str = "stopped"):
+        # nur im Upstream-Loop (on_real_notify, _start, stop)
+        if self.running:
+            self._task.cancel(reason)
+        self.active = False
+
+    def on_board(self, payload: bytes):
+        """Board-Notify (Upstream-Loop): Treffer oder Miss bricht die laufende Animation ab."""
+        if self.preempt and ANIM_PREEMPT_ON_HIT:
+            d = HIT_TABLE.get(bytes(payload))
+            if d is not None and d["type"] in ("hit", "out"):
+                self.preempted += 1
+                self.cancel("preempted")
+
+    def _start(self, sched: dict, name: str):
+        self.cancel("replaced")
+        self.id = next(self._ids)
+        self.name = name
+        self.status = "running"
+        self.active = True
+        self.preempt = sched["preempt"]
+        self.total = len(sched["frames"])
+        self.pos = self.loops = 0
+        self.started = time.time()
+        self._task = self.state.upstream.loop.create_task(self._run(self.id, sched))
+
+    async def _run(self, aid: int, sched: dict):
+        st = self.state
+        name, status = self.name, "done"
+        offsets, frames, keys = sched["offsets"], sched["frames"], sched["keys"]
+        period, repeat, n = sched["period_ns"], sched["repeat"], len(frames)
+        t0 = time.monotonic_ns()
+        try:
+            k = 0
+            while repeat == 0 or k < repeat:
+                base = t0 + k * period
+                for i in range(n):
+                    deadline = base + offsets[i]
+                    now = time.monotonic_ns()
+                    if deadline > now:
+                        await asyncio.sleep((deadline - now) / 1e9)
+                        now = time.monotonic_ns()
+                    self.pos = i + 1
+                    # zu spät und der Nachfolger (gleiche Klasse) ist auch schon fällig -> nur der zählt
+                    j = i + 1
+                    nxt = base + offsets[j] if j < n else (base + period + offsets[0] if repeat != k + 1 else None)
+                    key = keys[i]
+                    if key is not None and nxt is not None and nxt <= now and keys[j % n] == key:
+                        self.skipped += 1
+                        continue
+                    self.lateness.add(now - deadline)
+                    st.upstream.write(frames[i], now)
+                    st._emit_ui("app->board", frames[i], kind="anim",
+                                comment=f"anim {aid} {name} {i + 1}/{n}" + (f" #{k + 1}" if repeat != 1 else ""),
+                                t_mono=now)
+                    self.sent += 1
+                k += 1
+                self.loops = k
+        except asyncio.CancelledError as e:
+            status = e.args[0] if e.args else "stopped"     # Grund aus cancel()
+        except Exception as e:
+            status = "error"
+            log(f"⚠️ Animation failed: {e}")
+        if self.id == aid:
+            self.status = status
+            self.active = False
+        log(f"🎞️ Animation {aid} {name} {status} after {(time.monotonic_ns() - t0) / 1e9:.2f} s")
+
+    def stats(self) -> dict:
+        late = self.lateness.snapshot()
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "pos": self.pos,
+            "total": self.total,
+            "loops": self.loops,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "preempted": self.preempted,
+            "late_p50_ms": round(late["p50_us"] / 1000, 2),
+            "late_p99_ms": round(late["p99_us"] / 1000, 2),
+            "late_max_ms": round(late["max_us"] / 1000, 2),
+        }
+
+
 # =========================
 # MITM State (+ UI hooks)
 # =========================
@@ -368,47 +3609,145 @@ class MitmState:
         self.app_notify_char = None
         self.app_subscribed = False
         self.upstream = None
+        self.writer = None
 
         self.logstore = logstore
         self.hub = hub
+        # False = keine Frame-Zeilen im Terminal (Benchmarks)
+        self.console = True
+
+        # Latenz pro Stage (Callback-Eintritt -> ... -> PropertiesChanged / write_gatt_char)
+        self.metrics = StageMetrics()
+
+        self.handshake = HandshakeReplay(self)
+        self.replay = ReplayEngine(self)
+        self.sweep = SweepEngine(self)
+        self.anim = AnimEngine(self)
+
+        # True = GLib/D-Bus und asyncio (bleak, Web) laufen im selben Thread/Loop
+        self.integrated = False
+
+        # eindeutige Entry-IDs auch bei mehreren Frames in derselben ms
+        self._entry_no = itertools.count(1)
+
+        # Board->App Notify-Stream ('@'-Frames über Notify-Grenzen hinweg), nur für Dekodierung/Log.
+        # Nur kind "ble" (echtes Board); manual/replay haben je einen eigenen, sonst verschmilzt ein
+        # eingeschobener Frame mit einem offenen Board-Fragment.
+        self.reassembler = FrameReassembler()
+        self._side_reassemblers = {}
+        self.capture = None   # CaptureWriter (LOG_CAPTURE)
+        self.import_job = None   # laufender / letzter btsnoop Import (/api/import)
+        self._frames_done = []
+
+    def _decode_board_chunk(self, payload, kind: str = "ble") -> dict:
+        r = self.reassembler if kind == "ble" else self._side_reassemblers.get(kind)
+        if r is None:
+            r = self._side_reassemblers[kind] = FrameReassembler()
+        return decode_board_chunk(r, payload, self._frames_done)
+
+    def build_entry(self, rec) -> dict:
+        # rec = (time.time(), direction, payload, kind, comment, console, monotonic_ns) – läuft im Writer-Thread
+        t, direction, payload, kind, comment, console, _ = rec
+        entry = log_entry(f"{int(t * 1000)}-{PID}-{next(self._entry_no)}", t, direction, kind, payload,
+                          self._decode_board_chunk(payload, kind) if direction == "board->app"
+                          else decode_frame(direction, payload), comment)
+        if console and self.console:
+            print(f"[{entry['t']}] " + console.format(hex=entry["hex"], ascii=entry["ascii"]), flush=True)
+        return entry
+
+    def _emit_ui(self, direction: str, payload: bytes, kind: str = "ble", comment: str = "", console: str = None,
+                 t_mono: int = None):
+        rec = (time.time(), direction, payload, kind, comment, console, t_mono or time.monotonic_ns())
+        if self.writer:
+            self.writer.submit(rec)
+        else:
+            entry = self.build_entry(rec)
+            if self.capture is not None:
+                entry["rec"] = self.capture.append_recs([rec])
+            self.logstore.add(entry)
+            self.hub.publish({"type": "log", "entry": entry})
+
+    def set_comment(self, entry_id: str, comment: str) -> bool:
+        ok = self.logstore.set_comment(entry_id, comment)
+        if ok and self.capture is not None:
+            rec = (self.logstore.get(entry_id) or {}).get("rec")
+            if rec is not None:
+                self.capture.set_comment(rec, comment)
+        return ok
+
+    def on_real_notify(self, payload: bytes, t_rx: int = None):
+        # Board -> App (t_rx = monotonic_ns beim Eintritt in den bleak Callback)
+        t_rx = t_rx or time.monotonic_ns()
+        console = "REAL->PI NOTIFY {hex}  ASCII:{ascii}"
+        m = self.metrics
+        comment = self.sweep.on_board(payload, t_rx) if self.sweep.active else ""
+        if self.anim.active:
+            self.anim.on_board(payload)
+
+        if FORWARD_FIRST:
+            if self.app_subscribed and self.app_notify_char is not None:
+                self._to_glib(self._send_to_app, payload, t_rx)
+                m.since("board->app", "rx->forwarded", t_rx)
+            self.real_notify_buffer.append((time.monotonic(), payload))
+            self._emit_ui("board->app", payload, kind="ble", comment=comment, console=console, t_mono=t_rx)
+            m.since("board->app", "rx->logged", t_rx)
+            return
 
-    def _emit_ui(self, direction: str, payload: bytes, kind: str = "ble", comment: str = ""):
-        entry = {
-            "id": f"{now_ms()}-{os.getpid()}-{int(time.time()*1000)%1000000}",
-            "t": ts(),
-            "ms": now_ms(),
-            "dir": direction,     # "app->board" / "board->app"
-            "kind": kind,         # "ble" / "manual"
-            "hex": hx(payload),
-            "ascii": ascii_vis(payload),
-            "comment": comment or "",
-        }
-        self.logstore.add(entry)
-        self.hub.publish({"type": "log", "entry": entry})
-
-    def on_real_notify(self, payload: bytes):
-        # Board -> App
-        self.real_notify_buffer.append(payload)
+        self.real_notify_buffer.append((time.monotonic(), payload))
 
         # Terminal debug
-        log(f"REAL->PI NOTIFY {hx(payload)}  ASCII:{ascii_vis(payload)}")
+        log(console.format(hex=hx(payload), ascii=ascii_vis(payload)))
 
         # UI log
-        self._emit_ui("board->app", payload, kind="ble")
+        self._emit_ui("board->app", payload, kind="ble", comment=comment, t_mono=t_rx)
+        m.since("board->app", "rx->logged", t_rx)
 
         # forward to app
         if self.app_subscribed and self.app_notify_char is not None:
-            GLib.idle_add(self._send_to_app, payload)
+            self._to_glib(self._send_to_app, payload, t_rx)
+            m.since("board->app", "rx->forwarded", t_rx)
+
+    def on_app_write(self, data: bytes):
+        # App -> Board
+        t_rx = time.monotonic_ns()
+        console = "APP->PI WRITE  {hex}"
+        m = self.metrics
+
+        if FORWARD_FIRST:
+            self.forward_write_to_real(data, t_rx)
+            m.since("app->board", "rx->forwarded", t_rx)
+            self._emit_ui("app->board", data, kind="ble", console=console, t_mono=t_rx)
+            m.since("app->board", "rx->logged", t_rx)
+            return
 
-    def _send_to_app(self, payload: bytes):
+        log(console.format(hex=hx(data), ascii=ascii_vis(data)))
+        self._emit_ui("app->board", data, kind="ble", t_mono=t_rx)
+        m.since("app->board", "rx->logged", t_rx)
+        self.forward_write_to_real(data, t_rx)
+        m.since("app->board", "rx->forwarded", t_rx)
+
+    def _to_glib(self, fn, *args):
+        # integrierte Runtime: wir SIND schon im GLib-Loop -> direkt, sonst Thread-Hop über idle_add
+        if self.integrated:
+            fn(*args)
+        else:
+            GLib.idle_add(fn, *args)
+
+    def _send_to_app(self, payload: bytes, t_rx: int = None):
+        t_idle = time.monotonic_ns()
         try:
-            if self.app_notify_char:
-                self.app_notify_char.send_notify(payload)
+            if self.app_notify_char and self.app_notify_char.send_notify(payload) and t_rx:
+                t_done = time.monotonic_ns()
+                m = self.metrics
+                m.record("board->app", "rx->idle", t_idle - t_rx)
+                m.record("board->app", "idle->notified", t_done - t_idle)
+                m.record("board->app", "rx->notified", t_done - t_rx)
         except Exception as e:
             log(f"⚠️ Send notify to APP failed: {e}")
         return False
 
     def flush_buffer_to_app(self):
+        # GLib idle callback nach StartNotify: Replay nur anstoßen, gesendet wird per Timer
         if not self.app_subscribed or not self.app_notify_char:
             return False
         if not self.real_notify_buffer:
@@ -416,40 +3755,49 @@ class MitmState:
 
         items = list(self.real_notify_buffer)
         self.real_notify_buffer.clear()
-
-        log(f"[HANDSHAKE] ▶️ Replaying {len(items)} buffered REAL notify frames to APP...")
-        for p in items:
-            try:
-                self.app_notify_char.send_notify(p)
-                time.sleep(0.02)  # iOS drops bursts if too fast
-            except Exception as e:
-                log(f"[HANDSHAKE] ⚠️ Replay failed: {e}")
-                break
+        self.handshake.start(items)
         return False
 
-    def forward_write_to_real(self, data: bytes):
+    def forward_write_to_real(self, data: bytes, t_rx: int = None):
         if self.upstream:
-            log(f"PI->REAL WRITE  {hx(data)}")
-            self.upstream.write(data)
+            if not FORWARD_FIRST:
+                log(f"PI->REAL WRITE  {hx(data)}")
+            self.upstream.write(data, t_rx)
 
     # Manual tools (UI)
     def manual_send_to_board(self, payload: bytes, comment: str = ""):
+        if FORWARD_FIRST:
+            self.forward_write_to_real(payload)
+            self._emit_ui("app->board", payload, kind="manual", comment=comment)
+            return
         self._emit_ui("app->board", payload, kind="manual", comment=comment)
         self.forward_write_to_real(payload)
 
+    def manual_send_to_board_batch(self, frames, comment: str = ""):
+        # frames = [(bytes, delay_ms, comment), ...]
+        if self.upstream:
+            self.upstream.write_batch([(d, ms) for d, ms, _c in frames])
+        for i, (d, _ms, c) in enumerate(frames):
+            self._emit_ui("app->board", d, kind="manual",
+                          comment=" | ".join(x for x in (c, comment, f"batch {i + 1}/{len(frames)}") if x))
+
     def manual_send_to_app(self, payload: bytes, comment: str = ""):
+        if FORWARD_FIRST:
+            self._to_glib(self._send_to_app, payload)
+            self._emit_ui("board->app", payload, kind="manual", comment=comment)
+            return
         self._emit_ui("board->app", payload, kind="manual", comment=comment)
-        GLib.idle_add(self._send_to_app, payload)
+        self._to_glib(self._send_to_app, payload)
 
 
 # =========================
 # Vendor GATT
 # =========================
 class VendorService(Service):
-    def __init__(self, bus, index, state: MitmState):
+    def __init__(self, bus, index, state: MitmState, notify_cls=None):
         super().__init__(bus, index, VENDOR_SERVICE_UUID, primary=True)
         self.state = state
-        self.notify_char = VendorNotifyCharacteristic(bus, 0, self, state)
+        self.notify_char = (notify_cls or VendorNotifyCharacteristic)(bus, 0, self, state)
         self.write_char  = VendorWriteCharacteristic(bus, 1, self, state)
         self.add_characteristic(self.notify_char)
         self.add_characteristic(self.write_char)
@@ -477,11 +3825,12 @@ class VendorNotifyCharacteristic(Characteristic):
         self.state.app_subscribed = False
         log("📲 APP unsubscribed NOTIFY")
 
-    def send_notify(self, payload: bytes):
+    def send_notify(self, payload: bytes) -> bool:
         if not self.notifying:
-            return
+            return False
         self.value = bytearray(payload)
         self._props_changed_value()
+        return True
 
 
 class VendorWriteCharacteristic(Characteristic):
@@ -490,105 +3839,775 @@ class VendorWriteCharacteristic(Characteristic):
         self.state = state
 
     def WriteValue(self, value, options):
-        data = bytes(value)
-        log(f"APP->PI WRITE  {hx(data)}")
-        self.state._emit_ui("app->board", data, kind="ble")
-        self.state.forward_write_to_real(data)
+        self.state.on_app_write(bytes(value))
+
+
+# =========================
+# Loopback (virtuelles GranBoard + App-Stand-in, ohne Bluetooth)
+# =========================
+class LoopbackNotifyCharacteristic(VendorNotifyCharacteristic):
+    """Wie VendorNotifyCharacteristic, PropertiesChanged geht an LoopbackCentral statt auf den System-Bus."""
+    central = None
+
+    def _props_changed_value(self):
+        self.central.on_notify(bytes(self.value))
+
+
+class LoopbackCentral:
+    """
+    Stand-in für App + BlueZ auf der GATT-Server-Seite: der echte VendorService ohne Bus,
+    subscribe() ruft StartNotify, write() ruft WriteValue – dieselben Codepfade wie über D-Bus.
+    Aufrufe aus dem GLib-Loop (bzw. dem integrierten Loop), wie bei BlueZ.
+    """
+    def __init__(self, state: MitmState):
+        self.state = state
+        self.service = VendorService(None, 0, state, notify_cls=LoopbackNotifyCharacteristic)
+        self.service.notify_char.central = self
+        self.notifies = 0
+        self.notify_bytes = 0
+        self.writes = 0
+        self.last = None
+
+    def subscribe(self):
+        self.service.notify_char.StartNotify()
+        return False
+
+    def unsubscribe(self):
+        self.service.notify_char.StopNotify()
+        return False
+
+    def write(self, data: bytes):
+        self.writes += 1
+        self.service.write_char.WriteValue(data, {})
+        return False
+
+    def on_notify(self, payload: bytes):
+        self.notifies += 1
+        self.notify_bytes += len(payload)
+        self.last = payload
+
+
+class LoopbackBoard:
+    """
+    Virtuelles GranBoard mit der Schnittstelle von BleakClient (connect / start_notify /
+    write_gatt_char / disconnect / is_connected), als Task im Upstream-Loop.
+    Schickt Treffer mit hit_hz (Zeitplan ab Start, kein Drift; bei Rückstand mehrere pro Tick),
+    max_hits begrenzt die Anzahl (None = endlos). Auf jeden Write optional ack (LOOPBACK_ACK),
+    write_ms simuliert die Dauer eines GATT Writes.
+    link_fps > 0: Controller-Puffer (LOOPBACK_LINK_BUFFER Frames) leert sich mit link_fps, ist er voll,
+    schlägt der Write fehl (wie BlueZ "In Progress"); Write mit Response wartet bis zur Übertragung.
+    fail_rate: Anteil zufälliger Write-Fehler.
+    """
+    BURST = 64   # hit_hz 0: so viele Treffer pro Loop-Durchlauf
+
+    def __init__(self, addr: str, disconnected_callback=None, hit_hz: float = LOOPBACK_HIT_HZ,
+                 write_ms: float = LOOPBACK_WRITE_MS, ack: bytes = LOOPBACK_ACK, max_hits: int = None, seed: int = 1,
+                 link_fps: float = LOOPBACK_LINK_FPS, fail_rate: float = 0.0):
+        self.address = addr
+        self.disconnected_callback = disconnected_callback
+        self.hit_hz = hit_hz
+        self.write_ms = write_ms
+        self.ack = ack
+        self.max_hits = max_hits
+        self.link_fps = link_fps
+        self.fail_rate = fail_rate
+        self.rnd = random.Random(seed)
+        self._air = 0           # monotonic ns: bis dann ist der simulierte Puffer belegt
+        self.rejected = 0
+        self.is_connected = False
+        self._cb = None
+        self._task = None
+        self.hits = 0
+        self.writes = 0
+        self.write_bytes = 0
+
+    async def connect(self):
+        self.is_connected = True
+        return True
+
+    async def start_notify(self, _uuid, callback):
+        self._cb = callback
+        callback(CHAR_NOTIFY_UUID, bytearray(BOARD_CONNECT_PREFIX + b"0@"))
+        if self.hit_hz or self.max_hits:
+            self._task = asyncio.get_running_loop().create_task(self._hits())
+
+    async def _hits(self):
+        codes = list(HIT_TABLE)
+        choice = self.rnd.choice
+        t0 = time.monotonic()
+        while self.is_connected and (self.max_hits is None or self.hits < self.max_hits):
+            if self.hit_hz:
+                due = int((time.monotonic() - t0) * self.hit_hz)
+            else:
+                due = self.hits + self.BURST
+            if self.max_hits is not None:
+                due = min(due, self.max_hits)
+            while self.hits < due:
+                self.hits += 1
+                self._cb(CHAR_NOTIFY_UUID, bytearray(choice(codes)))
+            await asyncio.sleep(min(1.0 / self.hit_hz, 0.05) if self.hit_hz else 0)
+
+    async def write_gatt_char(self, _uuid, data, response: bool = False):
+        if not self.is_connected:
+            raise RuntimeError("loopback board not connected")
+        if self.write_ms:
+            await asyncio.sleep(self.write_ms / 1000.0)
+        if self.fail_rate and self.rnd.random() < self.fail_rate:
+            self.rejected += 1
+            raise RuntimeError("[org.bluez.Error.Failed] loopback: transient write error")
+        if self.link_fps:
+            per = int(1e9 / self.link_fps)
+            now = time.monotonic_ns()
+            self._air = max(self._air, now)
+            if (self._air - now) // per >= LOOPBACK_LINK_BUFFER:
+                self.rejected += 1
+                raise RuntimeError("[org.bluez.Error.InProgress] loopback: controller buffer full")
+            self._air += per
+            if response:
+                await asyncio.sleep((self._air - now) / 1e9)
+        self.writes += 1
+        self.write_bytes += len(data)
+        if self.ack and self._cb:
+            self._cb(CHAR_NOTIFY_UUID, bytearray(self.ack))
+
+    async def disconnect(self):
+        self.is_connected = False
+        if self._task:
+            self._task.cancel()
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+        return True
 
 
 # =========================
 # Upstream (Bleak) Thread
 # =========================
+def coalesce_key(data: bytes):
+    """
+    Frame-Klasse für Latest-Wins: Ein neuerer Frame derselben Klasse ersetzt einen noch wartenden.
+    None = FIFO (Effekt-Frames, Hit-Frames, Unbekanntes – jeder Frame zählt).
+    """
+    n = len(data)
+    if n == 20:
+        return "ring"                       # statische Ring-Palette (20 Segmente)
+    if n == 12 and data[10:12] in SETTINGS_TAILS:
+        return "set:" + SETTINGS_TAILS[data[10:12]]
+    return None
+
+
+class WriteFlowControl:
+    """
+    AIMD-Pacing für Upstream-Writes (nur im Loop-Thread). rate None = ungebremst.
+    Stau (Fehlerquote > FLOW_ERROR_RATE, gatt_write > FLOW_LATENCY_MS, Probe-RTT > FLOW_PROBE_SLOW x bestes RTT)
+    -> Rate = FLOW_MD x gemessene Rate, höchstens einmal pro FLOW_HOLD_MS; danach +FLOW_AI_FPS pro
+    FLOW_HOLD_MS ohne Stau (additiv über die Zeit, nicht pro Write – sonst wächst die Rate exponentiell).
+    sustained_fps = Durchsatz, solange der nächste Frame schon wartete (Budget des Links).
+    """
+    def __init__(self, enabled: bool = UPSTREAM_FLOW_CONTROL):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.rate = None
+        self.t_start = 0            # Beginn des letzten Writes (Pacing)
+        self.t_done = 0             # Ende des letzten Writes (Rückstau-Erkennung)
+        self.t_hold = 0
+        self.t_ai = 0               # letzte additive Erhöhung
+        self.writes = 0
+        self.errors = 0
+        self.err_ewma = 0.0
+        self.congestions = 0
+        # EWMA über Abstände (nicht über 1/Abstand): sonst dominieren Writes, die sofort im Puffer landen
+        self.gap_ewma_ns = 0.0
+        self.busy_ewma_ns = 0.0
+        self.lat_ewma_ns = 0.0
+        self.rtt_min_ns = 0
+        self.probe_rtt = LatencyHistogram()
+
+    def wait_ns(self, now: int) -> int:
+        if not (self.enabled and self.rate and self.t_start):
+            return 0
+        return self.t_start + int(1e9 / self.rate) - now
+
+    def probe_due(self) -> bool:
+        return bool(self.enabled and FLOW_PROBE_EVERY and self.writes % FLOW_PROBE_EVERY == FLOW_PROBE_EVERY - 1)
+
+    def congestion(self, now: int):
+        if not self.enabled or now < self.t_hold:
+            return
+        self.congestions += 1
+        fps = 1e9 / self.gap_ewma_ns if self.gap_ewma_ns else FLOW_MIN_FPS
+        self.rate = max(FLOW_MIN_FPS, FLOW_MD * min(self.rate or fps, fps))
+        self.t_hold = self.t_ai = now + FLOW_HOLD_MS * 1_000_000
+        self.err_ewma = 0.0
+
+    def on_error(self, now: int):
+        self.errors += 1
+        self.err_ewma = self.err_ewma * 0.99 + 0.01
+        if self.err_ewma > FLOW_ERROR_RATE:
+            self.congestion(now)
+
+    def on_sent(self, t_start: int, t_done: int, backlog: bool, probe: bool = False):
+        if self.t_start and t_start > self.t_start:
+            dt = t_start - self.t_start
+            self.gap_ewma_ns = dt if not self.gap_ewma_ns else self.gap_ewma_ns * 0.9 + dt * 0.1
+        if backlog and self.t_done and t_done > self.t_done:
+            dt = t_done - self.t_done
+            self.busy_ewma_ns = dt if not self.busy_ewma_ns else self.busy_ewma_ns * 0.98 + dt * 0.02
+        self.t_start, self.t_done = t_start, t_done
+        self.writes += 1
+        self.err_ewma *= 0.99
+        lat = t_done - t_start
+        if probe:
+            self.probe_rtt.add(lat)
+            self.rtt_min_ns = min(self.rtt_min_ns or lat, lat)
+            slow = lat > FLOW_PROBE_SLOW * self.rtt_min_ns
+        else:
+            self.lat_ewma_ns = lat if not self.lat_ewma_ns else self.lat_ewma_ns * 0.9 + lat * 0.1
+            slow = lat > FLOW_LATENCY_MS * 1_000_000
+        if slow:
+            self.congestion(t_done)
+        elif self.rate is not None and t_done - self.t_ai >= FLOW_HOLD_MS * 1_000_000:
+            self.rate += FLOW_AI_FPS
+            self.t_ai = t_done
+            if self.rate >= FLOW_UNCAP_FPS:
+                self.rate = None
+
+    @property
+    def sustained_fps(self) -> float:
+        return 1e9 / self.busy_ewma_ns if self.busy_ewma_ns else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rate_limit_fps": round(self.rate, 1) if self.rate else None,
+            "gap_ms": round(1000.0 / self.rate, 2) if self.rate else 0,
+            "congestions": self.congestions,
+            "error_rate": round(self.err_ewma, 3),
+            "sustained_fps": round(self.sustained_fps, 1),
+            "write_ms_ewma": round(self.lat_ewma_ns / 1e6, 3),
+            "probe_rtt": self.probe_rtt.snapshot() if self.probe_rtt.count else None,
+        }
+
+
+class UpstreamWriteQueue:
+    """
+    Write-Queue für den Upstream-Loop (nur im Loop-Thread benutzen).
+    Items: [data, t_rx, t_enq, key, on_sent] bzw. [frames, t_rx, t_enq, "batch", None] für atomare Batches.
+    on_sent(t_write) kommt nach erfolgreichem Write mit dem Start dieses Writes (im Loop-Thread).
+    Coalescing: neuer Latest-Wins Frame -> alter wartender wird entwertet (data=None), der neue hinten angehängt.
+    """
+    def __init__(self, coalesce: bool = UPSTREAM_COALESCE):
+        self.coalesce = coalesce
+        self.items = deque()
+        self.pending = {}              # key -> item (Latest-Wins)
+        self.live = 0
+        self.wake = asyncio.Event()
+        self.coalesced = 0
+
+    def put(self, data: bytes, t_rx: int, coalesce: bool = True, on_sent=None):
+        key = coalesce_key(data) if self.coalesce and coalesce else None
+        item = [data, t_rx, time.monotonic_ns(), key, on_sent]
+        if key is not None:
+            old = self.pending.get(key)
+            if old is not None:
+                old[0] = None
+                self.live -= 1
+                self.coalesced += 1
+            self.pending[key] = item
+        self.items.append(item)
+        self.live += 1
+        self.wake.set()
+
+    def put_batch(self, frames, t_rx: int):
+        # frames = [(bytes, delay_ms_before_next), ...] – wird am Stück gesendet, kein Coalescing
+        self.items.append([list(frames), t_rx, time.monotonic_ns(), "batch", None])
+        self.live += 1
+        self.wake.set()
+
+    def pop(self):
+        while self.items:
+            item = self.items.popleft()
+            if item[0] is None:
+                continue                # coalesced
+            if item[3] is not None and item[3] != "batch" and self.pending.get(item[3]) is item:
+                del self.pending[item[3]]
+            self.live -= 1
+            return item
+        self.wake.clear()
+        return None
+
+    def __len__(self):
+        return self.live
+
+
 class Upstream:
-    def __init__(self, addr: str, notify_cb):
+    """
+    Verbindung zum echten Board. client_factory(addr, disconnected_callback=...) liefert den Client
+    (Standard BleakClient; LoopbackBoard für Betrieb/Benchmarks ohne Bluetooth), benutzt werden
+    connect / start_notify / write_gatt_char / disconnect / is_connected.
+    """
+    def __init__(self, addr: str, notify_cb, metrics: StageMetrics = None, client_factory=None):
         self.addr = addr
+        self.client_factory = client_factory or BleakClient
         self.notify_cb = notify_cb
+        self.metrics = metrics
         self.loop = None
         self.thread = None
         self.client = None
         self.stop_flag = False
-        self.write_queue = None
+        self.wq = UpstreamWriteQueue()
+        self._loop_thread = None
+
+        # counters
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.retries = 0
+        self.dropped = 0                    # nach FLOW_RETRIES verworfen (Verbindung blieb bestehen)
+        self.flow = WriteFlowControl()
+        self.queue_latency = LatencyHistogram()
+        self._rate = deque(maxlen=4096)     # monotonic Zeitpunkte gesendeter Frames (fps)
+
+    def start(self, loop=None):
+        if self.client_factory is None:
+            log("❌ bleak not installed – no upstream")
+            return
+        if loop is None:
+            self.thread = threading.Thread(target=self._thread_main, daemon=True)
+            self.thread.start()
+            return
 
-    def start(self):
-        self.thread = threading.Thread(target=self._thread_main, daemon=True)
-        self.thread.start()
+        # im gemeinsamen Loop (AsyncRuntime) laufen
+        def _init():
+            self.loop = loop
+            self._loop_thread = threading.get_ident()
+            loop.create_task(self._run())
+        loop.call_soon_threadsafe(_init)
 
     def stop(self):
         self.stop_flag = True
-        try:
-            if self.loop:
-                self.loop.call_soon_threadsafe(lambda: None)
-        except Exception:
-            pass
+        self._call(self.wq.wake.set)
 
-    def write(self, data: bytes):
-        if not data or not self.loop or not self.write_queue:
+    def _call(self, fn, *args):
+        # im Loop-Thread direkt, sonst ein call_soon_threadsafe (kein Coroutine-Objekt pro Write)
+        if not self.loop:
             return
+        if threading.get_ident() == self._loop_thread:
+            fn(*args)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(fn, *args)
+            except RuntimeError:
+                pass   # Loop schon zu
+
+    def write(self, data: bytes, t_rx: int = None, coalesce: bool = True, on_sent=None):
+        # coalesce=False: jeder Frame zählt (Sweeps), auch Ring-/Settings-Frames
+        # on_sent(t_write): Frame wirklich geschrieben (Start des erfolgreichen Writes, monotonic ns)
+        if not data or not self.loop:
+            return
+        self._call(self.wq.put, bytes(data), t_rx or time.monotonic_ns(), coalesce, on_sent)
 
-        async def _qput():
-            await self.write_queue.put(bytes(data))
-
-        asyncio.run_coroutine_threadsafe(_qput(), self.loop)
+    def write_batch(self, frames, t_rx: int = None):
+        """frames = [(bytes, delay_ms), ...] – atomar (keine anderen Writes dazwischen), Pause nach jedem Frame."""
+        frames = [(bytes(d), max(0, int(ms or 0))) for d, ms in frames if d]
+        if not frames or not self.loop:
+            return
+        self._call(self.wq.put_batch, frames, t_rx or time.monotonic_ns())
 
     def _thread_main(self):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
-        self.write_queue = asyncio.Queue()
+        self._loop_thread = threading.get_ident()
         self.loop.run_until_complete(self._run())
 
     async def _find_addr_by_scan(self):
+        if BleakScanner is None or self.client_factory is not BleakClient:
+            return None
         devs = await BleakScanner.discover(timeout=6)
         for d in devs:
             if d.name and REAL_BOARD_NAME in d.name.upper():
                 return d.address
         return None
 
+    async def _send(self, data: bytes, t_rx: int, t_enq: int, on_sent=None):
+        fc = self.flow
+        wait = fc.wait_ns(time.monotonic_ns())
+        if wait > 0:
+            await asyncio.sleep(wait / 1e9)
+        probe = fc.probe_due()
+        retries = FLOW_RETRIES if fc.enabled else 0
+        for attempt in range(retries + 1):
+            t_deq = time.monotonic_ns()
+            try:
+                await self.client.write_gatt_char(CHAR_WRITE_UUID, data, response=probe)
+                break
+            except Exception:
+                self.write_errors += 1
+                fc.on_error(time.monotonic_ns())
+                if attempt == retries or not self.client.is_connected:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(FLOW_RETRY_MS * (1 << attempt) / 1000.0)
+        t_done = time.monotonic_ns()
+        # Rückstau: Frame lag schon in der Queue, als der vorige fertig war
+        fc.on_sent(t_deq, t_done, t_enq <= fc.t_done, probe)
+        self.sent_frames += 1
+        self.sent_bytes += len(data)
+        self._rate.append(t_done)
+        if on_sent:
+            on_sent(t_deq)
+        if self.metrics:
+            self.metrics.record("app->board", "rx->dequeued", t_deq - t_rx)
+            self.metrics.record("app->board", "gatt_write", t_done - t_deq)
+            self.metrics.record("app->board", "rx->written", t_done - t_rx)
+
+    async def _write_loop(self):
+        wq = self.wq
+        while not self.stop_flag and self.client.is_connected:
+            item = wq.pop()
+            if item is None:
+                # event-driven: schläft bis put()/stop()/disconnect
+                await wq.wake.wait()
+                continue
+            data, t_rx, t_enq, key, on_sent = item
+            self.queue_latency.add(time.monotonic_ns() - t_enq)
+            try:
+                if key == "batch":
+                    self.batches += 1
+                    for frame, delay_ms in data:
+                        try:
+                            await self._send(frame, t_rx, t_enq)
+                        except Exception as e:
+                            # nur dieser Frame fällt weg, der Rest des Batches geht trotzdem raus
+                            if not self._drop(e):
+                                raise
+                        if delay_ms:
+                            await asyncio.sleep(delay_ms / 1000.0)
+                        t_enq = 0   # Rest des Batches wartet immer schon
+                else:
+                    await self._send(data, t_rx, t_enq, on_sent)
+            except Exception as e:
+                if self._drop(e):
+                    continue
+                log(f"❌ REAL write failed: {e}")
+                break
+
+    def _drop(self, e: Exception) -> bool:
+        # Retries aufgebraucht, Link steht noch: Frame verwerfen statt Reconnect
+        if not (self.flow.enabled and self.client.is_connected):
+            return False
+        self.dropped += 1
+        log(f"⚠️ REAL write failed after {FLOW_RETRIES} retries, frame dropped: {e}")
+        return True
+
     async def _run(self):
         while not self.stop_flag:
             try:
                 addr = self.addr
                 log(f"🔗 Connecting REAL board {addr} ...")
-                self.client = BleakClient(addr)
+                self.client = self.client_factory(addr, disconnected_callback=lambda _c: self.wq.wake.set())
                 await asyncio.wait_for(self.client.connect(), timeout=UPSTREAM_CONNECT_TIMEOUT)
                 log(f"✅ Connected REAL: {self.client.is_connected}")
 
                 def _on_notify(_uuid, data: bytearray):
-                    self.notify_cb(bytes(data))
+                    self.notify_cb(bytes(data), time.monotonic_ns())
+
+                await self.client.start_notify(CHAR_NOTIFY_UUID, _on_notify)
+                log("📡 Subscribed REAL notify")
+
+                await self._write_loop()
+
+                try:
+                    await self.client.disconnect()
+                except Exception:
+                    pass
+                log("🔌 REAL disconnected")
+
+            except Exception as e:
+                log(f"❌ Failed to connect REAL board: {repr(e)}")
+                try:
+                    new_addr = await self._find_addr_by_scan()
+                    if new_addr and new_addr != self.addr:
+                        log(f"🔁 Updated REAL addr from scan: {self.addr} -> {new_addr}")
+                        self.addr = new_addr
+                except Exception:
+                    pass
+
+            for _ in range(int(UPSTREAM_RETRY_SEC * 10)):
+                if self.stop_flag:
+                    break
+                await asyncio.sleep(0.1)
+
+    def stats(self) -> dict:
+        now = time.monotonic_ns()
+        recent = sum(1 for t in self._rate if now - t <= 5_000_000_000)
+        return {
+            "connected": bool(self.client and self.client.is_connected),
+            "queue_depth": len(self.wq),
+            "coalesce": self.wq.coalesce,
+            "coalesced": self.wq.coalesced,
+            "sent_frames": self.sent_frames,
+            "sent_bytes": self.sent_bytes,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "fps_5s": round(recent / 5.0, 1),
+            "flow": self.flow.stats(),
+            "queue_latency": self.queue_latency.snapshot(),
+        }
+
+
+# =========================
+# Runtime (GLib/D-Bus + asyncio)
+# =========================
+class AsyncRuntime:
+    """
+    integrated: asyncio läuft AUF dem GLib-Mainloop (gi.events.GLibEventLoopPolicy, PyGObject >= 3.50).
+      BlueZ D-Bus Objekte, bleak Callbacks, Upstream-Writer und Web-Server teilen sich einen Thread:
+      Board-Notify -> PropertiesChanged und App-Write -> write_gatt_char ohne Thread-Wechsel.
+    threaded: Fallback – eigener asyncio-Thread, GLib.MainLoop im Main-Thread, Hop über GLib.idle_add
+      bzw. loop.call_soon_threadsafe.
+    asyncio: ohne PyGObject (Loopback/Benchmarks) – nur ein asyncio Loop, GLib wird durch AsyncioGLib
+      auf diesem Loop ersetzt (zählt wie integrated).
+    """
+    def __init__(self, mode: str = RUNTIME_MODE):
+        global GLib
+        self.mode = mode
+        self.integrated = False
+        self.thread = None
+        self.mainloop = None
+        if not HAVE_GLIB:
+            self.mode = "asyncio"
+            self.loop = asyncio.new_event_loop()
+            self.integrated = True
+            GLib = AsyncioGLib(self.loop)
+            return
+        if mode in ("auto", "integrated"):
+            try:
+                from gi.events import GLibEventLoopPolicy
+                policy = GLibEventLoopPolicy()
+                asyncio.set_event_loop_policy(policy)
+                self.loop = policy.get_event_loop()
+                self.integrated = True
+            except ImportError:
+                if mode == "integrated":
+                    raise
+        if not self.integrated:
+            self.loop = asyncio.new_event_loop()
+
+    def start(self):
+        if self.integrated:
+            return   # läuft in run() im Main-Thread
+        def _main():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_forever()
+        self.thread = threading.Thread(target=_main, name="asyncio", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Blockiert im Main-Thread bis stop() / Ctrl+C."""
+        if self.integrated:
+            self.loop.run_forever()
+        else:
+            self.mainloop = GLib.MainLoop()
+            self.mainloop.run()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        try:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        except Exception:
+            pass
+        if self.mainloop:
+            self.mainloop.quit()
+
+
+def bench_hops(n: int = 20000):
+    """
+    Misst die Kosten eines Frame-Hops zwischen Threads/Loops vs. direkt im selben Loop.
+    asyncio: run_coroutine_threadsafe(queue.put) aus fremdem Thread vs. put_nowait im Loop.
+    GLib (falls vorhanden): idle_add aus fremdem Thread bis Callback im GLib-Loop vs. Direktaufruf.
+    """
+    def pct(xs, p):
+        if not xs:
+            return 0.0
+        xs = sorted(xs)
+        return xs[min(len(xs) - 1, int(p / 100.0 * len(xs)))] / 1000.0
+
+    def report(name, xs):
+        log(f"  {name:<44} p50 {pct(xs, 50):8.1f} µs   p99 {pct(xs, 99):8.1f} µs")
+
+    # --- asyncio: cross-thread vs same-loop ---
+    loop = asyncio.new_event_loop()
+    q = None
+    lat = []
+
+    async def consumer(count):
+        for _ in range(count):
+            t0 = await q.get()
+            lat.append(time.monotonic_ns() - t0)
+
+    async def init():
+        nonlocal q
+        q = asyncio.Queue()
+
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+    asyncio.run_coroutine_threadsafe(init(), loop).result()
+    fut = asyncio.run_coroutine_threadsafe(consumer(n), loop)
+    for _ in range(n):
+        t0 = time.monotonic_ns()
+        async def _qput(v=t0):
+            await q.put(v)
+        asyncio.run_coroutine_threadsafe(_qput(), loop)
+        time.sleep(0)
+    fut.result()
+    cross = list(lat)
+
+    lat.clear()
+    fut = asyncio.run_coroutine_threadsafe(consumer(n), loop)
+    for _ in range(n):
+        loop.call_soon_threadsafe(q.put_nowait, time.monotonic_ns())
+        time.sleep(0)
+    fut.result()
+    cross_nowait = list(lat)
+
+    lat.clear()
+    async def same_loop():
+        task = asyncio.ensure_future(consumer(n))
+        for _ in range(n):
+            q.put_nowait(time.monotonic_ns())
+            await asyncio.sleep(0)
+        await task
+    asyncio.run_coroutine_threadsafe(same_loop(), loop).result()
+    same = list(lat)
+    loop.call_soon_threadsafe(loop.stop)
+
+    log(f"Hop benchmark ({n} frames)")
+    report("asyncio run_coroutine_threadsafe (thread hop)", cross)
+    report("asyncio call_soon_threadsafe (thread hop)", cross_nowait)
+    report("asyncio put_nowait (same loop)", same)
+
+    # --- GLib: idle_add hop vs direct call ---
+    try:
+        ctx_loop = GLib.MainLoop()
+    except Exception:
+        log("  GLib not available – skipping idle_add measurement")
+        return
+    lat.clear()
+
+    def cb(t0):
+        lat.append(time.monotonic_ns() - t0)
+        if len(lat) >= n:
+            ctx_loop.quit()
+        return False
+
+    def producer():
+        for _ in range(n):
+            GLib.idle_add(cb, time.monotonic_ns())
+            time.sleep(0)
 
-                await self.client.start_notify(CHAR_NOTIFY_UUID, _on_notify)
-                log("📡 Subscribed REAL notify")
+    threading.Thread(target=producer, daemon=True).start()
+    ctx_loop.run()
+    glib_hop = list(lat)
+    lat.clear()
+    for _ in range(n):
+        cb(time.monotonic_ns())
+    report("GLib.idle_add from bleak thread (thread hop)", glib_hop)
+    report("direct call (integrated runtime)", lat)
 
-                while not self.stop_flag and self.client.is_connected:
-                    try:
-                        data = await asyncio.wait_for(self.write_queue.get(), timeout=0.25)
-                    except asyncio.TimeoutError:
-                        continue
-                    try:
-                        await self.client.write_gatt_char(CHAR_WRITE_UUID, data, response=False)
-                    except Exception as e:
-                        log(f"❌ REAL write failed: {e}")
-                        break
 
-                try:
-                    await self.client.disconnect()
-                except Exception:
-                    pass
-                log("🔌 REAL disconnected")
+class _MergeSliceReassembler:
+    # Referenz für bench-reassembly: Userscript-Ansatz (appendToBuffer/extractFrames),
+    # pro Chunk neuer zusammengeführter Buffer, nach jedem Frame neu slicen
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, chunk, emit) -> int:
+        buf = self.buf + chunk
+        n = 0
+        while True:
+            i = buf.find(b"@")
+            if i < 0:
+                break
+            emit(buf[:i + 1])
+            n += 1
+            buf = buf[i + 1:]
+        self.buf = buf
+        return n
 
-            except Exception as e:
-                log(f"❌ Failed to connect REAL board: {repr(e)}")
-                try:
-                    new_addr = await self._find_addr_by_scan()
-                    if new_addr and new_addr != self.addr:
-                        log(f"🔁 Updated REAL addr from scan: {self.addr} -> {new_addr}")
-                        self.addr = new_addr
-                except Exception:
-                    pass
 
-            for _ in range(int(UPSTREAM_RETRY_SEC * 10)):
-                if self.stop_flag:
-                    break
-                await asyncio.sleep(0.1)
+def bench_reassembly(n: int = 2_000_000, max_chunk: int = 20, seed: int = 1, rounds: int = 3):
+    """
+    Micro-Benchmark FrameReassembler vs. Userscript-Ansatz (merge + slice), best of `rounds`.
+    n zufällige Hit-Frames (jeder 997. mit Connect-Prefix), einmal als ganze Notifies
+    (ein Notify == ein Frame) und einmal zufällig in 1..max_chunk Byte große Notifies zerlegt.
+    """
+    rnd = random.Random(seed)
+    codes = list(HIT_TABLE)
+    frames = [rnd.choice(codes) for _ in range(n)]
+    for i in range(0, n, 997):
+        frames[i] = BOARD_CONNECT_PREFIX + frames[i]
+    stream = b"".join(frames)
+    fragmented = []
+    pos = 0
+    while pos < len(stream):
+        step = rnd.randint(1, max_chunk)
+        fragmented.append(stream[pos:pos + step])
+        pos += step
+
+    # Korrektheit (Frames kopieren nur hier)
+    check = FrameReassembler()
+    got = []
+    collect = got.append
+    for c in fragmented:
+        check.feed(c, lambda f: collect(bytes(f)))
+    assert got == frames, "reassembly mismatch"
+    got.clear()
+
+    count = 0
+
+    def on_frame(f):
+        nonlocal count
+        count += 1
+
+    def run_once(factory, chunks) -> float:
+        nonlocal count
+        count = 0
+        feed = factory().feed
+        t0 = time.perf_counter()
+        for c in chunks:
+            feed(c, on_frame)
+        dt = time.perf_counter() - t0
+        assert count == n, f"expected {n} frames, got {count}"
+        return dt
+
+    impls = (("FrameReassembler", FrameReassembler), ("merge + slice (Userscript-Stil)", _MergeSliceReassembler))
+    log(f"Reassembly benchmark ({n} frames, {len(stream)} bytes, best of {rounds}, Runden abwechselnd, ohne GC)")
+    gc_was = gc.isenabled()
+    gc.disable()   # sonst misst die GC-Runde über die großen Listen mit, je nachdem wer gerade dran ist
+    try:
+        for label, chunks in (("1 Notify == 1 Frame", frames), (f"fragmentiert 1..{max_chunk} B", fragmented)):
+            log(f"  {label}: {len(chunks)} chunks")
+            best = {}
+            for _ in range(rounds):
+                for name, factory in impls:
+                    dt = run_once(factory, chunks)
+                    best[name] = min(best.get(name, dt), dt)
+            for name, _factory in impls:
+                dt = best[name]
+                log(f"    {name:<34} {dt:7.3f} s   {n / dt / 1e6:6.2f} M frames/s   {dt / len(chunks) * 1e9:6.0f} ns/chunk")
+    finally:
+        if gc_was:
+            gc.enable()
+    st = check.stats()
+    log(f"  Zähler (fragmentiert): split_frames={st['split_frames']}  partial_chunks={st['partial_chunks']}  "
+        f"garbage_bytes={st['garbage_bytes']}  max_pending={st['max_pending']}")
 
 
 # =========================
@@ -604,7 +4623,7 @@ def find_adapter(bus):
 
 
 # =========================
-# Web UI (Flask + SSE)
+# Web UI (asyncio HTTP + SSE)
 # =========================
 def parse_hex_string(s: str) -> bytes:
     s = (s or "").replace(",", " ").replace("0x", "").replace("0X", "").strip()
@@ -625,6 +4644,164 @@ def encode_raw_ascii(raw: str) -> bytes:
     return raw.encode("ascii", errors="strict")
 
 
+# ---- minimal asyncio HTTP/1.1 server (stdlib only, ersetzt Flask) ----
+HTTP_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+                500: "Internal Server Error"}
+HTTP_MAX_HEADER = 64 * 1024
+HTTP_MAX_BODY = 4 * 1024 * 1024
+NO_CACHE_HEADERS = {
+    # No-cache headers so UI changes always show up
+    "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+class HttpRequest:
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = parts.path or "/"
+        self.args = dict(parse_qsl(parts.query, keep_blank_values=True))
+        self.headers = headers          # keys lower-case
+        self.body = body
+
+    def get_json(self) -> dict:
+        # wie Flask get_json(force=True, silent=True)
+        try:
+            data = json.loads(self.body.decode("utf-8") or "null")
+        except Exception:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+class HttpResponse:
+    def __init__(self, body=b"", status: int = 200, content_type: str = "text/plain; charset=utf-8", headers=None):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+        self.headers = dict(headers or {})
+
+
+class StreamResponse:
+    """Body aus einem async generator (SSE); Verbindung wird danach geschlossen."""
+    def __init__(self, agen, content_type: str = "text/event-stream", headers=None):
+        self.agen = agen
+        self.status = 200
+        self.content_type = content_type
+        self.headers = dict(headers or {})
+
+
+def json_response(obj, status: int = 200) -> HttpResponse:
+    return HttpResponse(json.dumps(obj, ensure_ascii=False), status, "application/json")
+
+
+class WebApp:
+    """Routen wie bei Flask (@web.get / @web.post), Handler sind async def handler(req)."""
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, method: str, path: str):
+        def deco(fn):
+            self.routes[(method, path)] = fn
+            return fn
+        return deco
+
+    def get(self, path: str):
+        return self.route("GET", path)
+
+    def post(self, path: str):
+        return self.route("POST", path)
+
+    async def dispatch(self, req: HttpRequest):
+        fn = self.routes.get((req.method, req.path))
+        if fn is None:
+            if any(p == req.path for (_m, p) in self.routes):
+                return json_response({"ok": False, "error": "method not allowed"}, 405)
+            return json_response({"ok": False, "error": "not found"}, 404)
+        try:
+            return await fn(req)
+        except Exception as e:
+            log(f"⚠️ Web handler {req.method} {req.path} failed: {e!r}")
+            return json_response({"ok": False, "error": str(e)}, 500)
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise ValueError("header too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise ValueError("bad request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if length > HTTP_MAX_BODY:
+            raise ValueError("body too large")
+        body = await reader.readexactly(length) if length else b""
+        return HttpRequest(method.upper(), target, headers, body)
+
+    @staticmethod
+    def _head(status: int, content_type: str, headers: dict, extra: dict) -> bytes:
+        out = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}", f"Content-Type: {content_type}"]
+        for k, v in {**NO_CACHE_HEADERS, **headers, **extra}.items():
+            out.append(f"{k}: {v}")
+        return ("\r\n".join(out) + "\r\n\r\n").encode("latin-1")
+
+    async def handle_conn(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    resp = json_response({"ok": False, "error": str(e)}, 400)
+                    writer.write(self._head(400, resp.content_type, {}, {"Content-Length": len(resp.body), "Connection": "close"}) + resp.body)
+                    break
+                if req is None:
+                    break
+
+                resp = await self.dispatch(req)
+
+                if isinstance(resp, StreamResponse):
+                    writer.write(self._head(resp.status, resp.content_type, resp.headers, {"Connection": "close"}))
+                    try:
+                        async for chunk in resp.agen:
+                            writer.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                            await writer.drain()
+                    finally:
+                        await resp.agen.aclose()
+                    break
+
+                keep = req.headers.get("connection", "").lower() != "close"
+                writer.write(self._head(resp.status, resp.content_type, resp.headers, {
+                    "Content-Length": len(resp.body),
+                    "Connection": "keep-alive" if keep else "close",
+                }) + resp.body)
+                await writer.drain()
+                if not keep:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            log(f"⚠️ Web connection error: {e!r}")
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def serve(self, host: str, port: int):
+        return await asyncio.start_server(self.handle_conn, host, port, limit=HTTP_MAX_HEADER)
+
+
 HTML = r"""
 <!doctype html>
 <html lang="de">
@@ -671,6 +4848,7 @@ HTML = r"""
       word-break:break-all;
     }
     td.comment{white-space:normal;}
+    tr.spacer td{padding:0; border:0;}
     .pill{display:inline-block; padding:2px 8px; border-radius:999px; font-family:var(--sans); font-size:11px; border:1px solid var(--stroke);}
     .dir-a{background:rgba(251,191,36,.10); border-color:rgba(251,191,36,.35);}
     .dir-b{background:rgba(54,211,153,.10); border-color:rgba(54,211,153,.35);}
@@ -680,6 +4858,10 @@ HTML = r"""
     .filters input{width:260px; font-family:var(--sans);}
     .small{font-size:11px; color:var(--muted);}
     .btns{display:flex; gap:8px; flex-wrap:wrap;}
+    table.metrics{font-size:11px;}
+    table.metrics th, table.metrics td{padding:3px 6px; text-align:right;}
+    table.metrics th:first-child, table.metrics td:first-child{text-align:left;}
+    table.metrics tr.dirhead td{color:var(--muted); text-align:left; padding-top:8px;}
 
     /* Dartboard */
     #dartboard .seg { cursor:pointer; opacity:0.9; }
@@ -741,6 +4923,77 @@ HTML = r"""
         </svg>
       </div>
 
+      <h2 style="margin-top:18px;">Replay</h2>
+      <div class="row">
+        <label>Capture</label>
+        <input id="rpFile" type="text" placeholder="leer = laufender Capture, z.B. cap-20260131-201500.gbc"/>
+      </div>
+      <div class="row">
+        <label>Speed</label>
+        <input id="rpSpeed" type="text" value="1" style="width:60px;" title="1 = Originaltiming, 2 = doppelt, 0 = max"/>
+        <label style="width:auto;"><input id="rpB2A" type="checkbox" checked/> Board→App</label>
+        <label style="width:auto;"><input id="rpA2B" type="checkbox"/> App→Board</label>
+      </div>
+      <div class="btns">
+        <button class="primary" onclick="replayStart()">Start</button>
+        <button onclick="replayCtl('pause')">Pause</button>
+        <button onclick="replayCtl('resume')">Resume</button>
+        <button onclick="replayCtl('stop')">Stop</button>
+      </div>
+      <input id="rpSeek" type="range" min="0" max="0" step="0.1" value="0" style="width:100%; margin-top:8px;"
+             oninput="rpSeeking = true" onchange="rpSeeking = false; replayCtl('seek', {to_s: +this.value})"/>
+      <div class="small" id="rpInfo">–</div>
+
+      <h2 style="margin-top:18px;">Sweep → Board</h2>
+      <div class="row">
+        <label>Template</label>
+        <input id="swTpl" type="text" value="01 FF 00 00 00 00 00 00 00 00 1C 00 01 00 00 01"/>
+      </div>
+      <div class="row">
+        <label>Achsen</label>
+        <input id="swAxes" type="text" value='[{"pos": 0, "from": 0, "to": 255}]'
+               title='[{"pos": 12, "from": 0, "to": 15}] • mehrere Positionen: "pos": [1,2,3] • "size": 2 = LE • "values": [..]'/>
+      </div>
+      <div class="row">
+        <label>Gap ms</label>
+        <input id="swGap" type="text" value="0" style="width:60px;" title="Mindestabstand, 0 = so schnell wie der Link"/>
+        <label style="width:auto;">Fenster ms</label>
+        <input id="swWin" type="text" value="250" style="width:60px;" title="Board-Antworten so lange dem Schritt zuordnen"/>
+      </div>
+      <div class="btns">
+        <button class="primary" onclick="sweepStart()">Start</button>
+        <button onclick="sweepCtl('pause')">Pause</button>
+        <button onclick="sweepCtl('resume')">Resume</button>
+        <button onclick="sweepCtl('stop')">Stop</button>
+      </div>
+      <div class="small" id="swInfo">–</div>
+
+      <h2 style="margin-top:18px;">Animation → Board</h2>
+      <div class="row">
+        <label>Animation</label>
+        <select id="anName"></select>
+      </div>
+      <div class="row">
+        <label>Params</label>
+        <input id="anParams" type="text" value='{"targets": ["T20", "T19", "D12"]}'
+               title='JSON, z.B. {"targets": ["T20", "D10"], "step_ms": 300} • {} = Standardwerte'/>
+      </div>
+      <div class="btns">
+        <button class="primary" onclick="animPlay()">Play</button>
+        <button onclick="animStop()">Stop</button>
+      </div>
+      <div class="small" id="anInfo">–</div>
+
+      <h2 style="margin-top:18px;">Latenz (Stages)</h2>
+      <table class="metrics">
+        <thead><tr><th>Stage</th><th>n</th><th>p50</th><th>p95</th><th>p99</th><th>max</th></tr></thead>
+        <tbody id="metricsBody"><tr><td colspan="6" class="muted">…</td></tr></tbody>
+      </table>
+      <div class="btns" style="margin-top:6px;">
+        <button onclick="resetMetrics()">Reset Metrics</button>
+      </div>
+      <div class="small" id="metricsInfo">µs, monotonic ns Stempel pro Frame</div>
+
       <h2 style="margin-top:18px;">Log</h2>
       <div class="filters">
         <input id="filter" placeholder="Filter (z.B. 11.6@ oder 01 00)" oninput="applyFilter()"/>
@@ -748,6 +5001,7 @@ HTML = r"""
         <button onclick="reload()">Reload</button>
       </div>
       <div class="small">Kommentare: in der Tabelle bearbeiten, Enter speichert. (Persistiert in {{logfile}})</div>
+      <div class="small" id="logCount"></div>
     </div>
 
     <div class="card log">
@@ -758,6 +5012,7 @@ HTML = r"""
             <th style="width:110px;">Dir</th>
             <th style="width:60px;">Kind</th>
             <th style="width:240px;">Msg (ASCII)</th>
+            <th style="width:200px;">Decoded</th>
             <th>Msg (HEX)</th>
             <th style="width:340px;">Kommentar</th>
           </tr>
@@ -770,45 +5025,190 @@ HTML = r"""
 <script>
   const tbody = document.getElementById('tbody');
   const statusEl = document.getElementById('status');
-  let allRows = [];
+  const logDiv = document.querySelector('.log');
+
+  // ========== Log: spaltenweiser Speicher + virtualisierte Tabelle ==========
+  // Nur die sichtbaren Zeilen (+ Überhang) stehen im DOM; Einträge liegen in parallelen Arrays,
+  // begrenzt auf LOG_UI_MAX (älteste fliegen raus). Filter wird nur für neue Zeilen ausgewertet.
+  const LOG_UI_MAX = 20000;
+  const LOG_UI_INITIAL = 5000;
+  const OVERSCAN = 12;
+  const COLS = ["id", "seq", "t", "dir", "kind", "ascii", "dec", "hex", "comment", "search"];
+  let C = {};                 // Spalten
+  let base = 0;               // absolute Position von C.id[0]
+  let idPos = new Map();      // id -> absolute Position
+  let drafts = new Map();     // id -> noch nicht gespeicherter Kommentar
+  let lastSeq = 0;            // höchste seq in der Tabelle -> nach Reconnect nur das Delta holen
+  let filterStr = "";
+  let matches = [];           // absolute Positionen der Treffer (aufsteigend)
+  let mHead = 0;              // erster noch gültiger Index in matches (nach Eviction)
+  let rowH = 34;              // gemessene mittlere Zeilenhöhe (Zeilen umbrechen, daher gemittelt)
+  let renderPending = false;
+  let stickBottom = true;
+
+  function esc(s){ return (s||"").replaceAll("&","&amp;").replaceAll("<","&lt;").replaceAll(">","&gt;").replaceAll('"',"&quot;"); }
+
+  function resetStore(){
+    C = {};
+    for (const k of COLS) C[k] = [];
+    base = 0;
+    idPos = new Map();
+    matches = [];
+    mHead = 0;
+    lastSeq = 0;
+  }
+  resetStore();
+
+  function searchText(t, dir, kind, ascii, hex, dec, comment){
+    return (t+" "+dir+" "+kind+" "+(ascii||"")+" "+(hex||"")+" "+dec+" "+(comment||"")).toLowerCase();
+  }
+
+  function visibleCount(){ return matches.length - mHead; }
+
+  function addRows(entries){
+    const f = filterStr;
+    for (const entry of entries){
+      if (idPos.has(entry.id)) continue;
+      if (entry.seq > lastSeq) lastSeq = entry.seq;
+      const dec = (entry.dec && entry.dec.label) || "";
+      const abs = base + C.id.length;
+      idPos.set(entry.id, abs);
+      C.id.push(entry.id);
+      C.seq.push(entry.seq || 0);
+      C.t.push(entry.t || "");
+      C.dir.push(entry.dir === "app->board" ? 0 : 1);
+      C.kind.push(entry.kind || "");
+      C.ascii.push(entry.ascii || "");
+      C.dec.push(dec);
+      C.hex.push(entry.hex || "");
+      C.comment.push(entry.comment || "");
+      const search = searchText(entry.t, entry.dir, entry.kind, entry.ascii, entry.hex, dec, entry.comment);
+      C.search.push(search);
+      if (!f || search.includes(f)) matches.push(abs);
+    }
+    evict();
+    scheduleRender();
+  }
+
+  function evict(){
+    const over = C.id.length - LOG_UI_MAX;
+    if (over <= 0) return;
+    // in Blöcken entfernen, nicht bei jedem neuen Eintrag
+    const n = Math.max(over, Math.floor(LOG_UI_MAX / 10));
+    for (let i = 0; i < n; i++){ idPos.delete(C.id[i]); drafts.delete(C.id[i]); }
+    for (const k of COLS) C[k].splice(0, n);
+    base += n;
+    while (mHead < matches.length && matches[mHead] < base) mHead++;
+    if (mHead > 4096){ matches = matches.slice(mHead); mHead = 0; }
+  }
+
+  function applyFilter(){
+    const f = (document.getElementById('filter').value||"").toLowerCase().trim();
+    if (f === filterStr) return;
+    const out = [];
+    if (f && filterStr && f.includes(filterStr)){
+      // Filter verschärft: nur bisherige Treffer prüfen
+      for (let i = mHead; i < matches.length; i++){
+        const abs = matches[i];
+        if (C.search[abs - base].includes(f)) out.push(abs);
+      }
+    } else {
+      for (let i = 0; i < C.id.length; i++){
+        if (!f || C.search[i].includes(f)) out.push(base + i);
+      }
+    }
+    filterStr = f;
+    matches = out;
+    mHead = 0;
+    scheduleRender();
+  }
 
-  function esc(s){ return (s||"").replaceAll("&","&amp;").replaceAll("<","&lt;").replaceAll(">","&gt;"); }
+  function scheduleRender(){
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(render);
+  }
 
-  function addRow(entry, toTop=false){
-    allRows.push(entry);
-    const tr = document.createElement('tr');
-    tr.dataset.id = entry.id;
-    tr.dataset.search = (entry.t+" "+entry.dir+" "+entry.kind+" "+(entry.ascii||"")+" "+(entry.hex||"")+" "+(entry.comment||"")).toLowerCase();
+  function editing(){
+    const a = document.activeElement;
+    return a && a.tagName === "INPUT" && tbody.contains(a);
+  }
 
-    const dirPill = entry.dir === "app->board"
+  function rowHtml(abs){
+    const i = abs - base;
+    const id = C.id[i];
+    const dirPill = C.dir[i] === 0
       ? `<span class="pill dir-a">APP → BOARD</span>`
       : `<span class="pill dir-b">BOARD → APP</span>`;
-
-    tr.innerHTML = `
-      <td>${esc(entry.t)}</td>
+    const comment = drafts.has(id) ? drafts.get(id) : C.comment[i];
+    return `<tr data-id="${esc(id)}">
+      <td>${esc(C.t[i])}</td>
       <td>${dirPill}</td>
-      <td class="kind">${esc(entry.kind||"")}</td>
-      <td class="msg">${esc(entry.ascii||"")}</td>
-      <td class="msg">${esc(entry.hex||"")}</td>
+      <td class="kind">${esc(C.kind[i])}</td>
+      <td class="msg">${esc(C.ascii[i])}</td>
+      <td class="msg">${esc(C.dec[i])}</td>
+      <td class="msg">${esc(C.hex[i])}</td>
       <td class="comment">
-        <input type="text" value="${esc(entry.comment||"")}" style="width:100%; font-family: var(--sans);"
-               onkeydown="if(event.key==='Enter'){ saveComment('${entry.id}', this.value); }"/>
+        <input type="text" value="${esc(comment)}" data-id="${esc(id)}" style="width:100%; font-family: var(--sans);"/>
       </td>
-    `;
-
-    if (toTop && tbody.firstChild) tbody.insertBefore(tr, tbody.firstChild);
-    else tbody.appendChild(tr);
+    </tr>`;
   }
 
-  function applyFilter(){
-    const f = (document.getElementById('filter').value||"").toLowerCase().trim();
-    for (const tr of tbody.querySelectorAll('tr')){
-      if(!f){ tr.style.display=""; continue; }
-      tr.style.display = tr.dataset.search.includes(f) ? "" : "none";
+  function spacer(h){ return `<tr class="spacer" style="height:${Math.max(0, Math.round(h))}px"><td colspan="7"></td></tr>`; }
+
+  function render(){
+    renderPending = false;
+    if (editing()) return;   // Kommentar wird gerade bearbeitet -> nach blur neu zeichnen
+    const n = visibleCount();
+    if (stickBottom) logDiv.scrollTop = logDiv.scrollHeight;
+    const top = Math.max(0, logDiv.scrollTop - tbody.offsetTop);
+    let start = Math.max(0, Math.floor(top / rowH) - OVERSCAN);
+    const count = Math.ceil(logDiv.clientHeight / rowH) + 2 * OVERSCAN;
+    if (stickBottom) start = Math.max(0, n - count);
+    const end = Math.min(n, start + count);
+    let html = spacer(start * rowH);
+    for (let k = start; k < end; k++) html += rowHtml(matches[mHead + k]);
+    html += spacer((n - end) * rowH);
+    tbody.innerHTML = html;
+
+    // mittlere Zeilenhöhe nachführen (Spacer-Schätzung)
+    const rows = end - start;
+    if (rows > 0){
+      const h = (tbody.lastElementChild.offsetTop - tbody.firstElementChild.offsetHeight - tbody.firstElementChild.offsetTop) / rows;
+      if (h > 8 && Math.abs(h - rowH) > 0.5) rowH = rowH * 0.7 + h * 0.3;
     }
+    if (stickBottom) logDiv.scrollTop = logDiv.scrollHeight;
+    document.getElementById('logCount').textContent =
+      `${n}${filterStr ? " / " + C.id.length : ""} Einträge (max ${LOG_UI_MAX} im Browser)`;
   }
 
+  logDiv.addEventListener('scroll', () => {
+    stickBottom = (logDiv.scrollHeight - logDiv.scrollTop - logDiv.clientHeight) < 80;
+    scheduleRender();
+  }, {passive: true});
+  window.addEventListener('resize', scheduleRender);
+
+  // Kommentar-Inputs: ein Listener für alle (Zeilen werden ständig neu gerendert)
+  tbody.addEventListener('input', (ev) => {
+    const id = ev.target.dataset.id;
+    if (id) drafts.set(id, ev.target.value);
+  });
+  tbody.addEventListener('keydown', (ev) => {
+    if (ev.key !== 'Enter' || !ev.target.dataset.id) return;
+    saveComment(ev.target.dataset.id, ev.target.value);
+    ev.target.blur();
+  });
+  tbody.addEventListener('focusout', () => { setTimeout(scheduleRender, 0); });
+
   async function saveComment(id, comment){
+    const abs = idPos.get(id);
+    if (abs !== undefined){
+      const i = abs - base;
+      C.comment[i] = comment;
+      C.search[i] = searchText(C.t[i], C.dir[i] === 0 ? "app->board" : "board->app", C.kind[i],
+                               C.ascii[i], C.hex[i], C.dec[i], comment);
+    }
+    drafts.delete(id);
     await fetch('/api/comment', {
       method:'POST',
       headers:{'Content-Type':'application/json'},
@@ -844,18 +5244,204 @@ HTML = r"""
   }
 
   function clearLog(){
-    tbody.innerHTML = "";
-    allRows = [];
+    resetStore();
+    drafts = new Map();
+    stickBottom = true;
+    scheduleRender();
   }
 
   async function reload(){
     clearLog();
-    const res = await fetch('/api/log?limit=800');
+    const res = await fetch(`/api/log?limit=${LOG_UI_INITIAL}`);
+    const j = await res.json();
+    addRows(j.items);
+  }
+
+  // Nach SSE-Lücke nur die fehlenden Einträge (seq > lastSeq) holen; zu viele -> komplett neu laden
+  async function catchUp(){
+    if (!lastSeq) return reload();
+    const res = await fetch(`/api/log?after=${lastSeq}&limit=${LOG_UI_INITIAL}`);
+    const j = await res.json();
+    if (j.more) return reload();
+    addRows(j.items);
+    return j.items.length;
+  }
+
+  // ========== Stage-Metriken ==========
+  function fmtUs(v){ return v >= 1000 ? (v/1000).toFixed(1)+"ms" : v.toFixed(1); }
+
+  async function refreshMetrics(){
+    try{
+      const res = await fetch('/api/metrics');
+      const j = await res.json();
+      const body = document.getElementById('metricsBody');
+      let html = "";
+      for (const [dir, stages] of Object.entries(j.stages||{})){
+        html += `<tr class="dirhead"><td colspan="6">${esc(dir.toUpperCase())}</td></tr>`;
+        for (const [name, h] of Object.entries(stages)){
+          html += `<tr><td>${esc(name)}</td><td>${h.count}</td><td>${fmtUs(h.p50_us)}</td>`+
+                  `<td>${fmtUs(h.p95_us)}</td><td>${fmtUs(h.p99_us)}</td><td>${fmtUs(h.max_us)}</td></tr>`;
+        }
+      }
+      body.innerHTML = html;
+      const w = j.writer;
+      document.getElementById('metricsInfo').textContent =
+        `µs • forward-first: ${j.forward_first ? "on" : "off"}` +
+        (w ? ` • writer queue ${w.queue_depth} • batch ø${w.avg_batch} • dropped ${w.dropped}` : "") +
+        (j.upstream ? ` • board ${j.upstream.fps_5s} fps • coalesced ${j.upstream.coalesced}` +
+          ` • sustained ${j.upstream.flow.sustained_fps} fps` +
+          (j.upstream.flow.rate_limit_fps ? ` (limit ${j.upstream.flow.rate_limit_fps})` : "") +
+          ` • retries ${j.upstream.retries} • dropped ${j.upstream.dropped}` : "");
+    }catch(e){}
+  }
+
+  async function resetMetrics(){
+    await fetch('/api/metrics/reset', {method:'POST'});
+    refreshMetrics();
+  }
+
+  refreshMetrics();
+  setInterval(refreshMetrics, 2000);
+
+  // ========== Replay ==========
+  let rpSeeking = false;
+
+  function showReplay(r){
+    if (!r) return;
+    const seek = document.getElementById('rpSeek');
+    seek.max = r.duration_s;
+    if (!rpSeeking) seek.value = r.position_s;
+    document.getElementById('rpInfo').textContent = r.source ?
+      `${r.status} • ${r.source} • ${r.position_s.toFixed(1)} / ${r.duration_s.toFixed(1)} s • ` +
+      `${r.emitted} frames • ${r.fps} fps • speed ${r.speed || "max"} • late max ${r.late_max_ms} ms` : "–";
+  }
+
+  async function replayStart(){
+    const dirs = [];
+    if (document.getElementById('rpB2A').checked) dirs.push("board->app");
+    if (document.getElementById('rpA2B').checked) dirs.push("app->board");
+    const speed = parseFloat(document.getElementById('rpSpeed').value);
+    const body = {speed: isNaN(speed) ? 1 : speed, dirs};
+    const file = document.getElementById('rpFile').value.trim();
+    if (file) body.file = file;
+    const res = await fetch('/api/replay', {
+      method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body)
+    });
+    const j = await res.json();
+    if(!j.ok) alert("Error: " + j.error);
+    showReplay(j.replay);
+  }
+
+  async function replayCtl(action, extra){
+    const res = await fetch('/api/replay/control', {
+      method:'POST', headers:{'Content-Type':'application/json'},
+      body: JSON.stringify(Object.assign({action}, extra || {}))
+    });
+    const j = await res.json();
+    if(!j.ok) alert("Error: " + j.error);
+    showReplay(j.replay);
+  }
+
+  async function refreshReplay(){
+    try{
+      const res = await fetch('/api/replay');
+      showReplay((await res.json()).replay);
+    }catch(e){}
+  }
+
+  refreshReplay();
+  setInterval(refreshReplay, 1000);
+
+  // ========== Sweep ==========
+  function showSweep(s){
+    if (!s) return;
+    document.getElementById('swInfo').textContent = s.id ?
+      `#${s.id} ${s.status} • ${s.pos} / ${s.total} • ${s.fps} fps • ` +
+      `${s.responses} responses (${s.responded_steps} steps) • ${s.acks} acks` : "–";
+  }
+
+  async function sweepStart(){
+    let axes;
+    try { axes = JSON.parse(document.getElementById('swAxes').value); }
+    catch(e){ alert("Achsen: kein gültiges JSON"); return; }
+    const body = {
+      template: document.getElementById('swTpl').value,
+      axes: Array.isArray(axes) ? axes : [axes],
+      gap_ms: parseFloat(document.getElementById('swGap').value) || 0,
+      window_ms: parseFloat(document.getElementById('swWin').value) || 0,
+    };
+    const res = await fetch('/api/sweep', {
+      method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body)
+    });
+    const j = await res.json();
+    if(!j.ok) alert("Error: " + j.error);
+    showSweep(j.sweep);
+  }
+
+  async function sweepCtl(action){
+    const res = await fetch('/api/sweep/control', {
+      method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({action})
+    });
+    const j = await res.json();
+    if(!j.ok) alert("Error: " + j.error);
+    showSweep(j.sweep);
+  }
+
+  async function refreshSweep(){
+    try{
+      const res = await fetch('/api/sweep');
+      showSweep((await res.json()).sweep);
+    }catch(e){}
+  }
+
+  refreshSweep();
+  setInterval(refreshSweep, 1000);
+
+  // ========== Animation ==========
+  function showAnim(a){
+    if (!a) return;
+    document.getElementById('anInfo').textContent = a.id ?
+      `#${a.id} ${a.name} ${a.status} • ${a.pos} / ${a.total} (x${a.loops}) • ${a.sent} sent • ` +
+      `${a.skipped} skipped • ${a.preempted} preempted • late p99 ${a.late_p99_ms} ms` : "–";
+  }
+
+  async function animPlay(){
+    let params;
+    try { params = JSON.parse(document.getElementById('anParams').value || "{}"); }
+    catch(e){ alert("Params: kein gültiges JSON"); return; }
+    const res = await fetch('/api/anim', {
+      method:'POST', headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({name: document.getElementById('anName').value, params})
+    });
     const j = await res.json();
-    for (const e of j.items) addRow(e);
-    applyFilter();
+    if(!j.ok) alert("Error: " + j.error);
+    showAnim(j.anim);
+  }
+
+  async function animStop(){
+    const res = await fetch('/api/anim/stop', {method:'POST'});
+    showAnim((await res.json()).anim);
+  }
+
+  async function refreshAnim(){
+    try{
+      const j = await (await fetch('/api/anim')).json();
+      const sel = document.getElementById('anName');
+      if (sel.options.length !== j.animations.length){
+        sel.innerHTML = "";
+        for (const a of j.animations){
+          const o = document.createElement('option');
+          o.value = a.name; o.textContent = a.name; o.title = a.description || "";
+          sel.appendChild(o);
+        }
+      }
+      showAnim(j.anim);
+    }catch(e){}
   }
 
+  refreshAnim();
+  setInterval(refreshAnim, 1000);
+
   // ========== TARGET -> RAW map (aus deiner RAW_TO_TARGET Liste) ==========
   const TARGET_TO_RAW = new Map([
     ["SO1","2.5@"], ["SI1","2.3@"], ["D1","2.6@"], ["T1","2.4@"],
@@ -1012,13 +5598,25 @@ HTML = r"""
   es.onmessage = (ev) => {
     try{
       const data = JSON.parse(ev.data);
-      if(data.type === "log"){
-        addRow(data.entry, false);
-        applyFilter();
-        const logDiv = document.querySelector('.log');
-        const nearBottom = (logDiv.scrollHeight - logDiv.scrollTop - logDiv.clientHeight) < 80;
-        if(nearBottom) logDiv.scrollTop = logDiv.scrollHeight;
+      // Server bündelt Events pro Tick als Array (SSE_BATCH_MS); einzelne Objekte weiterhin ok
+      const events = Array.isArray(data) ? data : [data];
+      const entries = [];
+      for (const d of events){
+        if(d.type === "gap"){
+          // zu weit hinter dem Ring (oder Proxy neu gestartet) -> Delta seit lastSeq nachladen
+          statusEl.textContent = d.reset ? "SSE: proxy restarted, catching up" : `SSE: ${d.missed} events missed, catching up`;
+          catchUp();
+          return;
+        }
+        if(d.type === "import"){
+          statusEl.textContent = d.job.state === "done" ? `Import: ${d.job.frames} frames` : `Import failed: ${d.job.error}`;
+          catchUp();
+          continue;
+        }
+        if(d.type === "log") entries.push(d.entry);
       }
+      // neue Zeilen: nur diese gegen den Filter prüfen, Rendern einmal pro Frame
+      if(entries.length) addRows(entries);
     }catch(e){}
   };
 
@@ -1029,93 +5627,578 @@ HTML = r"""
 """
 
 
-def start_web(state: MitmState):
-    app = Flask(__name__)
+def render_html(**ctx) -> str:
+    out = HTML
+    for k, v in ctx.items():
+        out = out.replace("{{" + k + "}}", htmllib.escape(str(v)))
+    return out
 
-    # No-cache headers so UI changes always show up
-    @app.after_request
-    def add_no_cache_headers(resp):
-        resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-        resp.headers["Pragma"] = "no-cache"
-        resp.headers["Expires"] = "0"
-        return resp
-
-    @app.get("/")
-    def index():
-        return render_template_string(
-            HTML,
-            port=WEB_PORT,
+
+def start_web(state: MitmState, loop, host: str = None, port: int = None):
+    host = WEB_HOST if host is None else host
+    port = WEB_PORT if port is None else port
+    web = WebApp()
+
+    @web.get("/")
+    async def index(req):
+        return HttpResponse(render_html(
+            port=port,
             ui_version=UI_VERSION,
-            logfile=LOG_DB_PATH
+            logfile=state.logstore.path
+        ), content_type="text/html; charset=utf-8")
+
+    def log_filters(a):
+        return dict(
+            since_ms=int(a["since_ms"]) if a.get("since_ms") else None,
+            until_ms=int(a["until_ms"]) if a.get("until_ms") else None,
+            direction=a.get("dir") or None,
+            kind=a.get("kind") or None,
+            text=a.get("text") or None,
+            target=a.get("target") or None,
         )
 
-    @app.get("/api/log")
-    def api_log():
+    @web.get("/api/log")
+    async def api_log(req):
+        # Keyset-Paging über seq:
+        #   ?limit=N               die neuesten N
+        #   ?before=S&limit=N      die N vor seq S (zurückblättern)
+        #   ?after=S&limit=N       die N nach seq S (Delta nach Reconnect / vorwärts)
+        # Filter: since_ms/until_ms, dir, kind, text, target (dekodiert, z.B. T20)
+        # Antwort: items aufsteigend, first/last = seq-Grenzen, more = es gibt weitere in Blätterrichtung
+        a = req.args
         try:
-            limit = int(request.args.get("limit", "800"))
-        except Exception:
-            limit = 800
-        return jsonify({"ok": True, "items": state.logstore.list(limit=limit)})
+            limit = max(1, min(int(a.get("limit", "800")), LOG_PAGE_MAX))
+            before = int(a["before"]) if a.get("before") else None
+            after = int(a["after"]) if a.get("after") else None
+            filters = log_filters(a)
+        except ValueError as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        store = state.logstore
+        # Store-Abfragen (FTS/LIKE, Lock hinter einem Writer-Commit) nicht im Loop: der trägt ggf. D-Bus + bleak
+        loop = asyncio.get_running_loop()
+
+        if after is None or limit <= LOG_PAGE_CHUNK:
+            items = await loop.run_in_executor(
+                None, lambda: store.query(limit=limit, before=before, after=after, **filters))
+            return json_response({
+                "ok": True, "items": items, "limit": limit,
+                "first": items[0]["seq"] if items else None,
+                "last": items[-1]["seq"] if items else None,
+                "more": len(items) == limit,
+            })
+
+        # große Delta-Seiten: in Stücken abfragen und streamen (kein kompletter Body im Speicher)
+        async def gen():
+            yield '{"ok":true,"items":['
+            cursor, sent, first = after, 0, None
+            while sent < limit:
+                chunk = await loop.run_in_executor(
+                    None, lambda: store.query(limit=min(LOG_PAGE_CHUNK, limit - sent), after=cursor, **filters))
+                if not chunk:
+                    break
+                if first is None:
+                    first = chunk[0]["seq"]
+                yield ("," if sent else "") + ",".join(json.dumps(e, ensure_ascii=False) for e in chunk)
+                sent += len(chunk)
+                cursor = chunk[-1]["seq"]
+                if len(chunk) < LOG_PAGE_CHUNK:
+                    break
+            tail = {"limit": limit, "first": first, "last": cursor if sent else None, "more": sent == limit}
+            yield "]," + json.dumps(tail)[1:]
+
+        return StreamResponse(gen(), content_type="application/json")
+
+    # ---- Binärer Capture: Seek per Record-Nummer (O(1)) oder Zeit (Binärsuche im Index) ----
+    readers = OrderedDict()   # path -> CaptureReader, älteste zuerst (LRU, verdrängte werden geschlossen)
+
+    def capture_path(name: str = None):
+        if not name:
+            return state.capture.path if state.capture is not None else None
+        path = os.path.join(CAPTURE_DIR, os.path.basename(name))
+        return path if os.path.exists(capture_paths(path)[0]) else None
+
+    def capture_reader(name: str = None):
+        path = capture_path(name)
+        if path is None:
+            return None
+        r = readers.pop(path, None) or CaptureReader(path)
+        readers[path] = r
+        while len(readers) > CAPTURE_READERS_MAX:
+            readers.popitem(last=False)[1].close()
+        r.refresh()
+        return r
+
+    @web.get("/api/capture")
+    async def api_capture(req):
+        files = []
+        if os.path.isdir(CAPTURE_DIR):
+            for fn in sorted(os.listdir(CAPTURE_DIR)):
+                if fn.endswith(".gbc"):
+                    try:
+                        path = os.path.join(CAPTURE_DIR, fn)
+                        r = readers.get(path)
+                        if r is not None:
+                            r.refresh()
+                            files.append(r.info())
+                            continue
+                        # nur für info(): kurzlebiger Reader, der LRU-Cache bleibt den Seek-Routen
+                        r = CaptureReader(path)
+                        try:
+                            files.append(r.info())
+                        finally:
+                            r.close()
+                    except Exception as e:
+                        files.append({"path": os.path.join(CAPTURE_DIR, fn), "error": str(e)})
+        return json_response({
+            "ok": True,
+            "current": os.path.basename(state.capture.path) if state.capture else None,
+            "files": files,
+        })
+
+    @web.get("/api/capture/records")
+    async def api_capture_records(req):
+        # ?file=cap-...gbc (Standard: laufender Capture) & from=N | at_ms=<Unix ms> & count=M
+        r = capture_reader(req.args.get("file"))
+        if r is None:
+            return json_response({"ok": False, "error": "capture not found"}, 404)
+        try:
+            count = max(1, min(int(req.args.get("count", "200")), 2000))
+            if "at_ms" in req.args:
+                start = r.index_at_wall(int(req.args["at_ms"]) * 1_000_000)
+            else:
+                start = int(req.args.get("from", "0"))
+                if start < 0:
+                    start = max(0, len(r) + start)
+        except ValueError as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        items = [r.entry(n) for n in range(start, min(start + count, len(r)))]
+        return json_response({"ok": True, "from": start, "records": len(r), "items": items})
+
+    @web.get("/api/export")
+    async def api_export(req):
+        # ?format=jsonl|csv|btsnoop & from/to (Unix ms oder ISO) & file=cap-...gbc (Standard: laufender Capture)
+        # & source=log (statt Capture den LogStore exportieren)
+        a = req.args
+        fmt = a.get("format", "jsonl")
+        if fmt not in EXPORT_FORMATS:
+            return json_response({"ok": False, "error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400)
+        try:
+            from_ms, to_ms = parse_time_arg(a.get("from")), parse_time_arg(a.get("to"))
+        except ValueError as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        path = None if a.get("source") == "log" else capture_path(a.get("file"))
+        # eigener Reader: der Stream darf nicht von der LRU-Verdrängung geschlossen werden
+        reader = CaptureReader(path) if path is not None else None
+        if reader is not None:
+            records = export_from_capture(reader, from_ms, to_ms)
+            name = os.path.basename(reader.path)[:-4]
+        elif a.get("file"):
+            return json_response({"ok": False, "error": "capture not found"}, 404)
+        else:
+            records = export_from_logstore(state.logstore, from_ms, to_ms)
+            name = "gb_mitm_log"
+        _, ctype, ext = EXPORT_FORMATS[fmt]
+        loop = asyncio.get_running_loop()
+
+        async def gen():
+            chunks = export_chunks(records, fmt)
+            if reader is None:
+                # LogStore-Seiten im Executor abfragen (wie /api/log)
+                while True:
+                    chunk = await loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        return
+                    yield chunk
+            try:
+                for chunk in chunks:
+                    yield chunk
+                    await asyncio.sleep(0)   # andere Requests / SSE zwischendurch bedienen
+            finally:
+                reader.close()
+
+        return StreamResponse(gen(), content_type=ctype,
+                              headers={"Content-Disposition": f'attachment; filename="{name}.{ext}"'})
+
+    @web.get("/api/import")
+    async def api_import_status(req):
+        return json_response({"ok": True, "job": state.import_job})
+
+    @web.post("/api/import")
+    async def api_import(req):
+        # {"path": "/sdcard/.../btsnoop_hci.log" (auf dem Pi), "notify_handle": 3, "write_handle": 6, "store": true,
+        #  "acl_handle": 64, "board": "C2:A4:..." (Verbindung, sonst automatisch mit den Handles)}
+        data = req.get_json()
+        job = state.import_job
+        if job and job.get("state") == "running":
+            return json_response({"ok": False, "error": "import already running"}, 409)
+        path = os.path.expanduser(data.get("path", ""))
+        if not os.path.isfile(path):
+            return json_response({"ok": False, "error": "file not found"}, 404)
+        try:
+            # Handles als Zahl oder "0x0003"
+            nh, wh, acl = (int(str(v), 0) if v is not None else None
+                           for v in (data.get("notify_handle"), data.get("write_handle"), data.get("acl_handle")))
+        except ValueError as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        job = {"state": "running", "path": path, "started": now_ms()}
+        state.import_job = job
+
+        def run():
+            try:
+                import_btsnoop(path, store=state.logstore if data.get("store", True) else None,
+                               notify_handle=nh, write_handle=wh, progress=job, acl_handle=acl,
+                               board=data.get("board"))
+                job["state"] = "done"
+                log(f"📥 Import {path}: {job['frames']} frames in {job['seconds']} s -> {job['capture']}")
+            except Exception as e:
+                job["state"] = "error"
+                job["error"] = str(e)
+                log(f"⚠️ Import {path} failed: {e}")
+            # UI lädt die neuen Einträge per Keyset nach (kein Event pro importiertem Frame)
+            state.hub.publish({"type": "import", "job": job})
+
+        threading.Thread(target=run, name="btsnoop-import", daemon=True).start()
+        return json_response({"ok": True, "job": job})
+
+    @web.get("/api/replay")
+    async def api_replay_status(req):
+        return json_response({"ok": True, "replay": state.replay.stats()})
+
+    @web.post("/api/replay")
+    async def api_replay(req):
+        # {"file": "cap-...gbc" (Standard: laufender Capture) | "source": "log", "from"/"to": Unix ms oder ISO,
+        #  "speed": 1.0 (0 = max), "dirs": ["board->app", "app->board"]}
+        data = req.get_json()
+        try:
+            from_ms, to_ms = parse_time_arg(data.get("from")), parse_time_arg(data.get("to"))
+            speed = float(data.get("speed", 1.0))
+            dirs = data.get("dirs") or list(CAPTURE_DIRS)
+            if not set(dirs) <= set(CAPTURE_DIRS):
+                raise ValueError(f"dirs must be in {', '.join(CAPTURE_DIRS)}")
+        except (TypeError, ValueError) as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        path = None
+        if data.get("source") != "log":
+            path = capture_path(data.get("file"))
+            if path is None:
+                return json_response({"ok": False, "error": "capture not found"}, 404)
+
+        def start():
+            # im Executor: LogReplaySource lädt bis zu REPLAY_LOG_MAX Einträge, start() wartet auf den alten Thread
+            if path is None:
+                src = LogReplaySource(state.logstore, from_ms, to_ms)
+            else:
+                # eigener Reader (eigenes mmap), unabhängig vom Cache der Capture-Routen
+                src = CaptureReplaySource(path, from_ms, to_ms)
+            if not len(src):
+                src.close()
+                raise ValueError("no records in range")
+            state.replay.start(src, speed=speed, dirs=dirs)
 
-    @app.post("/api/comment")
-    def api_comment():
-        data = request.get_json(force=True, silent=True) or {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, start)
+        except ValueError as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        return json_response({"ok": True, "replay": state.replay.stats()})
+
+    @web.post("/api/replay/control")
+    async def api_replay_control(req):
+        # {"action": "pause" | "resume" | "stop" | "seek" (+ "to_s") | "speed" (+ "speed")}
+        data = req.get_json()
+        rp = state.replay
+        action = data.get("action")
+        try:
+            if action == "pause":
+                rp.pause()
+            elif action == "resume":
+                rp.resume()
+            elif action == "stop":
+                await asyncio.get_running_loop().run_in_executor(None, rp.stop)
+            elif action == "seek":
+                rp.seek(float(data.get("to_s", 0)))
+            elif action == "speed":
+                rp.set_speed(float(data.get("speed", 1.0)))
+            else:
+                raise ValueError("action must be pause, resume, stop, seek or speed")
+        except (TypeError, ValueError) as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        return json_response({"ok": True, "replay": rp.stats()})
+
+    @web.get("/api/sweep")
+    async def api_sweep_status(req):
+        return json_response({"ok": True, "sweep": state.sweep.stats()})
+
+    @web.get("/api/sweep/results")
+    async def api_sweep_results(req):
+        # nur Schritte mit Board-Antwort (ohne "write OK" Acks)
+        return json_response({"ok": True, "sweep": state.sweep.stats(), "results": list(state.sweep.results.values())})
+
+    @web.post("/api/sweep")
+    async def api_sweep(req):
+        # {"template": "01 FF 00 00 ... (hex)", "axes": [{"pos": 0, "from": 0, "to": 255}, ...],
+        #  "gap_ms": 0 (0 = so schnell wie der Link), "window_ms": 250}
+        data = req.get_json()
+        try:
+            template = parse_hex_string(data.get("template", ""))
+            if not template:
+                raise ValueError("template required")
+            state.sweep.start(template, data.get("axes") or [], gap_ms=float(data.get("gap_ms", 0)),
+                              window_ms=float(data.get("window_ms", SWEEP_WINDOW_MS)))
+        except RuntimeError as e:
+            return json_response({"ok": False, "error": str(e), "sweep": state.sweep.stats()}, 409)
+        except (TypeError, ValueError, AttributeError) as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        return json_response({"ok": True, "sweep": state.sweep.stats()})
+
+    @web.post("/api/sweep/control")
+    async def api_sweep_control(req):
+        # {"action": "pause" | "resume" | "stop"}
+        action = req.get_json().get("action")
+        sw = state.sweep
+        if action == "pause":
+            sw.pause()
+        elif action == "resume":
+            sw.resume()
+        elif action == "stop":
+            await asyncio.get_running_loop().run_in_executor(None, sw.stop)
+        else:
+            return json_response({"ok": False, "error": "action must be pause, resume or stop"}, 400)
+        return json_response({"ok": True, "sweep": sw.stats()})
+
+    @web.get("/api/anim")
+    async def api_anim_status(req):
+        return json_response({"ok": True, "anim": state.anim.stats(), "animations": state.anim.catalog()})
+
+    @web.post("/api/anim")
+    async def api_anim(req):
+        # {"name": "finish_path", "params": {"targets": ["T20", "D10"]}} | {"timeline": {"steps": [...]}}
+        # "dry": true -> nur kompilieren, Fahrplan zurück (ohne Board)
+        data = req.get_json()
+        name = data.get("name") or "inline"
+        try:
+            sched = compile_timeline(state.anim.resolve(data.get("name"), data.get("params"), data.get("timeline")))
+            if data.get("dry"):
+                return json_response({"ok": True, "period_ms": sched["period_ns"] / 1e6, "repeat": sched["repeat"],
+                                      "frames": [{"ms": o / 1e6, "hex": hx(f), "label": decode_frame("app->board", f)["label"]}
+                                                 for o, f in zip(sched["offsets"], sched["frames"])]})
+            state.anim.play(sched, name)
+        except (TypeError, ValueError, AttributeError) as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        return json_response({"ok": True, "anim": state.anim.stats()})
+
+    @web.post("/api/anim/define")
+    async def api_anim_define(req):
+        # {"name": "meins", "timeline": {...}} speichert, ohne "timeline" = löschen
+        data = req.get_json()
+        try:
+            state.anim.define(data.get("name"), data.get("timeline"))
+        except (TypeError, ValueError, AttributeError) as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+        return json_response({"ok": True, "animations": state.anim.catalog()})
+
+    @web.post("/api/anim/stop")
+    async def api_anim_stop(req):
+        state.anim.stop()
+        return json_response({"ok": True, "anim": state.anim.stats()})
+
+    @web.get("/api/stats")
+    async def api_stats(req):
+        return json_response({
+            "ok": True,
+            "writer": state.writer.stats() if state.writer else None,
+            "events": state.hub.stats(),
+            "reassembly": state.reassembler.stats(),
+            "forward_first": FORWARD_FIRST,
+        })
+
+    @web.get("/api/metrics")
+    async def api_metrics(req):
+        return json_response({
+            "ok": True,
+            "since": int(state.metrics.started * 1000),
+            "forward_first": FORWARD_FIRST,
+            "stages": state.metrics.snapshot(),
+            "writer": state.writer.stats() if state.writer else None,
+            "upstream": state.upstream.stats() if state.upstream else None,
+        })
+
+    @web.post("/api/metrics/reset")
+    async def api_metrics_reset(req):
+        state.metrics.reset()
+        return json_response({"ok": True})
+
+    @web.get("/api/handshake")
+    async def api_handshake(req):
+        return json_response({"ok": True, "handshake": state.handshake.stats()})
+
+    @web.post("/api/handshake")
+    async def api_handshake_set(req):
+        data = req.get_json()
+        hs = state.handshake
+        platform = data.get("platform", hs.platform)
+        if platform not in HANDSHAKE_PACING_MS:
+            return json_response({"ok": False, "error": f"unknown platform (use: {', '.join(HANDSHAKE_PACING_MS)})"}, 400)
+        hs.platform = platform
+        if "max_age_sec" in data:
+            try:
+                hs.max_age = max(0.0, float(data["max_age_sec"]))
+            except (TypeError, ValueError):
+                return json_response({"ok": False, "error": "max_age_sec must be a number"}, 400)
+        return json_response({"ok": True, "handshake": hs.stats()})
+
+    @web.post("/api/comment")
+    async def api_comment(req):
+        data = req.get_json()
         entry_id = data.get("id", "")
         comment = data.get("comment", "")
-        ok = state.logstore.set_comment(entry_id, comment)
-        return jsonify({"ok": ok})
+        ok = await asyncio.get_running_loop().run_in_executor(None, state.set_comment, entry_id, comment)
+        return json_response({"ok": ok})
 
-    @app.post("/api/send_to_board")
-    def api_send_to_board():
-        data = request.get_json(force=True, silent=True) or {}
+    @web.post("/api/send_to_board")
+    async def api_send_to_board(req):
+        data = req.get_json()
         hex_str = data.get("hex", "")
         comment = data.get("comment", "")
         try:
             payload = parse_hex_string(hex_str)
             state.manual_send_to_board(payload, comment=comment)
-            return jsonify({"ok": True})
+            return json_response({"ok": True})
         except Exception as e:
-            return jsonify({"ok": False, "error": str(e)}), 400
+            return json_response({"ok": False, "error": str(e)}, 400)
 
-    @app.post("/api/send_to_app")
-    def api_send_to_app():
-        data = request.get_json(force=True, silent=True) or {}
+    @web.post("/api/send_to_board_batch")
+    async def api_send_to_board_batch(req):
+        # {"frames": ["01 00 ..", {"hex": "..", "delay_ms": 50, "comment": ".."}, ...], "delay_ms": 20, "comment": ".."}
+        data = req.get_json()
+        items = data.get("frames") or []
+        try:
+            default_delay = int(data.get("delay_ms", 0))
+            if not isinstance(items, list) or not items:
+                raise ValueError("frames must be a non-empty list")
+            if len(items) > UPSTREAM_BATCH_MAX:
+                raise ValueError(f"too many frames (max {UPSTREAM_BATCH_MAX})")
+            frames = []
+            for it in items:
+                if isinstance(it, str):
+                    it = {"hex": it}
+                frames.append((parse_hex_string(it.get("hex", "")),
+                               int(it.get("delay_ms", default_delay)),
+                               it.get("comment", "")))
+            state.manual_send_to_board_batch(frames, comment=data.get("comment", ""))
+            return json_response({"ok": True, "frames": len(frames)})
+        except Exception as e:
+            return json_response({"ok": False, "error": str(e)}, 400)
+
+    @web.get("/api/upstream")
+    async def api_upstream(req):
+        return json_response({"ok": True, "upstream": state.upstream.stats() if state.upstream else None})
+
+    @web.post("/api/send_to_app")
+    async def api_send_to_app(req):
+        data = req.get_json()
         raw = data.get("raw", "")
         comment = data.get("comment", "")
         try:
             payload = encode_raw_ascii(raw)
             state.manual_send_to_app(payload, comment=comment)
-            return jsonify({"ok": True})
+            return json_response({"ok": True})
         except Exception as e:
-            return jsonify({"ok": False, "error": str(e)}), 400
+            return json_response({"ok": False, "error": str(e)}, 400)
 
-    @app.get("/api/events")
-    def sse_events():
-        q = state.hub.subscribe()
+    @web.get("/api/events")
+    async def sse_events(req):
+        hub = state.hub
+        cursor = hub.subscribe(req.headers.get("last-event-id"))
+        try:
+            batch_s = max(0, int(req.args.get("batch_ms", SSE_BATCH_MS))) / 1000.0
+        except Exception:
+            batch_s = SSE_BATCH_MS / 1000.0
 
-        def gen():
+        async def gen():
+            c = cursor
             try:
-                yield "data: " + json.dumps({"type":"hello","ui":UI_VERSION}) + "\n\n"
+                yield "retry: 2000\n"
+                yield "data: " + json.dumps({"type":"hello","ui":UI_VERSION,"boot":hub.boot,"seq":max(c, 0),
+                                             "batch_ms":int(batch_s*1000)}) + "\n\n"
                 while True:
-                    ev = q.get()
-                    yield "data: " + json.dumps(ev, ensure_ascii=False) + "\n\n"
+                    events, c, gap = await hub.aread(c)
+                    if events and batch_s:
+                        # alles was im Fenster noch kommt in dieselbe Message
+                        await asyncio.sleep(batch_s)
+                        more, c, gap2 = hub.read(c, timeout=0)
+                        events += more
+                        gap = gap or gap2
+                    if gap:
+                        # id = Stand vor den folgenden Events: reißt die Verbindung zwischen Gap- und
+                        # Event-Message ab, kommen die Events nach dem Reconnect noch einmal
+                        gid = events[0][0] - 1 if events else c
+                        yield f"id: {hub.event_id(gid)}\ndata: " + json.dumps(gap) + "\n\n"
+                    if not events:
+                        if not gap:
+                            yield ": ping\n\n"
+                    elif batch_s:
+                        # Events sind schon serialisiert -> nur zusammenkleben
+                        yield f"id: {hub.event_id(events[-1][0])}\ndata: [" + ",".join(e[2] for e in events) + "]\n\n"
+                    else:
+                        for seq, _ev, enc in events:
+                            yield f"id: {hub.event_id(seq)}\ndata: " + enc + "\n\n"
             finally:
-                state.hub.unsubscribe(q)
+                hub.unsubscribe()
 
-        return Response(gen(), mimetype="text/event-stream")
+        return StreamResponse(gen())
 
-    # Flask thread
-    def _run():
-        log(f"🌐 Web UI: http://{WEB_HOST}:{WEB_PORT}  (UI={UI_VERSION})")
-        app.run(host=WEB_HOST, port=WEB_PORT, debug=False, use_reloader=False, threaded=True)
+    async def _serve():
+        state.hub.attach_loop(asyncio.get_running_loop())
+        server = await web.serve(host, port)
+        log(f"🌐 Web UI: http://{host}:{server.sockets[0].getsockname()[1]}  (UI={UI_VERSION})")
+        return server
 
-    threading.Thread(target=_run, daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(_serve(), loop)
 
 
 # =========================
 # MAIN
 # =========================
+def open_logstore() -> LogStore:
+    if LOG_SQLITE:
+        return SqliteLogStore(LOG_SQLITE_PATH, legacy_journal=LOG_JOURNAL_DIR)
+    if LOG_JOURNAL:
+        return JournalLogStore(LOG_JOURNAL_DIR, legacy_path=LOG_DB_PATH)
+    return LogStore(LOG_DB_PATH)
+
+
+def start_state(logstore: LogStore, capture_dir: str = None) -> MitmState:
+    # Persistence stage (BLE/D-Bus callbacks only enqueue)
+    state = MitmState(logstore, EventHub())
+    if capture_dir:
+        state.capture = CaptureWriter.new_session(capture_dir)
+        log(f"💾 Capture: {state.capture.path}")
+    state.writer = LogWriter(logstore, state.hub, build=state.build_entry, capture=state.capture)
+    state.writer.start()
+    return state
+
+
+def stop_state(state: MitmState):
+    try:
+        if state.upstream:
+            state.upstream.stop()
+    except Exception:
+        pass
+    state.replay.stop()
+    state.sweep.stop()
+    state.anim.stop()
+    try:
+        state.writer.stop()
+    except Exception:
+        pass
+    if state.capture:
+        state.capture.close()
+
+
 def main():
+    if not (HAVE_BLUEZ and HAVE_GLIB and BleakClient):
+        log("❌ dbus-python, PyGObject and bleak are required (without Bluetooth: 'loopback' / 'bench-e2e')")
+        sys.exit(1)
     ensure_data_dir()
 
     if AUTO_BT_RESET_ON_START:
@@ -1132,12 +6215,16 @@ def main():
 
     log(f"✅ Using adapter: {adapter_path}")
 
-    logstore = LogStore(LOG_DB_PATH)
-    hub = EventHub()
-    state = MitmState(logstore, hub)
+    state = start_state(open_logstore(), CAPTURE_DIR if LOG_CAPTURE else None)
+
+    # Runtime: GLib + asyncio (Upstream/bleak + Web UI) – wenn möglich ein einziger Loop
+    runtime = AsyncRuntime()
+    runtime.start()
+    state.integrated = runtime.integrated
+    log(f"🧵 Runtime: {'integrated (GLib + asyncio, one thread)' if runtime.integrated else 'threaded (GLib.idle_add bridge)'}")
 
     # Start web UI
-    start_web(state)
+    start_web(state, runtime.loop)
 
     # Build GATT app
     app = Application(bus)
@@ -1167,19 +6254,16 @@ def main():
     log("   - UI log shows only APP↔BOARD frames (no proxy chatter).")
 
     # Start upstream
-    state.upstream = Upstream(REAL_BOARD_ADDR, notify_cb=state.on_real_notify)
-    state.upstream.start()
+    state.upstream = Upstream(REAL_BOARD_ADDR, notify_cb=state.on_real_notify, metrics=state.metrics)
+    state.upstream.start(runtime.loop)
 
-    mainloop = GLib.MainLoop()
     try:
-        mainloop.run()
+        runtime.run()
     except KeyboardInterrupt:
         log("🛑 Stopping...")
     finally:
-        try:
-            state.upstream.stop()
-        except Exception:
-            pass
+        stop_state(state)
+        runtime.stop()
 
         try:
             adv_mgr.UnregisterAdvertisement(adv.get_path())
@@ -1195,5 +6279,446 @@ def main():
             bluetooth_reset_exit()
 
 
+def loopback(hit_hz: float = LOOPBACK_HIT_HZ, write_ms: float = LOOPBACK_WRITE_MS, link_fps: float = LOOPBACK_LINK_FPS,
+             fail_rate: float = 0.0):
+    """Proxy + Web UI ohne Bluetooth: LoopbackBoard als Upstream, LoopbackCentral als App (Log/Capture wie im Betrieb)."""
+    ensure_data_dir()
+    state = start_state(open_logstore(), CAPTURE_DIR if LOG_CAPTURE else None)
+    runtime = AsyncRuntime()
+    runtime.start()
+    state.integrated = runtime.integrated
+    log(f"🧵 Runtime: {runtime.mode}{' (integrated)' if runtime.integrated else ''}")
+    start_web(state, runtime.loop)
+
+    central = LoopbackCentral(state)
+    GLib.idle_add(central.subscribe)
+    state.upstream = Upstream(REAL_BOARD_ADDR, notify_cb=state.on_real_notify, metrics=state.metrics,
+                              client_factory=lambda addr, **kw: LoopbackBoard(addr, hit_hz=hit_hz, write_ms=write_ms,
+                                                                              link_fps=link_fps, fail_rate=fail_rate,
+                                                                              **kw))
+    state.upstream.start(runtime.loop)
+    log(f"✅ LOOPBACK READY: virtual board ({hit_hz} hits/s), app stand-in subscribed")
+    try:
+        runtime.run()
+    except KeyboardInterrupt:
+        log("🛑 Stopping...")
+    finally:
+        stop_state(state)
+        runtime.stop()
+
+
+def bench_e2e(n: int = 20000, hit_hz: float = 0.0, store: str = "journal", write_ms: float = 0.0,
+              sse: bool = True, timeout: float = 120.0, link_fps: float = 0.0, fail_rate: float = 0.0):
+    """
+    End-to-End ohne Bluetooth, in einem temporären Verzeichnis:
+      LoopbackBoard -> Upstream -> MitmState -> Notify an LoopbackCentral (App)
+      LoopbackCentral WriteValue -> MitmState -> Upstream -> LoopbackBoard (+ ack)
+      alle Frames -> LogWriter -> LogStore + Capture -> EventHub -> SSE (HTTP-Client im Prozess)
+    n Treffer und n LED-Writes, hit_hz 0 = so schnell wie möglich.
+    link_fps / fail_rate: begrenzter bzw. fehlerhafter Link (Flow Control, Retries).
+    """
+    tmp = tempfile.mkdtemp(prefix="gb-bench-")
+    stores = {
+        "journal": lambda: JournalLogStore(os.path.join(tmp, "journal")),
+        "sqlite": lambda: SqliteLogStore(os.path.join(tmp, "log.sqlite")),
+        "json": lambda: LogStore(os.path.join(tmp, "log.json")),
+    }
+    state = start_state(stores[store](), os.path.join(tmp, "capture"))
+    state.console = False
+    runtime = AsyncRuntime()
+    runtime.start()
+    state.integrated = runtime.integrated
+    threading.Thread(target=runtime.run, name="runtime", daemon=True).start()
+    server = start_web(state, runtime.loop, host="127.0.0.1", port=0).result(10)
+    port = server.sockets[0].getsockname()[1]
+
+    acks = n if LOOPBACK_ACK else 0
+    expected_notify = n + acks            # + CONNECT-Frame
+    expected_log = n + acks + n + 1
+    boards = []
+
+    def factory(addr, **kw):
+        b = LoopbackBoard(addr, hit_hz=hit_hz, write_ms=write_ms, max_hits=n, link_fps=link_fps,
+                          fail_rate=fail_rate, **kw)
+        boards.append(b)
+        return b
+
+    sse_lat = []
+    sse_ready = threading.Event()
+
+    def sse_client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request("GET", "/api/events?batch_ms=" + str(SSE_BATCH_MS))
+        resp = conn.getresponse()
+        sse_ready.set()
+        for line in resp:
+            if not line.startswith(b"data: "):
+                continue
+            now = time.time() * 1000
+            data = json.loads(line[6:])
+            for ev in data if isinstance(data, list) else [data]:
+                if ev.get("type") == "log":
+                    sse_lat.append(now - ev["entry"]["ms"])
+            if len(sse_lat) >= expected_log - state.writer.dropped:
+                break
+        conn.close()
+
+    if sse:
+        threading.Thread(target=sse_client, name="sse-client", daemon=True).start()
+        sse_ready.wait(10)
+
+    central = LoopbackCentral(state)
+    GLib.idle_add(central.subscribe)
+    while not state.app_subscribed:
+        time.sleep(0.001)
+
+    frames = [bytes([0x01, 0xFF, 0, 0, 0, 0, 0, 0, 0, 0, seg, 0, 0x01, 0, 0, 0]) for seg in range(1, 21)]
+
+    async def drive_writes():
+        while not boards or not boards[0].is_connected:
+            await asyncio.sleep(0.001)
+        t_start = time.monotonic()
+        for i in range(n):
+            if hit_hz:
+                ahead = t_start + i / hit_hz - time.monotonic()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            elif i % LoopbackBoard.BURST == 0:
+                await asyncio.sleep(0)
+            central.write(frames[i % len(frames)])
+
+    log(f"E2E loopback benchmark: {n} hits + {n} writes ({'max' if not hit_hz else f'{hit_hz} Hz'}), "
+        f"store={store}, runtime={runtime.mode}{' integrated' if runtime.integrated else ''}, "
+        f"write_ms={write_ms}, sse={'on' if sse else 'off'}"
+        + (f", link {link_fps} fps" if link_fps else "") + (f", fail {fail_rate:.0%}" if fail_rate else ""))
+    t0 = time.perf_counter()
+    state.upstream = Upstream(REAL_BOARD_ADDR, notify_cb=state.on_real_notify, metrics=state.metrics,
+                              client_factory=factory)
+    state.upstream.start(runtime.loop)
+    asyncio.run_coroutine_threadsafe(drive_writes(), runtime.loop)
+
+    marks = {}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        now = time.perf_counter() - t0
+        if ("forwarded" not in marks and central.notifies >= expected_notify and boards
+                and boards[0].writes + state.upstream.dropped >= n):
+            marks["forwarded"] = now
+        # verworfene Einträge (Queue voll) zählen als erledigt, tauchen aber in "dropped" auf
+        logged = expected_log - state.writer.dropped
+        if "logged" not in marks and state.writer.written >= logged:
+            marks["logged"] = now
+        if "sse" not in marks and len(sse_lat) >= logged:
+            marks["sse"] = now
+        if len(marks) == (3 if sse else 2):
+            break
+        time.sleep(0.002)
+    else:
+        log(f"  ⚠️ timeout: notifies {central.notifies}/{expected_notify}, writes {boards[0].writes if boards else 0}/{n}, "
+            f"logged {state.writer.written}/{expected_log}, sse {len(sse_lat)}/{expected_log}")
+
+    for name, label in (("forwarded", "forwarded (app + board)"), ("logged", "logged (store + capture)"),
+                        ("sse", "delivered via SSE")):
+        if name in marks:
+            log(f"  {label:<26} {marks[name]:7.3f} s   {expected_log / marks[name]:9.0f} frames/s")
+    stages = state.metrics.snapshot()
+    for direction, stage in (("board->app", "rx->notified"), ("board->app", "rx->logged"),
+                             ("app->board", "rx->written"), ("app->board", "rx->logged")):
+        h = stages[direction][stage]
+        log(f"  {direction} {stage:<13} n={h['count']:<8} p50 {h['p50_us']:9.1f} µs   p99 {h['p99_us']:9.1f} µs   "
+            f"max {h['max_us']:9.1f} µs")
+    up = state.upstream.stats()
+    fl = up["flow"]
+    log(f"  upstream: sustained {fl['sustained_fps']} fps, "
+        f"limit {fl['rate_limit_fps'] or 'none'}, {fl['congestions']} congestions, {up['retries']} retries, "
+        f"{up['dropped']} dropped, {up['write_errors']} write errors")
+    w = state.writer.stats()
+    log(f"  writer: {w['batches']} batches, ø{w['avg_batch']} / max {w['max_batch']} per batch, "
+        f"max queue {w['max_depth']}, dropped {w['dropped']}")
+    if sse_lat:
+        lat = sorted(sse_lat)
+        log(f"  SSE: {len(lat)} events, latency p50 {lat[len(lat) // 2]:.0f} ms   "
+            f"p99 {lat[min(len(lat) - 1, int(len(lat) * 0.99))]:.0f} ms")
+
+    async def shutdown():
+        # offene SSE-Verbindung und Upstream-Task sauber beenden, bevor der Loop stoppt
+        server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    stop_state(state)
+    runtime.submit(shutdown()).result(10)
+    runtime.stop()
+    if hasattr(state.logstore, "close"):
+        state.logstore.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+def capture_cli(path: str, start: int = None, at: float = None, count: int = 20):
+    r = CaptureReader(path)
+    info = r.info()
+    log(f"{info['path']}: {info['records']} records, {info['bytes']} bytes, "
+        f"{info['duration_s']} s, {info['comments']} comments")
+    if not len(r):
+        return
+    if at is not None:
+        start = r.index_at(r.mono_at(0) + int(at * 1e9))
+    elif start is None:
+        start = max(0, len(r) - count)
+    elif start < 0:
+        start = max(0, len(r) + start)
+    t0 = r.mono_at(0)
+    notes = r.comments()
+    for n, mono_ns, direction, kind, payload in r.iter(start, start + count):
+        dec = decode_frame(direction, payload)
+        note = notes.get(n, "")
+        print(f"{n:>9}  {(mono_ns - t0) / 1e9:12.6f}s  {direction:<10}  {kind:<6}  {hx(payload):<60}  "
+              f"{dec['label']}{'  # ' + note if note else ''}")
+
+
+def latest_capture() -> str:
+    caps = sorted(f for f in os.listdir(CAPTURE_DIR) if f.endswith(".gbc")) if os.path.isdir(CAPTURE_DIR) else []
+    if not caps:
+        log(f"❌ no capture in {CAPTURE_DIR}")
+        sys.exit(1)
+    return os.path.join(CAPTURE_DIR, caps[-1])
+
+
+def export_cli(source: str, fmt: str, out: str, from_: str = None, to: str = None):
+    if source is None:
+        source = latest_capture()
+    from_ms, to_ms = parse_time_arg(from_), parse_time_arg(to)
+    if source.endswith(".sqlite"):
+        records = export_from_logstore(SqliteLogStore(source), from_ms, to_ms)
+    else:
+        records = export_from_capture(CaptureReader(source), from_ms, to_ms)
+    t0 = time.perf_counter()
+    total = 0
+    f = sys.stdout.buffer if out == "-" else open(out, "wb")
+    try:
+        for chunk in export_chunks(records, fmt):
+            f.write(chunk)
+            total += len(chunk)
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+    if out != "-":
+        log(f"✅ {source} -> {out} ({fmt}, {total} bytes, {time.perf_counter() - t0:.2f} s)")
+
+
+def _spark(series, width: int = 60) -> str:
+    if not series:
+        return ""
+    step = -(-len(series) // width)
+    vals = [max(series[i:i + step]) for i in range(0, len(series), step)]
+    top = max(vals) or 1
+    return "".join(" ▁▂▃▄▅▆▇█"[min(8, -(-v * 8 // top))] for v in vals)
+
+
+def analyze_cli(source: str = None, from_: str = None, to: str = None, bin_s: float = ANALYZE_RATE_BIN_S,
+                as_json: bool = False):
+    if np is None:
+        log("❌ numpy not installed (pip install numpy)")
+        sys.exit(1)
+    r = CaptureReader(source or latest_capture())
+    try:
+        rep = analyze_capture(r, parse_time_arg(from_), parse_time_arg(to), bin_s)
+    finally:
+        r.close()
+    if as_json:
+        print(json.dumps(rep, ensure_ascii=False))
+        return
+    log(f"{rep['path']}: {rep['records']} records, {rep.get('duration_s', 0)} s, {rep['distinct']} distinct frames"
+        + (f" ({rep['seconds']['load']} s load, {rep['seconds']['total']} s total)" if rep["records"] else ""))
+    if not rep["records"]:
+        return
+    print("kinds:   " + ", ".join(f"{k} {c}" for k, c in rep["kinds"].items()))
+    for d, types in rep["types"].items():
+        print(f"{d + ':':<10} " + ", ".join(f"{t} {c}" for t, c in types.items()))
+    h = rep["hits"]
+    print(f"\nhits: {h['total']}, score {h['score']}  " + "  ".join(f"{r} {c}" for r, c in h["rings"].items()))
+    if h["total"]:
+        print("  seg     SO     SI      D      T")
+        for seg, row in h["heatmap"].items():
+            if any(row):
+                print(f"  {seg:>3} " + "".join(f"{c:>7}" for c in row))
+    if rep["led_ops"]:
+        print("\nLED OPs: " + ", ".join(f"{op} {v['name'] or '?'} {v['count']}" for op, v in rep["led_ops"].items()))
+    if rep["led_hits"]:
+        print("  seg single double triple")
+        for seg, row in rep["led_hits"].items():
+            print(f"  {seg:>3} " + "".join(f"{c:>7}" for c in row))
+    print("\ninter-arrival         n       p50       p90       p99       max    jitter")
+    for name, st in rep["iat"].items():
+        if st["count"]:
+            print(f"  {name:<12} {st['count']:>8} " + "".join(f"{st[k]:>7.1f}ms" for k in
+                                                         ("p50_ms", "p90_ms", "p99_ms", "max_ms", "jitter_ms")))
+    print(f"\nrate ({bin_s:g} s bins)")
+    for d in CAPTURE_DIRS:
+        st = rep["rate"][d]
+        print(f"  {d:<11} peak {st['peak_fps']:>8} fps  mean {st['mean_fps']:>8} fps  {_spark(st['series'])}")
+
+
+def mine_cli(source: str = None, direction: str = "app->board", kinds=None, min_count: int = MINE_MIN_COUNT,
+             from_: str = None, to: str = None, as_json: bool = False, label_kinds=None):
+    if np is None:
+        log("❌ numpy not installed (pip install numpy)")
+        sys.exit(1)
+    source = source or latest_capture()
+    from_ms, to_ms = parse_time_arg(from_), parse_time_arg(to)
+    t0 = time.perf_counter()
+    if source.endswith(".sqlite"):
+        arr, notes = record_arrays(export_from_logstore(SqliteLogStore(source), from_ms, to_ms))
+    else:
+        r = CaptureReader(source)
+        try:
+            start = r.index_at_wall(from_ms * 1_000_000) if from_ms is not None else 0
+            stop = r.index_at_wall((to_ms + 1) * 1_000_000) if to_ms is not None else len(r)
+            arr = capture_arrays(r, start, stop, MINE_WIDTH)
+            notes = {n - start: c for n, c in r.comments().items() if start <= n < stop and c}
+        finally:
+            r.close()
+    groups = mine_bytes(arr, notes, direction, kinds, min_count, label_kinds)
+    if as_json:
+        print(json.dumps({"source": source, "dir": direction, "label_kinds": label_kinds or list(MINE_LABEL_KINDS),
+                          "groups": groups}, ensure_ascii=False))
+        return
+    log(f"{source}: {sum(g['count'] for g in groups)} {direction} frames in {len(groups)} groups "
+        f"(min {min_count}), {time.perf_counter() - t0:.2f} s")
+    for g in groups:
+        name = f"OP {g['op']:02X} {g['op_name'] or '?'}" if g["op"] is not None else ""
+        print(f"\n{g['len']:>3} B  {name:<28} n={g['count']}"
+              + (f"  commented {g['commented']}" if g["commented"] else "")
+              + ("  (truncated)" if g["truncated"] else ""))
+        # konstante Bytes als Hex, variable als '··'
+        print("     " + " ".join("··" if v is None else f"{v:02X}" for v in g["pattern"]))
+        for p in g["positions"]:
+            top = "  ".join(f"{v:02X} {share * 100:4.1f}%" for v, share in p["top"])
+            line = f"     [{p['pos']:>2}] {p['distinct']:>3} values  H {p['entropy']:5.2f} bit  top {top}"
+            if "comment_u" in p:
+                line += f"   U {p['comment_u']:.2f}"
+            if p.get("by_comment"):
+                line += "   " + ", ".join(f"{lab!r}→{v:02X}" for lab, v in list(p["by_comment"].items())[:6])
+            print(line)
+
+
+def import_cli(path: str, store: bool = True, notify_handle: int = None, write_handle: int = None,
+               acl_handle: int = None, board: str = None):
+    # Proxy sollte dabei nicht laufen (Journal/SQLite-Writer im selben Verzeichnis) -> sonst POST /api/import
+    logstore = None
+    if store:
+        ensure_data_dir()
+        logstore = open_logstore()
+    try:
+        st = import_btsnoop(path, store=logstore, notify_handle=notify_handle, write_handle=write_handle,
+                            acl_handle=acl_handle, board=board)
+    finally:
+        if hasattr(logstore, "close"):
+            logstore.close()
+    conn = st["board"] or ("ACL 0x%04X" % st["acl_handle"] if st["acl_handle"] is not None else "any")
+    log(f"📥 {path}: handles notify={st['notify_handle']} write={st['write_handle']} ({st.get('handles_from') or 'given'}), "
+        f"connection {conn}")
+    log(f"✅ {st['frames']} frames ({st['board->app']} board->app, {st['app->board']} app->board) of {st['att']} ATT PDUs, "
+        f"{st['logged']} logged, {st['seconds']} s -> {st['capture']}")
+    if st["truncated"]:
+        log(f"⚠️ {st['truncated']} truncated packets (filtered snoop log?)")
+
+
+def cli():
+    ap = argparse.ArgumentParser(description="GranBoard MITM Proxy + Web UI")
+    sub = ap.add_subparsers(dest="cmd")
+    sub.add_parser("run", help="Proxy + Web UI starten (Standard)")
+    p = sub.add_parser("loopback", help="Proxy + Web UI ohne Bluetooth (virtuelles GranBoard + App-Stand-in)")
+    p.add_argument("--hit-hz", type=float, default=LOOPBACK_HIT_HZ, help="Treffer pro Sekunde")
+    p.add_argument("--write-ms", type=float, default=LOOPBACK_WRITE_MS, help="simulierte GATT Write-Dauer")
+    p.add_argument("--link-fps", type=float, default=LOOPBACK_LINK_FPS, help="simulierter Link-Durchsatz (0 = unbegrenzt)")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Anteil zufälliger Write-Fehler")
+    p = sub.add_parser("bench-e2e", help="End-to-End Benchmark ohne Bluetooth (Loopback -> LogStore -> SSE)")
+    p.add_argument("-n", type=int, default=20000, help="Treffer und Writes (je n)")
+    p.add_argument("--hit-hz", type=float, default=0.0, help="Rate pro Richtung (0 = max)")
+    p.add_argument("--store", choices=["journal", "sqlite", "json"], default="journal")
+    p.add_argument("--write-ms", type=float, default=0.0, help="simulierte GATT Write-Dauer")
+    p.add_argument("--link-fps", type=float, default=0.0, help="simulierter Link-Durchsatz (0 = unbegrenzt)")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Anteil zufälliger Write-Fehler")
+    p.add_argument("--no-sse", action="store_true", help="ohne SSE-Client")
+    p = sub.add_parser("bench-hops", help="Thread-Hop Kosten messen (asyncio / GLib)")
+    p.add_argument("-n", type=int, default=20000, help="Anzahl Frames")
+    p = sub.add_parser("bench-reassembly", help="'@'-Reassembler mit zufällig fragmentierten Frames messen")
+    p.add_argument("-n", type=int, default=2_000_000, help="Anzahl Frames")
+    p.add_argument("--max-chunk", type=int, default=20, help="max. Notify-Größe in Bytes")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--rounds", type=int, default=3, help="Wiederholungen (bester Lauf zählt)")
+    p = sub.add_parser("export", help="Capture / SQLite-Log als jsonl, csv oder btsnoop (Wireshark) exportieren")
+    p.add_argument("source", nargs="?", default=None,
+                   help="cap-....gbc oder .sqlite (Standard: neuester Capture in ~/gb_mitm/capture)")
+    p.add_argument("-f", "--format", choices=list(EXPORT_FORMATS), default="jsonl")
+    p.add_argument("-o", "--out", default="-", help="Ausgabedatei ('-' = stdout)")
+    p.add_argument("--from", dest="from_", default=None, help="Unix ms oder ISO-Zeit")
+    p.add_argument("--to", default=None, help="Unix ms oder ISO-Zeit")
+    p = sub.add_parser("analyze", help="Capture auswerten: Heatmaps, Frame-Typen, Inter-Arrival, Raten (NumPy)")
+    p.add_argument("source", nargs="?", default=None, help="cap-....gbc (Standard: neuester Capture)")
+    p.add_argument("--from", dest="from_", default=None, help="Unix ms oder ISO-Zeit")
+    p.add_argument("--to", default=None, help="Unix ms oder ISO-Zeit")
+    p.add_argument("--bin-s", type=float, default=ANALYZE_RATE_BIN_S, help="Breite der Raten-Bins in s")
+    p.add_argument("--json", action="store_true", help="kompletter Report als JSON (inkl. Raten-Serien)")
+    p = sub.add_parser("mine-bytes", help="Byte-Varianz pro Frame-Gruppe (Länge + OP): Entropie, Werte, Kommentare")
+    p.add_argument("source", nargs="?", default=None, help="cap-....gbc oder .sqlite (Standard: neuester Capture)")
+    p.add_argument("--dir", choices=list(CAPTURE_DIRS), default="app->board")
+    p.add_argument("--kind", action="append", choices=list(CAPTURE_KINDS), default=None,
+                   help="nur diese Art(en), mehrfach möglich (Standard: alle)")
+    p.add_argument("--min-count", type=int, default=MINE_MIN_COUNT, help="kleinere Gruppen auslassen")
+    p.add_argument("--label-kind", action="append", choices=list(CAPTURE_KINDS), default=None,
+                   help="Kommentare dieser Art(en) als Label, auch automatische (Standard: ble/manual/import, "
+                        "ohne Sweep-/Animations-Kommentare)")
+    p.add_argument("--from", dest="from_", default=None, help="Unix ms oder ISO-Zeit")
+    p.add_argument("--to", default=None, help="Unix ms oder ISO-Zeit")
+    p.add_argument("--json", action="store_true")
+    p = sub.add_parser("import", help="Android btsnoop_hci.log importieren (Capture + LogStore, kind 'import')")
+    p.add_argument("file", help="btsnoop_hci.log")
+    p.add_argument("--no-store", action="store_true", help="nur Capture schreiben, nicht in den LogStore")
+    p.add_argument("--notify-handle", type=lambda v: int(v, 0), default=None, help="ATT Handle 442f1571 (sonst automatisch)")
+    p.add_argument("--write-handle", type=lambda v: int(v, 0), default=None, help="ATT Handle 442f1572 (sonst automatisch)")
+    p.add_argument("--acl-handle", type=lambda v: int(v, 0), default=None, help="nur diese HCI-Verbindung (sonst automatisch)")
+    p.add_argument("--board", default=None, help="nur die Verbindung zu dieser Adresse (sonst automatisch)")
+    p = sub.add_parser("capture", help="Binären Capture (.gbc) anzeigen / ab Record oder Zeit ausgeben")
+    p.add_argument("file", help="cap-....gbc")
+    p.add_argument("--from", dest="start", type=int, default=None, help="ab Record-Nummer (negativ = vom Ende)")
+    p.add_argument("--at", type=float, default=None, help="ab Sekunde x seit Capture-Beginn")
+    p.add_argument("-c", "--count", type=int, default=20, help="Anzahl Records")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        export_cli(args.source, args.format, args.out, args.from_, args.to)
+        return
+    if args.cmd == "analyze":
+        analyze_cli(args.source, args.from_, args.to, args.bin_s, args.json)
+        return
+    if args.cmd == "mine-bytes":
+        mine_cli(args.source, args.dir, args.kind, args.min_count, args.from_, args.to, args.json, args.label_kind)
+        return
+    if args.cmd == "import":
+        import_cli(args.file, not args.no_store, args.notify_handle, args.write_handle, args.acl_handle, args.board)
+        return
+    if args.cmd == "capture":
+        capture_cli(args.file, args.start, args.at, args.count)
+        return
+    if args.cmd == "loopback":
+        loopback(args.hit_hz, args.write_ms, args.link_fps, args.fail_rate)
+        return
+    if args.cmd == "bench-e2e":
+        bench_e2e(args.n, args.hit_hz, args.store, args.write_ms, sse=not args.no_sse, link_fps=args.link_fps,
+                  fail_rate=args.fail_rate)
+        return
+    if args.cmd == "bench-hops":
+        bench_hops(args.n)
+        return
+    if args.cmd == "bench-reassembly":
+        bench_reassembly(args.n, args.max_chunk, args.seed, args.rounds)
+        return
+    main()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file